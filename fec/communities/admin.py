@@ -14,6 +14,10 @@ class CommunityImageInline(TabularDynamicInlineAdmin):
 class CommunityFeedInline(TabularDynamicInlineAdmin):
     """An Inline Table Row representing a :class:`~.models.CommunityFeed`."""
     model = CommunityFeed
+    fields = ('url', 'post_limit', 'full_fetch_count', 'not_modified_count',
+              'failure_count', 'next_poll')
+    readonly_fields = ('full_fetch_count', 'not_modified_count',
+                       'failure_count', 'next_poll')
 
 
 def get_community_email(obj):
@@ -0,0 +1,606 @@
+"""This module downloads Community Feeds without touching the database.
+
+Downloads are conditional on a Feed's last ``ETag`` & ``Last-Modified``
+values and are limited by a wall-clock timeout, so many Feeds can safely be
+fetched in parallel by :func:`fetch_all`, which downloads each distinct URL
+only once.
+
+Feeds are parsed as they are read, so a download stops as soon as enough
+entries have been received & is abandoned if it grows past the
+``FEED_MAX_BYTES`` setting.
+
+The downloaded Feeds are then parsed by a :class:`ParserPool`, in separate
+processes with limited time, CPU time & memory, so a pathological Feed can
+never pin or bloat the process that fetched it.
+
+"""
+from collections import namedtuple, OrderedDict
+from datetime import datetime
+import httplib
+import itertools
+import multiprocessing
+from multiprocessing.pool import ThreadPool
+import os
+import re
+import resource
+import signal
+import socket
+import threading
+import time
+import urllib2
+import urlparse
+from xml.parsers import expat
+
+from django.conf import settings
+import feedparser
+
+
+class FeedResponse(namedtuple('FeedResponse', ['status', 'headers', 'body'])):
+    """The status code, headers & body returned by a Feed's URL."""
+    __slots__ = ()
+
+
+class FeedPost(namedtuple('FeedPost', [
+        'title', 'published', 'author', 'description', 'link', 'comments',
+        'slash_comments', 'via', 'community_id'])):
+    """A compact ``feed post``, made from a Feed's entry or a BlogPost.
+
+    Only the values shown by the templates are kept, so lists of posts are
+    cheap to cache. ``published`` is a naive UTC datetime.
+
+    """
+    __slots__ = ()
+
+
+class ParsedFeed(namedtuple('ParsedFeed', [
+        'status', 'etag', 'modified', 'posts'])):
+    """The compact result of parsing a Feed.
+
+    ``posts`` is a tuple of ``(guid, post)`` pairs, where ``post`` is a
+    :class:`FeedPost` without a ``community_id``.
+
+    """
+    __slots__ = ()
+
+
+READ_CHUNK_SIZE = 16 * 1024
+
+
+class EntryCounter(object):
+    """Count the complete entries of a Feed as it's downloaded.
+
+    Chunks of the Feed are passed to :meth:`feed` until it returns
+    :obj:`True`, after which :meth:`truncate` cuts the Feed off after the
+    last wanted entry & closes any open elements, leaving a well-formed
+    document for :mod:`feedparser`.
+
+    Feeds that :mod:`xml.parsers.expat` can not parse are never truncated.
+
+    .. attribute:: max_entries
+
+        The number of entries to read before stopping.
+
+    .. attribute:: failed
+
+        Whether the Feed could not be parsed.
+
+    """
+    ENTRY_TAGS = ('item', 'entry')
+
+    class _Done(Exception):
+        pass
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.failed = False
+        self.count = 0
+        self._open_tags = []
+        self._cut_index = None
+        self._parser = expat.ParserCreate()
+        self._parser.StartElementHandler = self._start
+        self._parser.EndElementHandler = self._end
+
+    @property
+    def done(self):
+        """Whether :attr:`max_entries` complete entries have been read."""
+        return self._cut_index is not None
+
+    def feed(self, chunk):
+        """Parse the next chunk of the Feed.
+
+        :returns: Whether enough entries have been read.
+        :rtype: bool
+
+        """
+        if self.done or self.failed:
+            return self.done
+        try:
+            self._parser.Parse(chunk, False)
+        except self._Done:
+            pass
+        except expat.ExpatError:
+            self.failed = True
+        return self.done
+
+    def truncate(self, body):
+        """Cut the Feed's body off after the last wanted entry.
+
+        :param body: Everything passed to :meth:`feed`.
+        :type body: string
+        :returns: The body, truncated if enough entries were read.
+        :rtype: string
+
+        """
+        if not self.done:
+            return body
+        end = body.index('>', self._cut_index) + 1
+        return body[:end] + ''.join(
+            '</{}>'.format(tag) for tag in reversed(self._open_tags))
+
+    def _start(self, name, attributes):
+        self._open_tags.append(name)
+
+    def _end(self, name):
+        self._open_tags.pop()
+        if name.rsplit(':', 1)[-1] not in self.ENTRY_TAGS:
+            return
+        self.count += 1
+        if self.count >= self.max_entries:
+            self._cut_index = self._parser.CurrentByteIndex
+            raise self._Done
+
+
+class FeedError(Exception):
+    """Raised when a Community Feed can not be fetched or parsed."""
+
+
+def download(url, etag='', modified='', timeout=None, max_entries=None):
+    """Download a Feed, sending the conditional request headers if given.
+
+    :param url: The URL of the Feed.
+    :type url: string
+    :param etag: The ``ETag`` of the last full response.
+    :type etag: string
+    :param modified: The ``Last-Modified`` value of the last full response.
+    :type modified: string
+    :param timeout: The number of seconds the entire download may take.
+                    Defaults to the ``FEED_FETCH_TIMEOUT`` setting. The
+                    socket is shut down once it is reached, so a server that
+                    trickles the body can't hold the download open.
+    :type timeout: float
+    :param max_entries: Stop downloading after this many entries, returning
+                        a Feed truncated to them.
+    :type max_entries: int
+    :raises: :class:`FeedError` if the Feed could not be downloaded in time
+             or is larger than the ``FEED_MAX_BYTES`` setting.
+    :returns: A :class:`FeedResponse`, with a ``304`` status and no body if
+              the Feed was not modified.
+
+    """
+    if timeout is None:
+        timeout = settings.FEED_FETCH_TIMEOUT
+    deadline = time.time() + timeout
+    request = urllib2.Request(url, headers={
+        'User-Agent': feedparser.USER_AGENT,
+        'Accept': feedparser.ACCEPT_HEADER,
+    })
+    if etag:
+        request.add_header('If-None-Match', etag)
+    if modified:
+        request.add_header('If-Modified-Since', modified)
+    try:
+        response = urllib2.urlopen(request, timeout=timeout)
+        watchdog = threading.Timer(max(deadline - time.time(), 0),
+                                   _shutdown_socket, [response])
+        watchdog.daemon = True
+        watchdog.start()
+        try:
+            body = _read_body(response, url, deadline, max_entries)
+        finally:
+            watchdog.cancel()
+            response.close()
+    except urllib2.HTTPError as error:
+        if error.code == 304:
+            return FeedResponse(304, dict(error.info()), '')
+        raise FeedError('Could not fetch the Feed at {}: HTTP {}'.format(
+            url, error.code))
+    except (urllib2.URLError, httplib.HTTPException, socket.error) as error:
+        raise FeedError('Could not fetch the Feed at {}: {}'.format(
+            url, error))
+    return FeedResponse(response.getcode() or 200, dict(response.info()),
+                        body)
+
+
+def _shutdown_socket(response):
+    """Shut down the socket of a :mod:`urllib2` response.
+
+    This makes a read that is blocked on the socket return, even when the
+    server keeps sending a byte before each socket timeout.
+
+    """
+    try:
+        response.fp._sock.fp._sock.shutdown(socket.SHUT_RDWR)
+    except (AttributeError, socket.error):
+        pass
+
+
+def _read_body(response, url, deadline, max_entries):
+    """Read a Feed until it ends, or until ``max_entries`` have been read."""
+    counter = EntryCounter(max_entries) if max_entries else None
+    chunks = []
+    size = 0
+    while True:
+        try:
+            chunk = response.read(READ_CHUNK_SIZE)
+        except (httplib.HTTPException, socket.error):
+            if time.time() < deadline:
+                raise
+            chunk = ''
+        if time.time() > deadline:
+            raise FeedError('Timed out reading the Feed at {}'.format(url))
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > settings.FEED_MAX_BYTES:
+            raise FeedError('The Feed at {} is larger than {} bytes'.format(
+                url, settings.FEED_MAX_BYTES))
+        chunks.append(chunk)
+        if counter is not None and counter.feed(chunk):
+            break
+    body = ''.join(chunks)
+    if counter is not None:
+        body = counter.truncate(body)
+    return body
+
+
+def parse(response):
+    """Parse the body of a :class:`FeedResponse` with :mod:`feedparser`.
+
+    The response's ``ETag`` & ``Last-Modified`` headers are set as the
+    ``etag`` & ``modified`` values of the result.
+
+    :mod:`feedparser` catches the exceptions raised while it parses & stores
+    them as the ``bozo_exception``, so running out of memory or reaching a
+    :class:`ParserPool` limit is raised again from there.
+
+    :param response: The downloaded Feed.
+    :type response: :class:`FeedResponse`
+    :raises: :class:`MemoryError` if :mod:`feedparser` ran out of memory, or
+             ``_LimitExceeded`` if it reached a time limit.
+    :returns: The parsed Feed.
+    :rtype: :class:`feedparser.FeedParserDict`
+
+    """
+    parsed_feed = feedparser.parse(response.body,
+                                   response_headers=response.headers)
+    if isinstance(parsed_feed.get('bozo_exception'),
+                  (MemoryError, _LimitExceeded)):
+        raise parsed_feed.bozo_exception
+    parsed_feed['status'] = response.status
+    parsed_feed['etag'] = response.headers.get('etag', '')
+    parsed_feed['modified'] = response.headers.get('last-modified', '')
+    return parsed_feed
+
+
+def get_posts(parsed_feed, url, post_limit=None):
+    """Return the normalized posts of a parsed Feed, newest first.
+
+    Posts without a date are skipped.
+
+    :param parsed_feed: The result of :func:`parse`.
+    :type parsed_feed: :class:`feedparser.FeedParserDict`
+    :param url: The URL of the Feed, for error messages.
+    :type url: string
+    :param post_limit: The maximum number of posts to return.
+    :type post_limit: int
+    :raises: :class:`FeedError` if the Feed could not be parsed.
+    :returns: A list of ``(guid, post)`` tuples, where ``post`` is a
+              :class:`FeedPost` without a ``community_id``.
+
+    """
+    if (parsed_feed.get('status', 200) >= 400 or
+            parsed_feed.bozo and not parsed_feed.entries):
+        raise FeedError('Could not parse the Feed at {}: {}'.format(
+            url, parsed_feed.get('bozo_exception',
+                                 parsed_feed.get('status'))))
+    via = re.sub(r'^(http(s)?://)?(www.)?(.*)$', r'\4',
+                 parsed_feed.feed.get('link', ''))
+    posts = []
+    for entry in parsed_feed.entries:
+        published_parsed = (entry.get('published_parsed') or
+                            entry.get('updated_parsed'))
+        if published_parsed is None:
+            continue
+        guid = entry.get('id') or entry.get('link') or entry.get('title', '')
+        posts.append((guid, FeedPost(
+            title=entry.get('title', ''),
+            published=datetime(*published_parsed[:6]),
+            author=entry.get('author', ''),
+            description=entry.get('description', ''),
+            link=entry.get('link', ''),
+            comments=entry.get('comments', ''),
+            slash_comments=entry.get('slash_comments', ''),
+            via=via,
+            community_id=None,
+        )))
+    if post_limit is not None:
+        return posts[:post_limit]
+    return posts
+
+
+def parse_posts(response, url, max_entries=None):
+    """Parse a :class:`FeedResponse` into a compact :class:`ParsedFeed`.
+
+    This runs :mod:`feedparser` in the current process, use
+    :meth:`ParserPool.parse` to parse untrusted Feeds.
+
+    :param response: The downloaded Feed.
+    :type response: :class:`FeedResponse`
+    :param url: The URL of the Feed, for error messages.
+    :type url: string
+    :param max_entries: The maximum number of posts to keep.
+    :type max_entries: int
+    :raises: :class:`FeedError` if the Feed could not be parsed.
+    :rtype: :class:`ParsedFeed`
+
+    """
+    parsed_feed = parse(response)
+    return ParsedFeed(
+        status=parsed_feed['status'], etag=parsed_feed['etag'],
+        modified=parsed_feed['modified'],
+        posts=tuple(get_posts(parsed_feed, url, max_entries)))
+
+
+class ParserPool(object):
+    """A pool of processes that parse Feeds with limited resources.
+
+    Each Feed may take at most ``timeout`` seconds & ``cpu_time`` seconds
+    of CPU time to parse, and may grow it's process by at most ``memory``
+    bytes. Feeds that exceed a limit raise a :class:`FeedError`. If a
+    worker process stops responding entirely, only that worker is killed &
+    the pool starts a new one, so the Feeds being parsed by the other
+    workers are not affected.
+
+    The pool should be created before any other threads are started, since
+    it forks the worker processes, and closed after use. It can be used as a
+    context manager to do this.
+
+    .. attribute:: timeout
+
+        The number of seconds each Feed may take to parse. Defaults to the
+        ``FEED_PARSE_TIMEOUT`` setting.
+
+    .. attribute:: cpu_time
+
+        The number of seconds of CPU time each Feed may use. Defaults to
+        the ``FEED_PARSE_CPU_TIME`` setting.
+
+    .. attribute:: memory
+
+        The number of bytes each worker process may grow by. Defaults to
+        the ``FEED_PARSE_MEMORY`` setting.
+
+    """
+    def __init__(self, processes=None, timeout=None, cpu_time=None,
+                 memory=None):
+        """Start the worker processes.
+
+        :param processes: The number of worker processes. Defaults to the
+                          ``FEED_PARSE_PROCESSES`` setting.
+        :type processes: int
+
+        """
+        if processes is None:
+            processes = settings.FEED_PARSE_PROCESSES
+        self.processes = processes
+        self.timeout = (settings.FEED_PARSE_TIMEOUT if timeout is None
+                        else timeout)
+        self.cpu_time = (settings.FEED_PARSE_CPU_TIME if cpu_time is None
+                         else cpu_time)
+        self.memory = (settings.FEED_PARSE_MEMORY if memory is None
+                       else memory)
+        self._job_ids = itertools.count()
+        self._manager = multiprocessing.Manager()
+        self._worker_pids = self._manager.dict()
+        self._pool = multiprocessing.Pool(self.processes, _limit_memory,
+                                          (self.memory,))
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def parse(self, response, url, max_entries=None):
+        """Parse a Feed in a worker process, like :func:`parse_posts`.
+
+        This is safe to call from multiple threads at once.
+
+        :raises: :class:`FeedError` if the Feed could not be parsed within
+                 the limits.
+        :rtype: :class:`ParsedFeed`
+
+        """
+        job_id = next(self._job_ids)
+        result = self._pool.apply_async(
+            _parse_limited,
+            (response, url, max_entries, self.timeout, self.cpu_time,
+             self._worker_pids, job_id))
+        try:
+            return result.get(self.timeout + 1)
+        except multiprocessing.TimeoutError:
+            self._kill_worker(job_id)
+            raise FeedError('Timed out parsing the Feed at {}'.format(url))
+        except MemoryError:
+            raise FeedError('Ran out of memory parsing the Feed at {}'.format(
+                url))
+
+    def close(self):
+        """Stop the worker processes."""
+        self._pool.terminate()
+        self._pool.join()
+        self._manager.shutdown()
+
+    def _kill_worker(self, job_id):
+        """Kill the unresponsive worker that is parsing a job, if any."""
+        pid = self._worker_pids.pop(job_id, None)
+        if pid is None:
+            return
+        try:
+            os.kill(pid, signal.SIGKILL)
+        except OSError:
+            pass
+
+
+class _LimitExceeded(Exception):
+    pass
+
+
+def _raise_limit_exceeded(signal_number, frame):
+    raise _LimitExceeded(signal_number)
+
+
+def _limit_memory(memory):
+    """Limit the address space of a worker process to it's size + memory.
+
+    This also makes the worker raise an exception when a CPU time or wall
+    clock limit is reached.
+
+    """
+    signal.signal(signal.SIGALRM, _raise_limit_exceeded)
+    signal.signal(signal.SIGXCPU, _raise_limit_exceeded)
+    try:
+        with open('/proc/self/statm') as statm:
+            size = int(statm.read().split()[0]) * resource.getpagesize()
+    except (IOError, ValueError):
+        return
+    _set_soft_limit(resource.RLIMIT_AS, size + memory)
+
+
+def _set_soft_limit(limit, value):
+    """Set a soft resource limit, without exceeding the hard limit."""
+    hard = resource.getrlimit(limit)[1]
+    if hard != resource.RLIM_INFINITY:
+        value = min(value, hard)
+    resource.setrlimit(limit, (value, hard))
+
+
+def _parse_limited(response, url, max_entries, timeout, cpu_time,
+                   worker_pids, job_id):
+    """Run :func:`parse_posts` in a worker process, within the limits.
+
+    The worker's pid is stored in ``worker_pids`` under the ``job_id`` while
+    it parses, so the :class:`ParserPool` can kill it if it stops
+    responding.
+
+    """
+    worker_pids[job_id] = os.getpid()
+    try:
+        return _parse_within_limits(response, url, max_entries, timeout,
+                                    cpu_time)
+    finally:
+        worker_pids.pop(job_id, None)
+
+
+def _parse_within_limits(response, url, max_entries, timeout, cpu_time):
+    """Run :func:`parse_posts`, raising a :class:`FeedError` at a limit."""
+    usage = resource.getrusage(resource.RUSAGE_SELF)
+    _set_soft_limit(resource.RLIMIT_CPU,
+                    int(usage.ru_utime + usage.ru_stime + cpu_time) + 1)
+    signal.setitimer(signal.ITIMER_REAL, timeout)
+    try:
+        return parse_posts(response, url, max_entries)
+    except _LimitExceeded as error:
+        reason = ('CPU time' if error.args[0] == signal.SIGXCPU
+                  else 'time')
+        raise FeedError('Ran out of {} parsing the Feed at {}'.format(
+            reason, url))
+    except MemoryError:
+        raise FeedError('Ran out of memory parsing the Feed at {}'.format(
+            url))
+    finally:
+        signal.setitimer(signal.ITIMER_REAL, 0)
+
+
+def normalize_url(url):
+    """Return a canonical form of a Feed's URL, for finding duplicates.
+
+    The scheme & host are lowercased, default ports and fragments are
+    removed and an empty path becomes ``/``.
+
+    :param url: The URL to normalize.
+    :type url: string
+    :returns: The normalized URL.
+    :rtype: string
+
+    """
+    scheme, netloc, path, query, _ = urlparse.urlsplit(url.strip())
+    scheme, netloc = scheme.lower(), netloc.lower()
+    default_port = {'http': ':80', 'https': ':443'}.get(scheme)
+    if default_port and netloc.endswith(default_port):
+        netloc = netloc[:-len(default_port)]
+    return urlparse.urlunsplit((scheme, netloc, path or '/', query, ''))
+
+
+def fetch_all(feeds, workers=None, timeout=None):
+    """Download many Feeds in parallel using a pool of threads.
+
+    The Feeds are parsed by a :class:`ParserPool`.
+
+    Feeds with the same :func:`normalized <normalize_url>` URL are only
+    downloaded & parsed once, and every one of them gets the result. The
+    request is only conditional if all of them have the same ``etag`` and
+    ``modified`` values.
+
+    The Feeds' :meth:`~communities.models.CommunityFeed.fetch` methods are
+    called in the worker threads, so they must not access the database.
+
+    :param feeds: The Feeds to fetch.
+    :type feeds: A list of :class:`~communities.models.CommunityFeed`
+    :param workers: The maximum number of simultaneous downloads. Defaults
+                    to the ``FEED_FETCH_WORKERS`` setting.
+    :type workers: int
+    :param timeout: The number of seconds each Feed may take. Defaults to
+                    the ``FEED_FETCH_TIMEOUT`` setting.
+    :type timeout: float
+    :returns: A list of ``(feed, parsed_feed, error, response_time)`` tuples
+              in the order of the ``feeds``. ``parsed_feed`` is a
+              :class:`ParsedFeed`, or :obj:`None` if the Feed was not
+              modified or the :class:`FeedError` ``error`` was raised.
+              ``response_time`` is the number of seconds the fetch took.
+
+    """
+    if workers is None:
+        workers = settings.FEED_FETCH_WORKERS
+    if not feeds:
+        return []
+    feeds_by_url = OrderedDict()
+    for feed in feeds:
+        feeds_by_url.setdefault(normalize_url(feed.url), []).append(feed)
+    groups = feeds_by_url.values()
+    with ParserPool() as parser:
+        pool = ThreadPool(max(1, min(workers, len(groups))))
+        try:
+            fetched = pool.map(
+                lambda group: _fetch_one(group, timeout, parser), groups)
+        finally:
+            pool.close()
+            pool.join()
+    results = dict((feed, result) for group, result in zip(groups, fetched)
+                   for feed in group)
+    return [(feed,) + results[feed] for feed in feeds]
+
+
+def _fetch_one(feeds, timeout, parser):
+    """Fetch Feeds sharing a URL, returning any FeedError instead."""
+    conditional = len(set((feed.etag, feed.modified) for feed in feeds)) == 1
+    max_entries = max(feed.max_entries for feed in feeds)
+    start = time.time()
+    try:
+        parsed_feed = feeds[0].fetch(parser, timeout=timeout,
+                                     conditional=conditional,
+                                     max_entries=max_entries)
+        error = None
+    except FeedError as fetch_error:
+        parsed_feed, error = None, fetch_error
+    return (parsed_feed, error, time.time() - start)
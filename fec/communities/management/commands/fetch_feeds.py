@@ -0,0 +1,69 @@
+"""Fetch every CommunityFeed and store it's newest posts as FeedEntries.
+
+This should be run regularly(e.g., from a cronjob) so that rendering a
+Community's Latest Updates never has to wait on a remote Feed.
+
+Only Feeds that are due are fetched, so it is safe to run this often. Runs
+may also overlap, since each Feed's row is locked while it's entries are
+stored. Busy Feeds are polled more often than quiet ones, and Feeds that keep
+failing are skipped until their back off expires.
+
+The Feeds are downloaded in parallel, so a run takes about as long as the
+slowest Feed instead of the sum of them all. They are parsed in separate
+processes with limited resources, so a pathological Feed only fails itself.
+
+"""
+from django.core.management.base import BaseCommand
+
+from communities.feeds import FeedError, fetch_all
+from communities.models import CommunityFeed
+
+
+class Command(BaseCommand):
+    '''Fetch the Feeds.'''
+    help = 'Fetch all Community Feeds and store their newest entries'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true', dest='all', default=False,
+            help='Fetch every Feed, even those that are not due yet.')
+        parser.add_argument(
+            '--workers', type=int, default=None,
+            help='The number of Feeds to download at once. Defaults to the '
+            'FEED_FETCH_WORKERS setting.')
+        parser.add_argument(
+            '--timeout', type=float, default=None,
+            help='The number of seconds to wait for each Feed. Defaults to '
+            'the FEED_FETCH_TIMEOUT setting.')
+
+    def handle(self, *args, **options):
+        verbosity = int(options.get('verbosity', 1))
+        updated = not_modified = failed = 0
+        feeds = CommunityFeed.objects.all()
+        if not options.get('all'):
+            feeds = feeds.due()
+        fetched = fetch_all(list(feeds), workers=options.get('workers'),
+                            timeout=options.get('timeout'))
+        for feed, parsed_feed, error, response_time in fetched:
+            try:
+                if error is not None:
+                    raise error
+                created_count = feed.store_entries(parsed_feed)
+            except FeedError as error:
+                failed += 1
+                feed.record_failure(response_time)
+                self.stderr.write(str(error))
+                continue
+            feed.record_success(created_count, response_time)
+            if created_count is None:
+                not_modified += 1
+                message = '{}: not modified'.format(feed.url)
+            else:
+                updated += 1
+                message = '{}: {} new entries'.format(feed.url, created_count)
+            if verbosity > 1:
+                self.stdout.write(message)
+        if verbosity > 0:
+            self.stdout.write(
+                '{} updated, {} not modified, {} failed'.format(
+                    updated, not_modified, failed))
@@ -0,0 +1,49 @@
+"""Generate the missing thumbnails of every Community image.
+
+Thumbnails are generated when an image is saved, so this only needs to be
+run after the thumbnails are first precomputed, or after the media directory
+is restored or wiped. The images are resized in a pool of processes.
+
+"""
+from multiprocessing import Pool
+
+from django.core.management.base import BaseCommand
+
+from communities.models import Community, CommunityImage
+from communities.thumbnails import (GALLERY_IMAGE_SIZES, PROFILE_IMAGE_SIZES,
+                                    generate_thumbnails)
+
+
+class Command(BaseCommand):
+    '''Generate the thumbnails.'''
+    help = 'Generate the missing thumbnails of Community & Gallery images'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--processes', type=int, default=None,
+            help='The number of images to resize at once. Defaults to the '
+            'number of CPUs.')
+
+    def handle(self, *args, **options):
+        tasks = [
+            (profile_image, PROFILE_IMAGE_SIZES) for profile_image in
+            Community.objects.exclude(profile_image='').values_list(
+                'profile_image', flat=True)
+        ] + [
+            (image, GALLERY_IMAGE_SIZES) for image in
+            CommunityImage.objects.values_list('file', flat=True)
+        ]
+        pool = Pool(options.get('processes'))
+        try:
+            generated = sum(pool.imap_unordered(_generate, tasks))
+        finally:
+            pool.close()
+            pool.join()
+        if int(options.get('verbosity', 1)) > 0:
+            self.stdout.write('{} thumbnails generated for {} images'.format(
+                generated, len(tasks)))
+
+
+def _generate(task):
+    """Generate the thumbnails of an image in a worker process."""
+    return generate_thumbnails(*task)
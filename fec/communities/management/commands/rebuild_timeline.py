@@ -0,0 +1,20 @@
+"""Rebuild the federation-wide timeline of Latest Updates.
+
+The timeline is kept up to date as BlogPosts & FeedEntries are saved, so this
+only needs to be run once, after the timeline is first installed.
+
+"""
+from django.core.management.base import BaseCommand
+
+from communities.models import TimelinePost
+
+
+class Command(BaseCommand):
+    '''Rebuild the timeline.'''
+    help = 'Rebuild the Latest Updates timeline from all Blog & Feed posts'
+
+    def handle(self, *args, **options):
+        TimelinePost.objects.rebuild()
+        if int(options.get('verbosity', 1)) > 0:
+            self.stdout.write('{} posts in the timeline'.format(
+                TimelinePost.objects.filter(is_canonical=True).count()))
@@ -0,0 +1,39 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communities', '0002_auto_20150917_0038'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FeedEntry',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('guid', models.CharField(max_length=2000)),
+                ('title', models.CharField(max_length=500, blank=True)),
+                ('link', models.URLField(max_length=2000, blank=True)),
+                ('author', models.CharField(max_length=200, blank=True)),
+                ('description', models.TextField(blank=True)),
+                ('published', models.DateTimeField(db_index=True)),
+                ('comments', models.URLField(max_length=2000, blank=True)),
+                ('slash_comments', models.CharField(max_length=20, blank=True)),
+                ('via', models.CharField(max_length=200, blank=True)),
+                ('feed', models.ForeignKey(related_name='entries', to='communities.CommunityFeed')),
+            ],
+            options={
+                'ordering': ['-published'],
+                'verbose_name': 'Feed Entry',
+                'verbose_name_plural': 'Feed Entries',
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='feedentry',
+            unique_together=set([('feed', 'guid')]),
+        ),
+    ]
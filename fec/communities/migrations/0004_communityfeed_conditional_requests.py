@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communities', '0003_feedentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='communityfeed',
+            name='etag',
+            field=models.CharField(max_length=200, editable=False, blank=True),
+        ),
+        migrations.AddField(
+            model_name='communityfeed',
+            name='full_fetch_count',
+            field=models.PositiveIntegerField(default=0, verbose_name=b'Full Fetches', editable=False),
+        ),
+        migrations.AddField(
+            model_name='communityfeed',
+            name='modified',
+            field=models.CharField(max_length=100, editable=False, blank=True),
+        ),
+        migrations.AddField(
+            model_name='communityfeed',
+            name='not_modified_count',
+            field=models.PositiveIntegerField(default=0, verbose_name=b'Not Modified Fetches', editable=False),
+        ),
+    ]
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('communities', '0004_communityfeed_conditional_requests'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='communityfeed',
+            name='average_response_time',
+            field=models.FloatField(null=True, editable=False, blank=True),
+        ),
+        migrations.AddField(
+            model_name='communityfeed',
+            name='failure_count',
+            field=models.PositiveSmallIntegerField(default=0, verbose_name=b'Failed Fetches', editable=False),
+        ),
+        migrations.AddField(
+            model_name='communityfeed',
+            name='next_poll',
+            field=models.DateTimeField(db_index=True, null=True, editable=False, blank=True),
+        ),
+        migrations.AddField(
+            model_name='communityfeed',
+            name='poll_interval',
+            field=models.PositiveIntegerField(default=3600, editable=False),
+        ),
+    ]
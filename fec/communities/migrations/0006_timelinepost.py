@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import defaultdict
+import hashlib
+import re
+
+from django.core.urlresolvers import reverse
+from django.db import migrations, models
+
+
+MEMBER = 'member'
+
+
+def get_dedupe_key(title, link):
+    """Hash the normalized title, or the link if there is no title."""
+    normalized = ' '.join(
+        re.sub(r'[^\w\s]', '', title.lower(), flags=re.UNICODE).split())
+    return hashlib.sha1((normalized or link).encode('utf-8')).hexdigest()
+
+
+def get_blog_post_url(blog_post):
+    """Return the URL of a BlogPost, like ``BlogPost.get_absolute_url``."""
+    from mezzanine.conf import settings
+    url_name = 'blog_post_detail'
+    kwargs = {'slug': blog_post.slug}
+    date_parts = ('year', 'month', 'day')
+    if settings.BLOG_URLS_DATE_FORMAT in date_parts:
+        url_name = 'blog_post_detail_%s' % settings.BLOG_URLS_DATE_FORMAT
+        for date_part in date_parts:
+            kwargs[date_part] = '%02d' % getattr(
+                blog_post.publish_date, date_part)
+            if date_part == settings.BLOG_URLS_DATE_FORMAT:
+                break
+    return reverse(url_name, kwargs=kwargs)
+
+
+def build_timeline(apps, schema_editor):
+    """Add the existing BlogPosts & FeedEntries to the timeline."""
+    Community = apps.get_model('communities', 'Community')
+    BlogPost = apps.get_model('blog', 'BlogPost')
+    FeedEntry = apps.get_model('communities', 'FeedEntry')
+    TimelinePost = apps.get_model('communities', 'TimelinePost')
+    communities_by_category = defaultdict(list)
+    for community in Community.objects.exclude(blog_category=None):
+        communities_by_category[community.blog_category_id].append(community)
+    posts = []
+    blog_posts = BlogPost.objects.filter(
+        status=2, categories__in=list(communities_by_category),
+    ).exclude(publish_date=None).select_related('user').distinct()
+    for blog_post in blog_posts:
+        communities = sorted(set(
+            community
+            for category_id in blog_post.categories.values_list(
+                'id', flat=True)
+            for community in communities_by_category[category_id]),
+            key=lambda community: (community.title, community.id))
+        link = get_blog_post_url(blog_post)
+        author = u'{} {}'.format(blog_post.user.first_name,
+                                 blog_post.user.last_name).strip()
+        for community in communities:
+            posts.append(TimelinePost(
+                community=community, blog_post=blog_post,
+                is_member=community.membership_status == MEMBER,
+                published=blog_post.publish_date,
+                dedupe_key=get_dedupe_key(blog_post.title, link),
+                title=blog_post.title[:500], link=link[:2000],
+                author=author[:200]))
+    for entry in FeedEntry.objects.select_related('feed__community'):
+        community = entry.feed.community
+        posts.append(TimelinePost(
+            community=community, feed_entry=entry,
+            is_member=community.membership_status == MEMBER,
+            published=entry.published,
+            dedupe_key=get_dedupe_key(entry.title, entry.link),
+            title=entry.title[:500], link=entry.link[:2000],
+            author=entry.author[:200], via=entry.via[:200]))
+    TimelinePost.objects.bulk_create(posts, batch_size=500)
+    canonical_ids = {}
+    for post_id, dedupe_key in TimelinePost.objects.order_by(
+            'dedupe_key', '-is_member', 'id').values_list('id', 'dedupe_key'):
+        canonical_ids.setdefault(dedupe_key, post_id)
+    ids = list(canonical_ids.values())
+    for start in range(0, len(ids), 500):
+        TimelinePost.objects.filter(id__in=ids[start:start + 500]).update(
+            is_canonical=True)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0002_auto_20150527_1555'),
+        ('conf', '0001_initial'),
+        ('communities', '0005_communityfeed_scheduling'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TimelinePost',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('dedupe_key', models.CharField(max_length=40, db_index=True)),
+                ('is_member', models.BooleanField(default=False)),
+                ('is_canonical', models.BooleanField(default=False)),
+                ('title', models.CharField(max_length=500, blank=True)),
+                ('link', models.URLField(max_length=2000, blank=True)),
+                ('author', models.CharField(max_length=200, blank=True)),
+                ('via', models.CharField(max_length=200, blank=True)),
+                ('published', models.DateTimeField()),
+                ('blog_post', models.ForeignKey(related_name='timeline_posts', blank=True, to='blog.BlogPost', null=True)),
+                ('community', models.ForeignKey(related_name='timeline_posts', to='communities.Community')),
+                ('feed_entry', models.OneToOneField(related_name='timeline_post', null=True, blank=True, to='communities.FeedEntry')),
+            ],
+            options={
+                'ordering': ['-published'],
+            },
+        ),
+        migrations.AlterIndexTogether(
+            name='timelinepost',
+            index_together=set([('is_canonical', 'published')]),
+        ),
+        migrations.RunPython(build_timeline, migrations.RunPython.noop),
+    ]
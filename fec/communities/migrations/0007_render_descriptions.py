@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+from django.utils.html import strip_tags
+from mezzanine.core.fields import RichTextField
+from mezzanine.core.templatetags.mezzanine_tags import richtext_filters
+
+
+def render_description(html):
+    """Sanitize & filter a description, like the model's function did when
+    this migration was written."""
+    html = richtext_filters(RichTextField().clean(html or '', None)).strip()
+    if not strip_tags(html).strip() and '<img' not in html:
+        return ''
+    return html
+
+
+def render_descriptions(apps, schema_editor):
+    """Store the existing FeedEntry & Community BlogPost descriptions
+    rendered.
+
+    Only the BlogPosts in a Community's ``blog_category`` are changed. The
+    reverse is a noop, since the rendered descriptions are valid input for
+    templates that filter them again.
+
+    """
+    FeedEntry = apps.get_model('communities', 'FeedEntry')
+    BlogPost = apps.get_model('blog', 'BlogPost')
+    Community = apps.get_model('communities', 'Community')
+    blog_posts = BlogPost.objects.filter(
+        categories__in=Community.objects.values('blog_category')).distinct()
+    for model_objects in (FeedEntry.objects.all(), blog_posts):
+        for pk, description in model_objects.values_list('pk', 'description'):
+            rendered = render_description(description)
+            if rendered != description:
+                model_objects.model.objects.filter(pk=pk).update(
+                    description=rendered)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0002_auto_20150527_1555'),
+        ('conf', '0001_initial'),
+        ('communities', '0006_timelinepost'),
+    ]
+
+    operations = [
+        migrations.RunPython(render_descriptions, migrations.RunPython.noop),
+    ]
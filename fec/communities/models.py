@@ -1,19 +1,36 @@
 """This module contains data models related to Communities."""
-from datetime import datetime
+from collections import Counter, namedtuple
+from datetime import timedelta
+import hashlib
+import heapq
+from itertools import chain
 import re
 from string import punctuation
-from time import mktime
 
+from django.conf import settings
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
-from django.db import models
+from django.db import models, transaction
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.template.loader import render_to_string
+from django.utils import timezone
 from django.utils.encoding import force_text
-import feedparser
-from mezzanine.blog.models import BlogCategory
+from django.utils.html import strip_tags
+from django.utils.safestring import mark_safe
+from django.utils.text import Truncator
+from mezzanine.blog.models import BlogCategory, BlogPost
 from mezzanine.core.models import (Displayable, Orderable,
                                    CONTENT_STATUS_PUBLISHED)
 from mezzanine.core.fields import RichTextField, FileField
+from mezzanine.core.templatetags.mezzanine_tags import richtext_filters
 from mezzanine.utils.models import upload_to
 
+from fec.cache import bump_version, get_version
+from .feeds import FeedPost, download
+from .thumbnails import (GALLERY_IMAGE_SIZES, PROFILE_IMAGE_SIZES,
+                         enqueue_thumbnails)
+
 
 class Community(Displayable):
     """A model for FEC Communities.
@@ -176,6 +193,9 @@ class Community(Displayable):
         blank=True,
     )
 
+    search_fields = ('short_description', 'full_description',
+                     'general_location')
+
     class Meta(object):
         """Set the model's options, like the plural name and ordering."""
         verbose_name_plural = 'communities'
@@ -194,6 +214,23 @@ class Community(Displayable):
             return reverse('ally_community_detail', kwargs={'slug': self.slug})
         return reverse('community_detail', kwargs={'slug': self.slug})
 
+    @property
+    def population_and_location(self):
+        """Return the Community's population & general location as HTML.
+
+        This is the ``community_population_and_location`` tag's output, or an
+        empty string if neither is known.
+
+        """
+        return mark_safe(render_to_string(
+            'communities/tags/population_and_location_text.html',
+            {'community': self}).strip())
+
+    @property
+    def summary(self):
+        """Return the :attr:`full_description` as plain text."""
+        return strip_tags(self.full_description)
+
     def save(self, *args, **kwargs):
         """Create the :attr:`blog_category` or update it's name."""
         if not self.id:
@@ -208,37 +245,25 @@ class Community(Displayable):
         Return a list of latest BlogPosts in Community's BlogCategory and Posts
         from it's CommunityFeed.
 
-        """
-        blog_and_feed_posts = (
-            [convert_to_feed_post(blog_post, self) for blog_post in
-             self.blog_category.blogposts.filter(
-                 status=CONTENT_STATUS_PUBLISHED)] +
-            self.get_latest_feed_posts()
-        )
-        blog_and_feed_posts.sort(
-            key=lambda post: post['published'], reverse=True)
-
-        return blog_and_feed_posts[:limit]
-
-    def get_latest_feed_posts(self):
-        """Return a list of the Community's latest ``feed posts``.
-
-        What exactly consitutes a ``feed_post`` is defined by the
-        :func:`CommunityFeed.get_feed_posts` function.
-
-        A `community` attribute is added to each post containing the parent
-        :class:`Community`.
+        Only the newest ``limit`` posts of each source are queried(along with
+        the BlogPosts' authors), and they are merged with a heap, so the cost
+        does not grow with the number of older posts. Only the returned posts
+        are converted into :class:`~.feeds.FeedPost` objects.
 
-        :returns: A list of ``feed post`` dictionaries.
+        Posts without a description are skipped. The descriptions are
+        already sanitized, so they can be rendered as they are.
 
         """
-        feeds = self.feeds.all()
-        feed_posts = []
-        _ = [feed_posts.append(post) for feed in feeds
-             for post in feed.get_feed_posts()]
-        _ = [setattr(post, "community", self) for post in feed_posts]
-        feed_posts.sort(key=lambda x: x.published, reverse=True)
-        return feed_posts[:5]
+        blog_posts = self.blog_category.blogposts.filter(
+            status=CONTENT_STATUS_PUBLISHED).exclude(
+                description='').select_related('user').order_by(
+                    '-publish_date')[:limit]
+        entries = FeedEntry.objects.filter(feed__community=self).exclude(
+            description='').select_related('feed')[:limit]
+        newest_posts = heapq.nlargest(
+            limit, chain(blog_posts, entries), key=get_published_date)
+        return [post.as_feed_post() if isinstance(post, FeedEntry) else
+                convert_to_feed_post(post, self) for post in newest_posts]
 
 
 class CommunityImage(Orderable, object):
@@ -284,6 +309,18 @@ class CommunityImage(Orderable, object):
         super(CommunityImage, self).save(*args, **kwargs)
 
 
+class CommunityFeedQuerySet(models.QuerySet):
+    """Custom queries for :class:`CommunityFeed`."""
+    def due(self):
+        """Return the Feeds that should be fetched now.
+
+        Feeds that keep failing are skipped until their back off expires.
+
+        """
+        return self.filter(models.Q(next_poll__isnull=True) |
+                           models.Q(next_poll__lte=timezone.now()))
+
+
 class CommunityFeed(Orderable, object):
     """A model for :class:`Community` RSS and Atom feeds.
 
@@ -299,10 +336,63 @@ class CommunityFeed(Orderable, object):
 
         The maximum number of posts to display.
 
+    .. attribute:: etag
+
+        The ``ETag`` header sent with the last full response, used to make
+        conditional requests.
+
+    .. attribute:: modified
+
+        The ``Last-Modified`` header sent with the last full response, used to
+        make conditional requests.
+
+    .. attribute:: full_fetch_count
+
+        The number of times the Feed has been downloaded & parsed.
+
+    .. attribute:: not_modified_count
+
+        The number of times the Feed responded with ``304 Not Modified``.
+
+    .. attribute:: next_poll
+
+        When the Feed should next be fetched. Blank if it never has been.
+
+    .. attribute:: poll_interval
+
+        The number of seconds between successful fetches. This shrinks when
+        the Feed has new posts and grows when it doesn't.
+
+    .. attribute:: failure_count
+
+        The number of consecutive failed fetches.
+
+    .. attribute:: average_response_time
+
+        The moving average of the number of seconds each fetch takes.
+
     """
+    DEFAULT_POLL_INTERVAL = 60 * 60
+
     url = models.URLField(help_text='The Feed\'s URL.')
     community = models.ForeignKey(Community, related_name="feeds")
     post_limit = models.PositiveSmallIntegerField(null=True, blank=True)
+    etag = models.CharField(max_length=200, blank=True, editable=False)
+    modified = models.CharField(max_length=100, blank=True, editable=False)
+    full_fetch_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Full Fetches')
+    not_modified_count = models.PositiveIntegerField(
+        default=0, editable=False, verbose_name='Not Modified Fetches')
+    next_poll = models.DateTimeField(
+        null=True, blank=True, db_index=True, editable=False)
+    poll_interval = models.PositiveIntegerField(
+        default=DEFAULT_POLL_INTERVAL, editable=False)
+    failure_count = models.PositiveSmallIntegerField(
+        default=0, editable=False, verbose_name='Failed Fetches')
+    average_response_time = models.FloatField(
+        null=True, blank=True, editable=False)
+
+    objects = CommunityFeedQuerySet.as_manager()
 
     class Meta(object):
         """Set the colloquial name to ``Feed``."""
@@ -312,36 +402,774 @@ class CommunityFeed(Orderable, object):
     def __unicode__(self):
         return self.url
 
-    def get_feed_posts(self):
-        """Return all feed posts from the :attr:`url`.
+    @property
+    def max_entries(self):
+        """The number of entries to read from the Feed.
 
-        This modifies the ``published`` attribute to be a datetime instead of
-        the Feed's date string.
+        This is the :attr:`post_limit`, or the ``FEED_MAX_ENTRIES`` setting
+        if no limit was set.
 
-        :returns: A list of ``feed posts``.
         """
-        parsed_feed = feedparser.parse(self.url)
-        posts = parsed_feed.entries
-        for post in posts:
-            published_datetime = datetime.fromtimestamp(mktime(
-                post['published_parsed']))
-            post['published'] = published_datetime
-            post['via'] = re.sub(r'^(http(s)?://)?(www.)?(.*)$', r'\4',
-                                 parsed_feed.feed.link)
-        if self.post_limit is not None:
-            return posts[:self.post_limit]
+        return self.post_limit or settings.FEED_MAX_ENTRIES
+
+    def fetch(self, parser, timeout=None, conditional=True,
+              max_entries=None):
+        """Download & parse the Feed if it has changed since the last fetch.
+
+        The request is conditional on the :attr:`etag` & :attr:`modified`
+        values of the last full response, so unchanged Feeds are neither
+        downloaded nor parsed again.
+
+        This does not access the database, so it is safe to call from the
+        worker threads of :func:`~.feeds.fetch_all`, which is the usual way
+        to fetch Feeds.
+
+        :param parser: The pool to parse the Feed in, shared between
+                       fetches.
+        :type parser: :class:`~.feeds.ParserPool`
+        :param timeout: The number of seconds the download may take.
+        :type timeout: float
+        :param conditional: Whether to send the conditional request headers.
+        :type conditional: bool
+        :param max_entries: The number of entries to read, defaulting to
+                            :attr:`max_entries`.
+        :type max_entries: int
+        :raises: :class:`~.feeds.FeedError` if the Feed could not be fetched
+                 or parsed.
+        :returns: The parsed Feed, or :obj:`None` if it was not modified.
+        :rtype: :class:`~.feeds.ParsedFeed`
+
+        """
+        if max_entries is None:
+            max_entries = self.max_entries
+        if conditional:
+            response = download(self.url, self.etag, self.modified, timeout,
+                                max_entries)
+        else:
+            response = download(self.url, timeout=timeout,
+                                max_entries=max_entries)
+        if response.status == 304:
+            return None
+        return parser.parse(response, self.url, max_entries)
+
+    def store_entries(self, parsed_feed):
+        """Store the posts of a parsed Feed as :class:`FeedEntry` objects.
+
+        Entries that are no longer in the Feed(or are past the
+        :attr:`post_limit`) are removed, so the stored entries always mirror
+        the Feed's current contents. Only new & changed entries are saved,
+        and the cached Latest Updates are only invalidated if there were
+        any, so unchanged posts do not update the timeline or the cache. If
+        the Feed could not be parsed, the previously stored entries are left
+        untouched. The Feed's row is locked while the entries are stored, so
+        overlapping ``fetch_feeds`` runs can't create the same entry twice.
+
+        :param parsed_feed: The result of :meth:`fetch`.
+        :type parsed_feed: :class:`~.feeds.ParsedFeed`
+        :returns: The number of new entries, or :obj:`None` if the Feed was
+                  not modified.
+
+        """
+        if parsed_feed is None:
+            self._increment_counter('not_modified_count')
+            return None
+        posts = parsed_feed.posts[:self.post_limit]
+        guids = []
+        created_count = 0
+        changed = False
+        with transaction.atomic():
+            list(CommunityFeed.objects.select_for_update().filter(pk=self.pk))
+            entries = dict((entry.guid, entry) for entry in self.entries.all())
+            for guid, post in posts:
+                guid = guid[:2000]
+                fields = FeedEntry.fields_from_feed_post(post)
+                guids.append(guid)
+                entry = entries.get(guid)
+                if entry is None:
+                    entries[guid] = self.entries.create(guid=guid, **fields)
+                    created_count += 1
+                    changed = True
+                elif any(getattr(entry, name) != value
+                         for name, value in fields.items()):
+                    for name, value in fields.items():
+                        setattr(entry, name, value)
+                    entry.save()
+                    changed = True
+            self.entries.exclude(guid__in=guids).delete()
+            self.etag = parsed_feed.etag[:200]
+            self.modified = parsed_feed.modified[:100]
+            self.save(update_fields=['etag', 'modified'])
+            self._increment_counter('full_fetch_count')
+        if changed:
+            invalidate_latest_posts(self.community_id)
+        return created_count
+
+    def record_success(self, created_count, response_time):
+        """Schedule the next fetch after a successful one.
+
+        Feeds with new posts are polled twice as often, down to the
+        ``FEED_POLL_MIN_INTERVAL`` setting. Feeds without new posts are polled
+        half again as often, up to the ``FEED_POLL_MAX_INTERVAL`` setting.
+
+        :param created_count: The result of :meth:`store_entries`.
+        :type created_count: int
+        :param response_time: The number of seconds the fetch took.
+        :type response_time: float
+
+        """
+        if created_count:
+            interval = self.poll_interval // 2
+        else:
+            interval = self.poll_interval * 3 // 2
+        interval = min(settings.FEED_POLL_MAX_INTERVAL, interval)
+        self.poll_interval = max(settings.FEED_POLL_MIN_INTERVAL, interval)
+        self.failure_count = 0
+        self._schedule(self.poll_interval, response_time)
+
+    def record_failure(self, response_time):
+        """Back off exponentially after a failed fetch.
+
+        The Feed is skipped by :meth:`CommunityFeedQuerySet.due` for
+        ``FEED_POLL_MIN_INTERVAL * 2 ** failure_count`` seconds, up to the
+        ``FEED_FAILURE_MAX_BACKOFF`` setting.
+
+        :param response_time: The number of seconds the fetch took.
+        :type response_time: float
+
+        """
+        self.failure_count += 1
+        backoff = min(settings.FEED_FAILURE_MAX_BACKOFF,
+                      settings.FEED_POLL_MIN_INTERVAL *
+                      2 ** min(self.failure_count, 32))
+        self._schedule(backoff, response_time)
+
+    def _schedule(self, seconds, response_time):
+        """Set the next poll & update the average response time."""
+        self.next_poll = timezone.now() + timedelta(seconds=seconds)
+        if self.average_response_time is None:
+            self.average_response_time = response_time
+        else:
+            self.average_response_time = (
+                0.7 * self.average_response_time + 0.3 * response_time)
+        self.save(update_fields=['next_poll', 'poll_interval', 'failure_count',
+                                 'average_response_time'])
+
+    def _increment_counter(self, field_name):
+        """Atomically add one to a fetch counter field."""
+        CommunityFeed.objects.filter(pk=self.pk).update(
+            **{field_name: models.F(field_name) + 1})
+        setattr(self, field_name, getattr(self, field_name) + 1)
+
+
+class FeedEntry(models.Model):
+    """A post from a :class:`CommunityFeed`, stored by the ``fetch_feeds``
+    management command.
+
+    .. attribute:: feed
+
+        The :class:`CommunityFeed` the entry was fetched from.
+
+    .. attribute:: guid
+
+        The unique identifier of the entry in it's Feed.
+
+    .. attribute:: title
+
+        The entry's title.
+
+    .. attribute:: link
+
+        The URL of the entry.
+
+    .. attribute:: author
+
+        The name of the entry's author.
+
+    .. attribute:: description
+
+        The entry's description or summary, as sanitized HTML that is
+        ready to render. This is empty if the entry had no content.
+
+    .. attribute:: published
+
+        When the entry was published.
+
+    .. attribute:: comments
+
+        The URL of the entry's comments.
+
+    .. attribute:: slash_comments
+
+        The number of comments on the entry.
+
+    .. attribute:: via
+
+        The domain of the Feed's website.
+
+    """
+    feed = models.ForeignKey(CommunityFeed, related_name='entries')
+    guid = models.CharField(max_length=2000)
+    title = models.CharField(max_length=500, blank=True)
+    link = models.URLField(max_length=2000, blank=True)
+    author = models.CharField(max_length=200, blank=True)
+    description = models.TextField(blank=True)
+    published = models.DateTimeField(db_index=True)
+    comments = models.URLField(max_length=2000, blank=True)
+    slash_comments = models.CharField(max_length=20, blank=True)
+    via = models.CharField(max_length=200, blank=True)
+
+    class Meta(object):
+        """Order by newest first & keep one entry per guid in each Feed."""
+        ordering = ['-published']
+        unique_together = ('feed', 'guid')
+        verbose_name = "Feed Entry"
+        verbose_name_plural = "Feed Entries"
+
+    def __unicode__(self):
+        return self.title
+
+    @staticmethod
+    def fields_from_feed_post(post):
+        """Return a dictionary of FeedEntry fields from a ``feed post``.
+
+        The ``description`` is rendered with :func:`render_description`.
+
+        :param post: A post returned by :func:`~.feeds.get_posts`.
+        :type post: :class:`~.feeds.FeedPost`
+        :returns: A dictionary of field names & values.
+
+        """
+        return {
+            'title': post.title[:500],
+            'link': post.link[:2000],
+            'author': post.author[:200],
+            'description': render_description(post.description),
+            'published': timezone.make_aware(post.published, timezone.utc),
+            'comments': post.comments[:2000],
+            'slash_comments': post.slash_comments[:20],
+            'via': post.via[:200],
+        }
+
+    def as_feed_post(self):
+        """Return the entry as a :class:`~.feeds.FeedPost`."""
+        return FeedPost(
+            title=self.title,
+            published=self.published.replace(tzinfo=None),
+            author=self.author,
+            description=self.description,
+            link=self.link,
+            comments=self.comments,
+            slash_comments=self.slash_comments,
+            via=self.via,
+            community_id=self.feed.community_id,
+        )
+
+
+class TimelinePostManager(models.Manager):
+    """Maintains the federation-wide timeline of :class:`TimelinePost`."""
+    def latest_posts(self, limit=10, per_community=5):
+        """Return the newest canonical posts in the timeline.
+
+        Like the Communities' Latest Updates, each Community contributes at
+        most ``per_community`` posts, so one busy Feed can not fill the
+        timeline. The posts are read in batches, newest first, until enough
+        are found.
+
+        :param limit: The maximum number of posts to return.
+        :type limit: int
+        :param per_community: The maximum number of posts of each Community.
+        :type per_community: int
+        :returns: A list of :class:`TimelinePost` objects.
+
+        """
+        timeline = self.filter(is_canonical=True).select_related('community')
+        batch_size = limit * 2
+        posts = []
+        counts = Counter()
+        start = 0
+        while len(posts) < limit:
+            batch = list(timeline[start:start + batch_size])
+            for post in batch:
+                if counts[post.community_id] < per_community:
+                    counts[post.community_id] += 1
+                    posts.append(post)
+                    if len(posts) == limit:
+                        break
+            if len(batch) < batch_size:
+                break
+            start += batch_size
         return posts
 
+    def sync_blog_post(self, blog_post):
+        """Replace the timeline posts for a BlogPost.
+
+        A published BlogPost gets a post for every Community whose
+        :attr:`~Community.blog_category` it is in. The description of a
+        BlogPost in any Community's category is stored rendered with
+        :func:`render_description`, so the Community's Latest Updates can
+        show it as it is.
+
+        :param blog_post: The saved BlogPost.
+        :type blog_post: :class:`mezzanine.blog.models.BlogPost`
+
+        """
+        with transaction.atomic():
+            old_posts = self.filter(blog_post=blog_post)
+            dedupe_keys = set(old_posts.values_list('dedupe_key', flat=True))
+            old_posts.delete()
+            communities = list(Community.objects.filter(
+                blog_category__in=blog_post.categories.all()))
+            if communities:
+                description = render_description(blog_post.description)
+                if description != blog_post.description:
+                    blog_post.description = description
+                    BlogPost.objects.filter(id=blog_post.id).update(
+                        description=description)
+            if blog_post.status == CONTENT_STATUS_PUBLISHED:
+                for community in communities:
+                    post = self.create(
+                        community=community, blog_post=blog_post,
+                        is_member=community.membership_status ==
+                        Community.MEMBER,
+                        published=blog_post.publish_date,
+                        **TimelinePost.fields_from_feed_post(
+                            convert_to_feed_post(blog_post, community)))
+                    dedupe_keys.add(post.dedupe_key)
+            self.update_canonical(dedupe_keys)
+
+    def sync_feed_entry(self, entry):
+        """Create or update the timeline post for a FeedEntry.
+
+        The post is only saved if it is new or it's fields changed.
+
+        :param entry: The saved FeedEntry.
+        :type entry: :class:`FeedEntry`
+
+        """
+        community = entry.feed.community
+        fields = dict(
+            community_id=community.id,
+            is_member=community.membership_status == Community.MEMBER,
+            published=entry.published,
+            **TimelinePost.fields_from_feed_post(entry.as_feed_post()))
+        with transaction.atomic():
+            post = self.filter(feed_entry=entry).first()
+            if post is None:
+                post = self.create(feed_entry=entry, **fields)
+                self.update_canonical([post.dedupe_key])
+            elif any(getattr(post, name) != value
+                     for name, value in fields.items()):
+                dedupe_keys = set([post.dedupe_key])
+                for name, value in fields.items():
+                    setattr(post, name, value)
+                post.save()
+                dedupe_keys.add(post.dedupe_key)
+                self.update_canonical(dedupe_keys)
+
+    def sync_community(self, community):
+        """Update the timeline posts of a Community whose status changed.
+
+        :param community: The saved Community.
+        :type community: :class:`Community`
+
+        """
+        is_member = community.membership_status == Community.MEMBER
+        changed_posts = self.filter(community=community).exclude(
+            is_member=is_member)
+        dedupe_keys = set(changed_posts.values_list('dedupe_key', flat=True))
+        if dedupe_keys:
+            changed_posts.update(is_member=is_member)
+            self.update_canonical(dedupe_keys)
+
+    def update_canonical(self, dedupe_keys):
+        """Pick the post shown in the timeline for each duplicate title.
+
+        Posts from Member Communities are preferred, then the oldest post.
+
+        :param dedupe_keys: The :attr:`TimelinePost.dedupe_key` values to
+                            update.
+        :type dedupe_keys: An iterable of strings
+
+        """
+        for dedupe_key in set(dedupe_keys):
+            duplicates = self.filter(dedupe_key=dedupe_key)
+            canonical_id = duplicates.order_by(
+                '-is_member', 'id').values_list('id', flat=True).first()
+            if canonical_id is None:
+                continue
+            duplicates.exclude(id=canonical_id).filter(
+                is_canonical=True).update(is_canonical=False)
+            duplicates.filter(id=canonical_id, is_canonical=False).update(
+                is_canonical=True)
+
+    def rebuild(self):
+        """Rebuild the whole timeline from the BlogPosts & FeedEntries."""
+        with transaction.atomic():
+            self.all().delete()
+            blog_posts = BlogPost.objects.filter(
+                status=CONTENT_STATUS_PUBLISHED,
+                categories__in=Community.objects.values('blog_category'),
+            ).distinct()
+            for blog_post in blog_posts:
+                self.sync_blog_post(blog_post)
+            for entry in FeedEntry.objects.select_related('feed__community'):
+                self.sync_feed_entry(entry)
+
+
+class TimelinePost(models.Model):
+    """A post in the federation-wide timeline of Latest Updates.
+
+    Every published BlogPost in a Community's
+    :attr:`~Community.blog_category` and every :class:`FeedEntry` has a
+    TimelinePost, which is kept up to date by signal handlers. Posts with the
+    same normalized title share a :attr:`dedupe_key` and only one of them,
+    preferably from a Member Community, is marked as :attr:`is_canonical`.
+
+    .. attribute:: community
+
+        The :class:`Community` the post is shown for.
+
+    .. attribute:: blog_post
+
+        The BlogPost the post was made from, if any.
+
+    .. attribute:: feed_entry
+
+        The :class:`FeedEntry` the post was made from, if any.
+
+    .. attribute:: dedupe_key
+
+        A hash of the post's normalized title, used to find duplicates.
+
+    .. attribute:: is_member
+
+        Whether the :attr:`community` is a Member Community.
+
+    .. attribute:: is_canonical
+
+        Whether this post is shown in the timeline for it's
+        :attr:`dedupe_key`.
+
+    """
+    community = models.ForeignKey(Community, related_name='timeline_posts')
+    blog_post = models.ForeignKey(BlogPost, null=True, blank=True,
+                                  related_name='timeline_posts')
+    feed_entry = models.OneToOneField(FeedEntry, null=True, blank=True,
+                                      related_name='timeline_post')
+    dedupe_key = models.CharField(max_length=40, db_index=True)
+    is_member = models.BooleanField(default=False)
+    is_canonical = models.BooleanField(default=False)
+    title = models.CharField(max_length=500, blank=True)
+    link = models.URLField(max_length=2000, blank=True)
+    author = models.CharField(max_length=200, blank=True)
+    via = models.CharField(max_length=200, blank=True)
+    published = models.DateTimeField()
+
+    objects = TimelinePostManager()
+
+    class Meta(object):
+        """Order by newest first & index the timeline query."""
+        ordering = ['-published']
+        index_together = [('is_canonical', 'published')]
+
+    def __unicode__(self):
+        return self.title
+
+    @staticmethod
+    def get_dedupe_key(title, link=''):
+        """Return a hash of the normalized title, or the link if untitled.
+
+        :param title: The title of the post.
+        :type title: string
+        :param link: The URL of the post.
+        :type link: string
+        :returns: A SHA1 hex digest.
+
+        """
+        normalized = ' '.join(
+            re.sub(r'[^\w\s]', '', title.lower(), flags=re.UNICODE).split())
+        return hashlib.sha1(
+            (normalized or link).encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def fields_from_feed_post(post):
+        """Return the TimelinePost fields for a ``feed post``.
+
+        :param post: The post to add to the timeline.
+        :type post: :class:`~.feeds.FeedPost`
+        :returns: A dictionary of field names & values.
+
+        """
+        return {
+            'dedupe_key': TimelinePost.get_dedupe_key(post.title, post.link),
+            'title': post.title[:500],
+            'link': post.link[:2000],
+            'author': post.author[:200],
+            'via': post.via[:200],
+        }
+
+
+class DirectoryEntry(namedtuple('DirectoryEntry', [
+        'id', 'title', 'membership_status', 'url', 'population_and_location',
+        'summary', 'date_joined', 'publish_date', 'expiry_date'])):
+    """A compact summary of a Community, used by the directory snapshot.
+
+    Entries can be rendered in place of a Community by templates that only
+    show it's title, link, population, location & summary. The summary is
+    cut to the first :attr:`SUMMARY_WORDS` words.
+
+    """
+    __slots__ = ()
+    SUMMARY_WORDS = 50
+
+    @classmethod
+    def from_community(cls, community):
+        """Summarize a Community."""
+        return cls(
+            id=community.id,
+            title=community.title,
+            membership_status=community.membership_status,
+            url=community.get_absolute_url(),
+            population_and_location=community.population_and_location,
+            summary=Truncator(community.summary).words(
+                cls.SUMMARY_WORDS, truncate=' ...'),
+            date_joined=community.date_joined,
+            publish_date=community.publish_date,
+            expiry_date=community.expiry_date,
+        )
+
+    def get_absolute_url(self):
+        """Return the URL of the Community's Detail Page."""
+        return self.url
+
+    def is_published(self, now):
+        """Return whether the Community is published at the given time."""
+        return ((self.publish_date is None or self.publish_date <= now) and
+                (self.expiry_date is None or self.expiry_date >= now))
+
+
+def get_community_directory():
+    """Return a snapshot of every published Community, ordered by title.
+
+    The snapshot is cached until a Community is saved or deleted, so the
+    sidebars & lists of Communities need no queries. Communities that are
+    scheduled to be published or have expired are filtered out each time.
+
+    :returns: The published Communities.
+    :rtype: list of :class:`DirectoryEntry`
+
+    """
+    key = 'communities.directory.{}'.format(
+        get_version('community_directory'))
+    directory = cache.get(key)
+    if directory is None:
+        directory = [
+            DirectoryEntry.from_community(community) for community in
+            Community.objects.filter(status=CONTENT_STATUS_PUBLISHED)]
+        cache.set(key, directory, None)
+    now = timezone.now()
+    return [entry for entry in directory if entry.is_published(now)]
+
+
+def get_community_image_ids():
+    """Return the ``pk`` of every :class:`CommunityImage`.
+
+    The list is cached until a CommunityImage is saved or deleted.
+
+    :returns: The ids of the CommunityImages.
+    :rtype: list of int
+
+    """
+    key = 'communities.image_ids.{}'.format(get_version('community_images'))
+    image_ids = cache.get(key)
+    if image_ids is None:
+        image_ids = list(CommunityImage.objects.values_list('pk', flat=True))
+        cache.set(key, image_ids, None)
+    return image_ids
+
+
+def get_community_urls():
+    """Return the membership status & URL of every Community, by slug.
+
+    The map is cached until a Community is saved or deleted.
+
+    :returns: A dictionary mapping each Community's ``slug`` to a tuple of
+              it's :attr:`~Community.membership_status` & absolute URL.
+    :rtype: dict
+
+    """
+    key = 'communities.community_urls.{}'.format(get_version('community_urls'))
+    community_urls = cache.get(key)
+    if community_urls is None:
+        community_urls = dict(
+            (community.slug, (community.membership_status,
+                              community.get_absolute_url()))
+            for community in Community.objects.only(
+                'slug', 'membership_status'))
+        cache.set(key, community_urls, None)
+    return community_urls
+
+
+def get_published_date(post):
+    """Return when a BlogPost or :class:`FeedEntry` was published."""
+    if isinstance(post, FeedEntry):
+        return post.published
+    return post.publish_date
+
+
+def render_description(html):
+    """Sanitize & filter a post's description so it is ready to render.
+
+    The HTML is cleaned like a ``RichTextField`` and passed through the
+    ``RICHTEXT_FILTERS``, so templates can output it without the
+    ``richtext_filters`` filter.
+
+    :param html: The description of a BlogPost or Feed entry.
+    :type html: string
+    :returns: The rendered HTML, or an empty string if it has no text or
+              images.
+    :rtype: string
+
+    """
+    html = richtext_filters(RichTextField().clean(html or '', None)).strip()
+    if not strip_tags(html).strip() and '<img' not in html:
+        return ''
+    return html
+
 
 def convert_to_feed_post(blog_post, community):
-    '''Turn a BlogPost into a feedparser entry.'''
-    return {
-        'title': blog_post.title,
-        'published': blog_post.publish_date.replace(tzinfo=None),
-        'author': blog_post.user.get_full_name(),
-        'description': blog_post.description,
-        'link': blog_post.get_absolute_url(),
-        'comments': '{}#comments'.format(blog_post.get_absolute_url()),
-        'slash_comments': '{}'.format(blog_post.comments_count),
-        'community': community,
-    }
+    '''Turn a BlogPost into a :class:`~.feeds.FeedPost`.
+
+    The BlogPost's ``user`` should be fetched with ``select_related`` to avoid
+    a query for each post. It's description should already be rendered with
+    :func:`render_description`.
+
+    '''
+    link = blog_post.get_absolute_url()
+    return FeedPost(
+        title=blog_post.title,
+        published=blog_post.publish_date.replace(tzinfo=None),
+        author=blog_post.user.get_full_name(),
+        description=blog_post.description,
+        link=link,
+        comments='{}#comments'.format(link),
+        slash_comments='{}'.format(blog_post.comments_count),
+        via='',
+        community_id=community.id,
+    )
+
+
+@receiver(post_save, sender=BlogPost)
+def update_timeline_for_blog_post(sender, instance, **kwargs):
+    """Update the timeline when a BlogPost is saved."""
+    if not kwargs.get('raw'):
+        TimelinePost.objects.sync_blog_post(instance)
+
+
+@receiver(m2m_changed, sender=BlogPost.categories.through)
+def update_timeline_for_blog_categories(sender, instance, action, reverse,
+                                        pk_set, **kwargs):
+    """Update the timeline when a BlogPost's categories change."""
+    if action not in ('post_add', 'post_remove', 'post_clear'):
+        return
+    if not reverse:
+        blog_posts = [instance]
+    elif action == 'post_clear':
+        blog_posts = BlogPost.objects.filter(
+            timeline_posts__community__blog_category=instance).distinct()
+    else:
+        blog_posts = BlogPost.objects.filter(id__in=pk_set)
+    for blog_post in blog_posts:
+        TimelinePost.objects.sync_blog_post(blog_post)
+
+
+@receiver(post_save, sender=FeedEntry)
+def update_timeline_for_feed_entry(sender, instance, **kwargs):
+    """Update the timeline when a FeedEntry is saved."""
+    if not kwargs.get('raw'):
+        TimelinePost.objects.sync_feed_entry(instance)
+
+
+@receiver(post_save, sender=Community)
+def update_timeline_for_community(sender, instance, **kwargs):
+    """Update the timeline when a Community's status changes."""
+    if not kwargs.get('raw'):
+        TimelinePost.objects.sync_community(instance)
+
+
+@receiver(post_delete, sender=TimelinePost)
+def update_timeline_for_deleted_post(sender, instance, **kwargs):
+    """Pick a new canonical post when a canonical post is deleted."""
+    if instance.is_canonical:
+        TimelinePost.objects.update_canonical([instance.dedupe_key])
+
+
+def invalidate_latest_posts(community_id):
+    """Invalidate the cached Latest Updates of a Community & the timeline.
+
+    :param community_id: The ``pk`` of the Community whose posts changed.
+    :type community_id: int
+
+    """
+    bump_version('feed_posts', community_id)
+    bump_version('all_latest_posts')
+
+
+@receiver(post_save, sender=TimelinePost)
+@receiver(post_delete, sender=TimelinePost)
+def invalidate_latest_posts_for_timeline_post(sender, instance, **kwargs):
+    """Invalidate the cached posts when a BlogPost or FeedEntry changes.
+
+    Every published BlogPost & FeedEntry of a Community has a TimelinePost
+    that is saved or deleted with it, so this catches new, edited, removed
+    & re-categorized posts, along with newly ingested entries.
+
+    """
+    invalidate_latest_posts(instance.community_id)
+
+
+@receiver(post_save, sender=CommunityFeed)
+@receiver(post_delete, sender=CommunityFeed)
+def invalidate_latest_posts_for_feed(sender, instance, **kwargs):
+    """Invalidate the cached posts when a Feed is edited or removed.
+
+    Saves that only update a Feed's polling information are ignored.
+
+    """
+    if kwargs.get('update_fields') is None:
+        invalidate_latest_posts(instance.community_id)
+
+
+@receiver(post_save, sender=Community)
+def invalidate_latest_posts_for_community(sender, instance, **kwargs):
+    """Invalidate the cached posts when a Community is changed."""
+    invalidate_latest_posts(instance.id)
+
+
+@receiver(post_save, sender=Community)
+def generate_profile_image_thumbnails(sender, instance, **kwargs):
+    """Generate the thumbnails of a Community's profile image."""
+    if instance.profile_image and not kwargs.get('raw'):
+        enqueue_thumbnails(instance.profile_image, PROFILE_IMAGE_SIZES)
+
+
+@receiver(post_save, sender=CommunityImage)
+def generate_gallery_image_thumbnails(sender, instance, **kwargs):
+    """Generate the thumbnails of a CommunityImage."""
+    if instance.file and not kwargs.get('raw'):
+        enqueue_thumbnails(instance.file, GALLERY_IMAGE_SIZES)
+
+
+@receiver(post_save, sender=CommunityImage)
+@receiver(post_delete, sender=CommunityImage)
+def invalidate_community_image_ids(sender, instance, **kwargs):
+    """Invalidate the :func:`get_community_image_ids` list."""
+    bump_version('community_images')
+
+
+@receiver(post_save, sender=Community)
+@receiver(post_delete, sender=Community)
+def invalidate_community_urls(sender, instance, **kwargs):
+    """Invalidate the :func:`get_community_urls` map & the directory."""
+    bump_version('community_urls')
+    bump_version('community_directory')
@@ -1,8 +1,13 @@
 """This module contains templatetags associated with Communities."""
+import random
+
 from django import template
 from django.conf import settings
 
-from communities.models import Community, CommunityImage
+from communities.models import (Community, CommunityImage, TimelinePost,
+                                get_community_directory,
+                                get_community_image_ids)
+from communities.thumbnails import get_picture
 
 
 register = template.Library()
@@ -53,12 +58,34 @@ def community_profile_picture_thumbnail(community, width, height):
             'MEDIA_URL': settings.MEDIA_URL}
 
 
+@register.assignment_tag
+def community_picture(image, width, height):
+    """Return the URLs of an image's precomputed thumbnail & it's variants.
+
+    The result's ``src``, ``srcset``, ``webp_srcset`` & ``sizes`` are used
+    to render a ``<picture>`` tag, so browsers can download the smallest
+    variant in a format they support.
+
+    :param image: The image to show.
+    :type image: :class:`mezzanine.core.fields.FileField` value
+    :param width: The width of the thumbnail.
+    :type width: :class:`Integer`
+    :param height: The height of the thumbnail.
+    :type height: :class:`Integer`
+    :rtype: :class:`~..thumbnails.Picture`
+
+    """
+    return get_picture(image, width, height)
+
+
 @register.inclusion_tag('communities/tags/community_blurb.html')
 def community_blurb(community, truncate_description_at=35, show_picture=True):
     """Render a compact blurb for a :class:`~.models.Community`.
 
-    This includes the picture, name, population, general location, and the full
-    description(truncated at the specified amount of words).
+    This includes the picture, name, population, general location, and the
+    :attr:`~.models.Community.summary`(truncated at the specified amount of
+    words). :class:`~.models.DirectoryEntry` summaries are already cut to
+    :attr:`~.models.DirectoryEntry.SUMMARY_WORDS` words.
     """
     return {'community': community,
             'show_profile_picture': show_picture,
@@ -67,17 +94,32 @@ def community_blurb(community, truncate_description_at=35, show_picture=True):
 
 @register.assignment_tag
 def community_random_image():
-    """Return a random Communityimage."""
-    images = CommunityImage.objects.order_by('?')
-    return images[0] if images else None
+    """Return a random Communityimage.
+
+    The image is picked from the cached list of image ids, so only the
+    chosen image & it's Community are queried.
+
+    """
+    image_ids = get_community_image_ids()
+    if not image_ids:
+        return None
+    return CommunityImage.objects.select_related('community').filter(
+        pk=random.choice(image_ids)).first()
 
 
 @register.assignment_tag
 def community_random():
-    """Return a random Published Community that has a full_description."""
-    communities = Community.objects.published().exclude(
-        full_description__exact='').order_by('?')
-    return communities[0] if communities else None
+    """Return a random Published Community that has a summary.
+
+    The Community is picked from the directory snapshot, so only the chosen
+    Community is queried.
+
+    """
+    community_ids = [entry.id for entry in get_community_directory()
+                     if entry.summary]
+    if not community_ids:
+        return None
+    return Community.objects.filter(pk=random.choice(community_ids)).first()
 
 
 @register.assignment_tag
@@ -85,41 +127,48 @@ def community_all_latest_posts(limit=10):
     """Return the latest RSS Feed & Blog Posts of all the Communities.
 
     Posts with duplicate titles are removed, preferring Posts from Member
-    Communities.
+    Communities. The posts are read from the precomputed
+    :class:`~..models.TimelinePost` table.
 
     """
-    communities = (
-        list(Community.objects.filter(
-            membership_status=Community.MEMBER).order_by('?')) +
-        list(Community.objects.exclude(membership_status=Community.MEMBER)))
-    feed_posts = []
-    post_titles = []
-    for community in communities:
-        for post in community.get_latest_posts():
-            if post['title'] not in post_titles:
-                post_titles.append(post['title'])
-                feed_posts.append(post)
-    posts = sorted(feed_posts, key=lambda post: post['published'],
-                   reverse=True)
-    return posts[:limit]
+    return TimelinePost.objects.latest_posts(limit)
 
 
 @register.assignment_tag
 def community_fec_members():
-    """Return a list of all FEC member communities."""
-    return Community.objects.published().filter(
-        membership_status=Community.MEMBER)
+    """Return a list of all FEC member communities.
+
+    The Communities are read from the directory snapshot, so they are
+    :class:`~..models.DirectoryEntry` tuples.
+
+    """
+    return [entry for entry in get_community_directory()
+            if entry.membership_status == Community.MEMBER]
 
 
 @register.assignment_tag
 def community_communities_in_dialog():
-    """Return a list of all FEC Communities in dialog"""
-    return Community.objects.published().filter(
-        membership_status=Community.COMMUNITY_IN_DIALOG)
+    """Return a list of all FEC Communities in dialog.
+
+    The Communities are read from the directory snapshot, so they are
+    :class:`~..models.DirectoryEntry` tuples.
+
+    """
+    return [entry for entry in get_community_directory()
+            if entry.membership_status == Community.COMMUNITY_IN_DIALOG]
 
 
 @register.assignment_tag
 def community_newest_communities(limit=5):
-    """Return a list of FEC Communities ordered by creation date."""
-    return Community.objects.published().exclude(
-        membership_status=Community.ALLY).order_by('-date_joined')[:limit]
+    """Return a list of FEC Communities ordered by creation date.
+
+    The Communities are read from the directory snapshot, so they are
+    :class:`~..models.DirectoryEntry` tuples. Communities without a
+    ``date_joined`` come last.
+
+    """
+    communities = [entry for entry in get_community_directory()
+                   if entry.membership_status != Community.ALLY]
+    communities.sort(key=lambda entry: (entry.date_joined is not None,
+                                        entry.date_joined), reverse=True)
+    return communities[:limit]
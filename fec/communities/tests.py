@@ -1,16 +1,170 @@
 """This module contains unit tests for the ``communities`` package."""
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from datetime import date, datetime, timedelta
+import os
+import pickle
+import shutil
+import signal
+import socket
+from SocketServer import ThreadingMixIn
+from StringIO import StringIO
+import tempfile
+import threading
+import time
+
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
 from django.core.urlresolvers import reverse
-from django.test import TestCase
+from django.db import connection
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+import feedparser
 from mezzanine.blog.models import BlogCategory, BlogPost
 from mezzanine.core.models import (
     CONTENT_STATUS_DRAFT, CONTENT_STATUS_PUBLISHED)
+from mezzanine.core.templatetags.mezzanine_tags import thumbnail
+from PIL import Image
+
+from documents.models import Document, DocumentCategory
+from fec.cache import get_version
 
-from .models import Community, CommunityFeed, convert_to_feed_post
+from . import feeds, thumbnails
+from .feeds import (
+    EntryCounter, FeedError, FeedPost, FeedResponse, ParsedFeed, ParserPool,
+    download, fetch_all, normalize_url)
+from .models import (
+    Community, CommunityFeed, CommunityImage, FeedEntry, TimelinePost,
+    get_community_directory, get_community_urls, render_description)
+from .thumbnails import (
+    GALLERY_IMAGE_SIZES, PROFILE_IMAGE_SIZES, get_picture,
+    get_thumbnail_paths, get_variant_sizes, wait_for_thumbnails)
 from .templatetags.communities_tags import (
     community_newest_communities, community_fec_members,
     community_communities_in_dialog, community_random,
-    community_all_latest_posts)
+    community_random_image, community_all_latest_posts)
+
+
+TEST_FEED = """<?xml version="1.0" encoding="utf-8"?>
+<rss version="2.0" xmlns:slash="http://purl.org/rss/1.0/modules/slash/">
+<channel>
+  <title>Test Feed</title>
+  <link>http://www.example.com/</link>
+  <description>A Feed for Testing</description>
+  {items}
+</channel>
+</rss>
+"""
+
+TEST_FEED_ITEM = """
+  <item>
+    <title>{title}</title>
+    <link>http://www.example.com/{slug}/</link>
+    <guid>http://www.example.com/{slug}/</guid>
+    <description>The {title} post.</description>
+    <author>author@example.com (Test Author)</author>
+    <comments>http://www.example.com/{slug}/#comments</comments>
+    <slash:comments>2</slash:comments>
+    <pubDate>{date}</pubDate>
+  </item>
+"""
+
+
+def build_test_feed(titles):
+    """Return an RSS document with an item for each title, newest first."""
+    items = [TEST_FEED_ITEM.format(
+        title=title, slug=title.lower().replace(' ', '-'),
+        date='Tue, {:02d} Jun 2015 09:00:00 GMT'.format(28 - index))
+        for index, title in enumerate(titles)]
+    return TEST_FEED.format(items=''.join(items))
+
+
+class ThreadingHTTPServer(ThreadingMixIn, HTTPServer):
+    """An HTTPServer that handles each request in a new thread."""
+    daemon_threads = True
+
+
+class FeedServer(object):
+    """A local HTTP stand-in for remote Feeds, run in a background thread.
+
+    Every request is answered with the :attr:`status` and :attr:`body` after
+    waiting :attr:`delay` seconds; tests may change these between requests.
+    If a :attr:`drip_delay` is set, the body is sent one byte at a time,
+    waiting that many seconds before each byte.
+    If an :attr:`etag` is set, it is sent with responses and matching
+    conditional requests are answered with ``304 Not Modified``.
+
+    """
+    def __init__(self, body='', status=200, etag=None):
+        self.body = body
+        self.status = status
+        self.etag = etag
+        self.delay = 0
+        self.drip_delay = 0
+        self.request_count = 0
+        self.handler_threads = []
+        feed_server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            """Respond with the FeedServer's status and body."""
+            def do_GET(self):  # pylint: disable=invalid-name
+                """Send the current body of the FeedServer."""
+                feed_server.request_count += 1
+                feed_server.handler_threads.append(threading.current_thread())
+                time.sleep(feed_server.delay)
+                if (feed_server.etag is not None and
+                        self.headers.get('If-None-Match') == feed_server.etag):
+                    self.send_response(304)
+                    self.end_headers()
+                    return
+                self.send_response(feed_server.status)
+                self.send_header('Content-Type', 'application/rss+xml')
+                if feed_server.etag is not None:
+                    self.send_header('ETag', feed_server.etag)
+                self.end_headers()
+                if not feed_server.drip_delay:
+                    self.wfile.write(feed_server.body)
+                    return
+                try:
+                    for byte in feed_server.body:
+                        time.sleep(feed_server.drip_delay)
+                        self.wfile.write(byte)
+                        self.wfile.flush()
+                except socket.error:
+                    pass
+
+            def finish(self):
+                """Ignore clients that hung up on a trickled body."""
+                try:
+                    BaseHTTPRequestHandler.finish(self)
+                except socket.error:
+                    pass
+
+            def log_message(self, *args):
+                """Keep the test output quiet."""
+
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+
+    @property
+    def url(self):
+        """Return the URL of the Feed."""
+        return 'http://127.0.0.1:{}/feed.xml'.format(self.server.server_port)
+
+    def start(self):
+        """Start serving requests."""
+        self.thread.start()
+
+    def stop(self):
+        """Stop serving, wait for the open responses & close the socket."""
+        self.server.shutdown()
+        for thread in self.handler_threads:
+            thread.join()
+        self.server.server_close()
 
 
 class CommunityModelTests(TestCase):
@@ -43,15 +197,114 @@ class CommunityModelTests(TestCase):
         self.community.save()
         self.assertEqual(self.community.blog_category.title, 'I like shorts')
 
-    def test_get_latest_feed_posts_returns_latest_posts(self):
-        """get_latest_feed_posts should return the 5 latest posts."""
-        bps = self.community.get_latest_feed_posts()
-        post_titles = [
-            'Recommended Web Based Feed Reader Software',
-            'Recommended Desktop Feed Reader Software',
-            'RSS Resources',
-        ]
+    def test_get_latest_posts_returns_latest_feed_posts(self):
+        """get_latest_posts should return the 5 latest stored feed posts."""
+        feed = self.community.feeds.get()
+        for day in range(1, 8):
+            FeedEntry.objects.create(
+                feed=feed, guid=str(day), title='Post {}'.format(day),
+                description='<p>A post.</p>',
+                published=datetime(2015, 6, day, tzinfo=timezone.utc))
+        bps = self.community.get_latest_posts()
+        post_titles = ['Post 7', 'Post 6', 'Post 5', 'Post 4', 'Post 3']
         self.assertSequenceEqual([post.title for post in bps], post_titles)
+        self.assertTrue(all(post.community_id == self.community.id
+                            for post in bps))
+
+    def test_get_latest_posts_merges_blog_and_feed_posts(self):
+        """get_latest_posts should return the newest Blog & Feed posts."""
+        feed = self.community.feeds.get()
+        user = User.objects.create()
+        for day in range(1, 5):
+            FeedEntry.objects.create(
+                feed=feed, guid=str(day), title='Feed {}'.format(day),
+                description='<p>A post.</p>',
+                published=datetime(2015, 6, day * 2, tzinfo=timezone.utc))
+            blog_post = BlogPost.objects.create(
+                title='Blog {}'.format(day), user=user,
+                publish_date=datetime(2015, 6, day * 2 + 1,
+                                      tzinfo=timezone.utc))
+            blog_post.categories.add(self.community.blog_category)
+        self.assertSequenceEqual(
+            [post.title for post in self.community.get_latest_posts(5)],
+            ['Blog 4', 'Feed 4', 'Blog 3', 'Feed 3', 'Blog 2'])
+
+    def test_latest_posts_are_compact(self):
+        """The latest posts should be slotted FeedPosts that can be pickled."""
+        FeedEntry.objects.create(
+            feed=self.community.feeds.get(), guid='1', title='Feed Post',
+            published=datetime(2015, 6, 1, tzinfo=timezone.utc))
+        blog_post = BlogPost.objects.create(
+            title='Blog Post', user=User.objects.create())
+        blog_post.categories.add(self.community.blog_category)
+        posts = self.community.get_latest_posts()
+        self.assertTrue(all(isinstance(post, FeedPost) for post in posts))
+        self.assertRaises(AttributeError, setattr, posts[0], 'extra', 1)
+        self.assertEqual(pickle.loads(pickle.dumps(posts)), posts)
+
+    def test_get_latest_posts_skips_empty_posts(self):
+        """Posts without a description should not be returned."""
+        feed = self.community.feeds.get()
+        for day, description in enumerate(['<p>Hi</p>', '', '<p>Bye</p>']):
+            FeedEntry.objects.create(
+                feed=feed, guid=str(day), title='Post {}'.format(day),
+                description=description,
+                published=datetime(2015, 6, day + 1, tzinfo=timezone.utc))
+        self.assertSequenceEqual(
+            [post.title for post in self.community.get_latest_posts()],
+            ['Post 2', 'Post 0'])
+
+    def test_community_blog_post_descriptions_are_rendered(self):
+        """
+        The description of a BlogPost in a Community's category should be
+        stored sanitized, while other BlogPosts are left alone.
+
+        """
+        description = '<p onclick="evil()">Hi</p><script>evil()</script>'
+        user = User.objects.create()
+        blog_post = BlogPost.objects.create(
+            title='Blog Post', user=user, gen_description=False,
+            description=description)
+        other_post = BlogPost.objects.create(
+            title='Other Post', user=user, gen_description=False,
+            description=description)
+        blog_post.categories.add(self.community.blog_category)
+        other_post.categories.add(BlogCategory.objects.create(title='News'))
+
+        self.assertEqual(BlogPost.objects.get(id=blog_post.id).description,
+                         '<p>Hi</p>evil()')
+        self.assertEqual(BlogPost.objects.get(id=other_post.id).description,
+                         description)
+        self.assertEqual(
+            [post.description for post in self.community.get_latest_posts()],
+            ['<p>Hi</p>evil()'])
+
+    def test_render_description(self):
+        """Descriptions should be sanitized & empty ones should be blank."""
+        self.assertEqual(render_description('<b>Hi</b><iframe></iframe>'),
+                         '<b>Hi</b>')
+        self.assertEqual(render_description(' <p><br></p> '), '')
+        self.assertEqual(render_description(None), '')
+
+    def test_get_latest_posts_cost_is_flat(self):
+        """
+        The number of queries made by get_latest_posts should not grow with
+        the size of the Community's blog history.
+        """
+        user = User.objects.create()
+
+        def add_blog_posts(count):
+            """Add ``count`` more BlogPosts to the Community."""
+            for _ in range(count):
+                blog_post = BlogPost.objects.create(title='Post', user=user)
+                blog_post.categories.add(self.community.blog_category)
+
+        add_blog_posts(10)
+        with CaptureQueriesContext(connection) as context:
+            self.community.get_latest_posts()
+        add_blog_posts(40)
+        with self.assertNumQueries(len(context.captured_queries)):
+            self.assertEqual(len(self.community.get_latest_posts()), 5)
 
     def test_category_not_deleted_with_community(self):
         """The BlogCategory should remain if the Community is deleted."""
@@ -64,30 +317,462 @@ class CommunityModelTests(TestCase):
 class CommunityFeedModelTests(TestCase):
     """Test the CommunityFeed Model Methods."""
     def setUp(self):
-        """Create a Community and RSS Feed."""
+        """Serve a Feed locally and create a CommunityFeed for it."""
+        self.server = FeedServer(build_test_feed(
+            ['Newest Post', 'Middle Post', 'Oldest Post']))
+        self.server.start()
         self.community = Community.objects.create(
             membership_status=Community.MEMBER, title="Dreamland")
         self.feed = CommunityFeed.objects.create(
-            community=self.community,
-            url="http://www.feedforall.com/sample-feed.xml")
+            community=self.community, url=self.server.url)
+
+    def tearDown(self):
+        """Stop the Feed server."""
+        self.server.stop()
+
+    def test_fetch_returns_feeds_posts(self):
+        """Fetching should return all posts from the CommunityFeed."""
+        _, parsed_feed, _, _ = fetch_all([self.feed])[0]
+        self.assertEqual([post.title for _, post in parsed_feed.posts],
+                         ['Newest Post', 'Middle Post', 'Oldest Post'])
 
-    def test_get_feed_posts_returns_feeds_posts(self):
-        """get_feed_posts should return all posts from the CommunityFeed."""
-        bps = self.feed.get_feed_posts()
-        post_titles = [
-            'RSS Resources',
-            'Recommended Desktop Feed Reader Software',
-            'Recommended Web Based Feed Reader Software',
-        ]
-        self.assertEqual([post.title for post in bps], post_titles)
-
-    def test_get_feed_posts_respects_post_limit(self):
-        """get_latest_feed_posts should limit the items to the post_limit."""
+    def test_fetch_respects_post_limit(self):
+        """Fetching should limit the posts to the post_limit."""
         self.feed.post_limit = 1
         self.feed.save()
-        bps = self.feed.get_feed_posts()
-        post_titles = ['RSS Resources']
-        self.assertSequenceEqual([post.title for post in bps], post_titles)
+        _, parsed_feed, _, _ = fetch_all([self.feed])[0]
+        self.assertSequenceEqual(
+            [post.title for _, post in parsed_feed.posts], ['Newest Post'])
+
+
+class CommunityFeedEntryTests(TestCase):
+    """Test storing CommunityFeed posts as FeedEntries."""
+    def setUp(self):
+        """Serve a Feed locally and create a CommunityFeed for it."""
+        self.server = FeedServer(build_test_feed(
+            ['Newest Post', 'Middle Post', 'Oldest Post']))
+        self.server.start()
+        self.community = Community.objects.create(
+            membership_status=Community.MEMBER, title="Dreamland")
+        self.feed = CommunityFeed.objects.create(
+            community=self.community, url=self.server.url)
+
+    def tearDown(self):
+        """Stop the Feed server."""
+        self.server.stop()
+
+    def fetch_and_store(self):
+        """Fetch the Feed like ``fetch_feeds`` & store it's entries."""
+        _, parsed_feed, error, _ = fetch_all([self.feed])[0]
+        if error is not None:
+            raise error
+        return self.feed.store_entries(parsed_feed)
+
+    def test_store_entries_stores_posts(self):
+        """Each post in the Feed should be stored."""
+        self.assertEqual(self.fetch_and_store(), 3)
+        self.assertSequenceEqual(
+            [entry.title for entry in self.feed.entries.all()],
+            ['Newest Post', 'Middle Post', 'Oldest Post'])
+        entry = self.feed.entries.all()[0]
+        self.assertEqual(entry.link, 'http://www.example.com/newest-post/')
+        self.assertEqual(entry.description, 'The Newest Post post.')
+        self.assertEqual(entry.slash_comments, '2')
+        self.assertEqual(entry.via, 'example.com/')
+        self.assertEqual(entry.published,
+                         datetime(2015, 6, 28, 9, tzinfo=timezone.utc))
+
+    def test_fetch_respects_post_limit(self):
+        """Only up to post_limit posts should be stored."""
+        self.feed.post_limit = 2
+        self.feed.save()
+        self.fetch_and_store()
+        self.assertSequenceEqual(
+            [entry.title for entry in self.feed.entries.all()],
+            ['Newest Post', 'Middle Post'])
+
+    def test_store_entries_removes_old_posts(self):
+        """Posts no longer in the Feed should be removed."""
+        self.fetch_and_store()
+        self.server.body = build_test_feed(['Brand New Post', 'Newest Post'])
+        self.assertEqual(self.fetch_and_store(), 1)
+        self.assertSequenceEqual(
+            [entry.title for entry in self.feed.entries.all()],
+            ['Brand New Post', 'Newest Post'])
+
+    def test_failed_fetch_keeps_entries(self):
+        """A Feed that can't be fetched should keep it's stored entries."""
+        self.fetch_and_store()
+        self.server.body = 'Not Found'
+        self.server.status = 404
+        self.assertRaises(FeedError, self.fetch_and_store)
+        self.assertEqual(self.feed.entries.count(), 3)
+
+    def test_fetch_sends_etag(self):
+        """An unchanged Feed should be answered with a 304 & not parsed."""
+        self.server.etag = '"v1"'
+        self.assertEqual(self.fetch_and_store(), 3)
+        self.assertEqual(self.feed.etag, '"v1"')
+
+        self.assertIsNone(self.fetch_and_store())
+        self.assertEqual(self.feed.entries.count(), 3)
+        feed = CommunityFeed.objects.get(pk=self.feed.pk)
+        self.assertEqual(feed.full_fetch_count, 1)
+        self.assertEqual(feed.not_modified_count, 1)
+
+    def test_fetch_refetches_changed_feed(self):
+        """A Feed with a new ETag should be downloaded again."""
+        self.server.etag = '"v1"'
+        self.fetch_and_store()
+        self.server.etag = '"v2"'
+        self.server.body = build_test_feed(['Brand New Post'])
+        self.assertEqual(self.fetch_and_store(), 1)
+        self.assertEqual(self.feed.etag, '"v2"')
+        self.assertEqual(self.feed.full_fetch_count, 2)
+        self.assertEqual(self.feed.not_modified_count, 0)
+
+    def test_fetch_feeds_command_updates_all_feeds(self):
+        """The fetch_feeds command should store the posts of every Feed."""
+        other_community = Community.objects.create(title="Other Land")
+        CommunityFeed.objects.create(
+            community=other_community, url=self.server.url)
+        call_command('fetch_feeds', stdout=StringIO(), stderr=StringIO())
+        self.assertEqual(FeedEntry.objects.count(), 6)
+        self.assertEqual(len(other_community.get_latest_posts()), 3)
+
+
+class FeedFetchingTests(TestCase):
+    """Test fetching many Feeds at once."""
+    def setUp(self):
+        """Serve a slow Feed locally and create CommunityFeeds for it."""
+        self.server = FeedServer(build_test_feed(['Only Post']))
+        self.server.delay = 0.5
+        self.server.start()
+        community = Community.objects.create(title="Dreamland")
+        self.feeds = [
+            CommunityFeed.objects.create(community=community,
+                                         url=self.server.url)
+            for _ in range(4)]
+
+    def tearDown(self):
+        """Stop the Feed server."""
+        self.server.stop()
+
+    def test_fetch_all_fetches_in_parallel(self):
+        """The Feeds should be fetched at the same time."""
+        start = time.time()
+        results = fetch_all(self.feeds, workers=4)
+        self.assertLess(time.time() - start, 1.5)
+        self.assertEqual([result[0] for result in results], self.feeds)
+        self.assertTrue(all(error is None for _, _, error, _ in results))
+        self.assertTrue(all(parsed.posts[0][1].title == 'Only Post'
+                            for _, parsed, _, _ in results))
+
+    def test_fetch_all_times_out_slow_feeds(self):
+        """Feeds that take longer than the timeout should fail."""
+        self.server.delay = 2
+        results = fetch_all(self.feeds[:1], timeout=0.5)
+        _, parsed_feed, error, response_time = results[0]
+        self.assertIsNone(parsed_feed)
+        self.assertIsInstance(error, FeedError)
+        self.assertLess(response_time, 1.5)
+
+    def test_download_times_out_trickling_feeds(self):
+        """
+        A Feed sent slower than the timeout allows should fail, even if each
+        byte arrives before the socket times out.
+        """
+        self.server.delay = 0
+        self.server.drip_delay = 0.05
+        start = time.time()
+        self.assertRaises(FeedError, download, self.server.url, timeout=0.5)
+        self.assertLess(time.time() - start, 1.5)
+
+    def test_fetch_all_fetches_shared_urls_once(self):
+        """Feeds with the same normalized URL should only be fetched once."""
+        self.feeds[1].url = self.server.url.replace('http', 'HTTP', 1)
+        results = fetch_all(self.feeds)
+        self.assertEqual(self.server.request_count, 1)
+        self.assertEqual([result[0] for result in results], self.feeds)
+        self.assertEqual(len(set(id(parsed) for _, parsed, _, _ in results)),
+                         1)
+
+    def test_shared_feeds_respect_their_post_limits(self):
+        """Each Feed sharing a URL should store up to it's own post_limit."""
+        self.server.body = build_test_feed(['One', 'Two', 'Three'])
+        self.feeds[0].post_limit = 1
+        self.feeds[0].save()
+        call_command('fetch_feeds', stdout=StringIO())
+        self.assertEqual(self.server.request_count, 1)
+        self.assertEqual(self.feeds[0].entries.count(), 1)
+        self.assertEqual(self.feeds[1].entries.count(), 3)
+
+    def test_normalize_url(self):
+        """URLs differing only in case, port & fragment are the same."""
+        self.assertEqual(normalize_url('HTTP://Example.com:80#top'),
+                         'http://example.com/')
+        self.assertEqual(normalize_url('https://example.com:443/feed?a=1'),
+                         'https://example.com/feed?a=1')
+        self.assertNotEqual(normalize_url('http://example.com/Feed'),
+                            normalize_url('http://example.com/feed'))
+
+
+class FeedStreamingTests(TestCase):
+    """Test reading only as much of a Feed as is needed."""
+    def setUp(self):
+        """Serve a long Feed locally."""
+        self.titles = ['Post {}'.format(number) for number in range(25)]
+        self.server = FeedServer(build_test_feed(self.titles))
+        self.server.start()
+
+    def tearDown(self):
+        """Stop the Feed server."""
+        self.server.stop()
+
+    def test_download_stops_after_max_entries(self):
+        """The Feed should be truncated to a well-formed, shorter document."""
+        response = download(self.server.url, max_entries=2)
+        self.assertLess(len(response.body), len(self.server.body))
+        parsed_feed = feedparser.parse(response.body)
+        self.assertFalse(parsed_feed.bozo)
+        self.assertEqual([entry.title for entry in parsed_feed.entries],
+                         self.titles[:2])
+
+    def test_entry_counter_handles_split_chunks(self):
+        """Entries split across chunks should only be counted once closed."""
+        body = self.server.body
+        counter = EntryCounter(3)
+        for start in range(0, len(body), 7):
+            if counter.feed(body[start:start + 7]):
+                break
+        parsed_feed = feedparser.parse(counter.truncate(body[:start + 7]))
+        self.assertFalse(parsed_feed.bozo)
+        self.assertEqual(len(parsed_feed.entries), 3)
+
+    def test_unparseable_feeds_are_not_truncated(self):
+        """Feeds that are not well-formed XML should be read entirely."""
+        self.server.body = '<rss><channel><item>&nbsp;</item>' * 5
+        response = download(self.server.url, max_entries=1)
+        self.assertEqual(response.body, self.server.body)
+
+    @override_settings(FEED_MAX_BYTES=1024)
+    def test_oversized_feeds_fail(self):
+        """Feeds larger than FEED_MAX_BYTES should raise a FeedError."""
+        self.assertRaises(FeedError, download, self.server.url)
+
+    def test_fetch_reads_post_limit_entries(self):
+        """CommunityFeeds should only read up to their post_limit."""
+        feed = CommunityFeed(url=self.server.url, post_limit=4)
+        with ParserPool(1) as parser:
+            self.assertEqual(len(feed.fetch(parser).posts), 4)
+            with self.settings(FEED_MAX_ENTRIES=6):
+                feed.post_limit = None
+                self.assertEqual(len(feed.fetch(parser).posts), 6)
+
+
+class ParserPoolTests(TestCase):
+    """Test parsing Feeds in separate processes with limited resources."""
+    def setUp(self):
+        """Create a large Feed & a pool to parse it in."""
+        self.large_feed = FeedResponse(200, {}, build_test_feed(
+            ['Post {}'.format(number) for number in range(2000)]))
+        self.parser = ParserPool(1)
+
+    def tearDown(self):
+        """Stop the pool."""
+        self.parser.close()
+
+    def test_parse_returns_compact_posts(self):
+        """Parsing should return the posts as a picklable ParsedFeed."""
+        response = FeedResponse(200, {'etag': '"1"'},
+                                build_test_feed(['One', 'Two', 'Three']))
+        parsed_feed = self.parser.parse(response, 'http://example.com/', 2)
+        self.assertIsInstance(parsed_feed, ParsedFeed)
+        self.assertEqual(parsed_feed.etag, '"1"')
+        self.assertEqual([post.title for _, post in parsed_feed.posts],
+                         ['One', 'Two'])
+        self.assertEqual(pickle.loads(pickle.dumps(parsed_feed)), parsed_feed)
+
+    def test_invalid_feeds_raise_feed_errors(self):
+        """Errors in the worker process should be raised as FeedErrors."""
+        response = FeedResponse(200, {}, 'Not a Feed')
+        self.assertRaises(FeedError, self.parser.parse, response,
+                          'http://example.com/')
+
+    def test_slow_feeds_time_out(self):
+        """Feeds that take longer than the timeout should fail."""
+        self.parser.timeout = 0.01
+        with self.assertRaisesRegexp(FeedError, 'time'):
+            self.parser.parse(self.large_feed, 'http://example.com/')
+
+    def test_large_feeds_run_out_of_memory(self):
+        """Feeds needing more than the memory limit should fail."""
+        self.parser.close()
+        self.parser = ParserPool(1, memory=8 * 1024 * 1024)
+        response = FeedResponse(200, {}, build_test_feed(
+            ['Huge Post ' + 'word ' * 200 * 1000]))
+        with self.assertRaisesRegexp(FeedError, 'memory'):
+            self.parser.parse(response, 'http://example.com/')
+
+    def test_limits_reached_inside_feedparser_are_raised(self):
+        """Limits caught by feedparser should not be treated as bozo Feeds."""
+        def parse_until_alarm(*args, **kwargs):
+            """Return what feedparser does when it's parser is interrupted."""
+            return feedparser.FeedParserDict(
+                bozo=1, entries=[],
+                bozo_exception=feeds._LimitExceeded(signal.SIGALRM))
+
+        original_parse = feedparser.parse
+        feedparser.parse = parse_until_alarm
+        try:
+            self.assertRaises(feeds._LimitExceeded, feeds.parse,
+                              FeedResponse(200, {}, ''))
+        finally:
+            feedparser.parse = original_parse
+
+    def test_pool_survives_failures(self):
+        """Feeds should still be parsed after a Feed fails."""
+        self.parser.timeout = 0.01
+        self.assertRaises(FeedError, self.parser.parse, self.large_feed,
+                          'http://example.com/')
+        self.parser.timeout = 10
+        response = FeedResponse(200, {}, build_test_feed(['Only Post']))
+        parsed_feed = self.parser.parse(response, 'http://example.com/')
+        self.assertEqual(parsed_feed.posts[0][1].title, 'Only Post')
+
+    def test_unresponsive_workers_do_not_fail_other_feeds(self):
+        """
+        Only the worker of a Feed that stops responding should be killed,
+        so Feeds parsed by the other workers still succeed.
+        """
+        original_parse_posts = feeds.parse_posts
+
+        def parse_posts_slowly(response, url, max_entries=None):
+            """Ignore the parsing time limit & take too long for one url."""
+            signal.signal(signal.SIGALRM, signal.SIG_IGN)
+            time.sleep(5 if url == 'http://example.com/stuck/' else 1)
+            return original_parse_posts(response, url, max_entries)
+
+        feeds.parse_posts = parse_posts_slowly
+        try:
+            parser = ParserPool(2, timeout=0.5)
+        finally:
+            feeds.parse_posts = original_parse_posts
+        response = FeedResponse(200, {}, build_test_feed(['Only Post']))
+        results = {}
+
+        def parse(url):
+            """Store the result of parsing the url."""
+            try:
+                results[url] = parser.parse(response, url)
+            except FeedError as error:
+                results[url] = error
+
+        stuck = threading.Thread(target=parse,
+                                 args=('http://example.com/stuck/',))
+        stuck.start()
+        time.sleep(1)
+        try:
+            parse('http://example.com/')
+            stuck.join()
+        finally:
+            parser.close()
+        self.assertIsInstance(results['http://example.com/stuck/'], FeedError)
+        self.assertEqual(results['http://example.com/'].posts[0][1].title,
+                         'Only Post')
+
+
+@override_settings(FEED_POLL_MIN_INTERVAL=60, FEED_POLL_MAX_INTERVAL=600,
+                   FEED_FAILURE_MAX_BACKOFF=1000)
+class FeedSchedulingTests(TestCase):
+    """Test the adaptive polling of CommunityFeeds."""
+    def setUp(self):
+        """Serve a Feed locally and create a CommunityFeed for it."""
+        self.server = FeedServer(build_test_feed(['Only Post']))
+        self.server.start()
+        community = Community.objects.create(title="Dreamland")
+        self.feed = CommunityFeed.objects.create(
+            community=community, url=self.server.url, poll_interval=200)
+
+    def tearDown(self):
+        """Stop the Feed server."""
+        self.server.stop()
+
+    def assertNextPollIn(self, seconds):
+        """Assert that the Feed's next poll is in about ``seconds``."""
+        expected = timezone.now() + timedelta(seconds=seconds)
+        self.assertLess(abs(self.feed.next_poll - expected),
+                        timedelta(seconds=5))
+
+    def test_new_posts_poll_more_often(self):
+        """Feeds with new posts should have their interval halved."""
+        self.feed.record_success(2, 1.0)
+        self.assertEqual(self.feed.poll_interval, 100)
+        self.assertNextPollIn(100)
+        for _ in range(3):
+            self.feed.record_success(1, 1.0)
+        self.assertEqual(self.feed.poll_interval, 60)
+
+    def test_no_new_posts_poll_less_often(self):
+        """Feeds without new posts should have their interval grown."""
+        self.feed.record_success(0, 1.0)
+        self.assertEqual(self.feed.poll_interval, 300)
+        self.feed.record_success(None, 1.0)
+        self.assertEqual(self.feed.poll_interval, 450)
+        self.feed.record_success(None, 1.0)
+        self.assertEqual(self.feed.poll_interval, 600)
+        self.assertNextPollIn(600)
+
+    def test_failures_back_off_exponentially(self):
+        """Each failure should double the wait, up to the max back off."""
+        self.feed.record_failure(1.0)
+        self.assertEqual(self.feed.failure_count, 1)
+        self.assertNextPollIn(120)
+        self.feed.record_failure(1.0)
+        self.assertNextPollIn(240)
+        for _ in range(5):
+            self.feed.record_failure(1.0)
+        self.assertNextPollIn(1000)
+
+    def test_success_resets_failures(self):
+        """A successful fetch should reset the failure count."""
+        self.feed.record_failure(1.0)
+        self.feed.record_success(0, 1.0)
+        self.assertEqual(self.feed.failure_count, 0)
+
+    def test_average_response_time(self):
+        """The average response time should be a moving average."""
+        self.feed.record_success(0, 1.0)
+        self.assertEqual(self.feed.average_response_time, 1.0)
+        self.feed.record_success(0, 2.0)
+        self.assertAlmostEqual(self.feed.average_response_time, 1.3)
+
+    def test_due_skips_backed_off_feeds(self):
+        """Feeds whose next poll is in the future should not be due."""
+        self.assertSequenceEqual(CommunityFeed.objects.due(), [self.feed])
+        self.feed.record_failure(1.0)
+        self.assertSequenceEqual(CommunityFeed.objects.due(), [])
+        self.feed.next_poll = timezone.now() - timedelta(seconds=1)
+        self.feed.save()
+        self.assertSequenceEqual(CommunityFeed.objects.due(), [self.feed])
+
+    def test_fetch_feeds_command_only_fetches_due_feeds(self):
+        """The fetch_feeds command should skip Feeds that aren't due."""
+        call_command('fetch_feeds', stdout=StringIO())
+        self.assertEqual(self.server.request_count, 1)
+        call_command('fetch_feeds', stdout=StringIO())
+        self.assertEqual(self.server.request_count, 1)
+        call_command('fetch_feeds', all=True, stdout=StringIO())
+        self.assertEqual(self.server.request_count, 2)
+
+    def test_fetch_feeds_command_backs_off_dead_feeds(self):
+        """The fetch_feeds command should record failed fetches."""
+        self.server.status = 500
+        call_command('fetch_feeds', stdout=StringIO(), stderr=StringIO())
+        feed = CommunityFeed.objects.get()
+        self.assertEqual(feed.failure_count, 1)
+        self.assertEqual(feed.entries.count(), 0)
+        self.assertGreater(feed.next_poll, timezone.now())
 
 
 class CommunityTagTests(TestCase):
@@ -104,8 +789,9 @@ class CommunityTagTests(TestCase):
 
     def test_newest_communities_has_no_allies(self):
         '''The community_newest_communities tag should not return Allies.'''
-        self.assertSequenceEqual(
-            community_newest_communities(), [self.member, self.in_dialog])
+        self.assertEqual(
+            set(entry.id for entry in community_newest_communities()),
+            set([self.member.id, self.in_dialog.id]))
 
     def test_newest_communities_hides_unpublished(self):
         '''
@@ -118,9 +804,27 @@ class CommunityTagTests(TestCase):
         published_member = Community.objects.create(
             title='published member', membership_status=Community.MEMBER)
 
+        self.assertEqual(
+            set(entry.id for entry in community_newest_communities()),
+            set([self.member.id, self.in_dialog.id, published_member.id]))
+
+    def test_newest_communities_are_ordered_by_date_joined(self):
+        '''
+        The community_newest_communities tag orders Communities by their
+        date_joined, with undated Communities last.
+        '''
+        self.member.date_joined = date(2015, 1, 1)
+        self.member.save()
+        newer = Community.objects.create(
+            title='newer', membership_status=Community.MEMBER,
+            date_joined=date(2015, 6, 1))
+
         self.assertSequenceEqual(
-            community_newest_communities(),
-            [self.member, self.in_dialog, published_member])
+            [entry.id for entry in community_newest_communities()],
+            [newer.id, self.member.id, self.in_dialog.id])
+        self.assertSequenceEqual(
+            [entry.id for entry in community_newest_communities(limit=1)],
+            [newer.id])
 
     def test_fec_members_hides_unpublished(self):
         '''The community_fec_members tag returns no unpublished Communities.'''
@@ -131,7 +835,8 @@ class CommunityTagTests(TestCase):
             title='published member', membership_status=Community.MEMBER)
 
         self.assertSequenceEqual(
-            community_fec_members(), [self.member, published_member])
+            [entry.id for entry in community_fec_members()],
+            [self.member.id, published_member.id])
 
     def test_community_in_dialog_hides_unpublished(self):
         '''
@@ -146,7 +851,22 @@ class CommunityTagTests(TestCase):
             title='published cid')
 
         self.assertSequenceEqual(
-            community_communities_in_dialog(), [self.in_dialog, published_cid])
+            [entry.id for entry in community_communities_in_dialog()],
+            [self.in_dialog.id, published_cid.id])
+
+    def test_directory_hides_expired_communities(self):
+        '''
+        The directory snapshot hides Communities that are scheduled or have
+        expired.
+        '''
+        now = timezone.now()
+        self.member.publish_date = now + timedelta(days=1)
+        self.member.save()
+        self.in_dialog.expiry_date = now - timedelta(days=1)
+        self.in_dialog.save()
+
+        self.assertSequenceEqual(community_fec_members(), [])
+        self.assertSequenceEqual(community_communities_in_dialog(), [])
 
     def test_community_random_hides_unpublished(self):
         '''The community_random tag returns no unpublished Communities.'''
@@ -161,6 +881,40 @@ class CommunityTagTests(TestCase):
         for _ in range(20):
             self.assertEqual(community_random(), self.member)
 
+    def test_community_random_image(self):
+        '''
+        The community_random_image tag returns one of the CommunityImages, or
+        None if there are none.
+        '''
+        self.assertEqual(community_random_image(), None)
+        image = CommunityImage.objects.create(
+            community=self.member, file='community-galleries/a.jpg')
+        self.assertEqual(community_random_image(), image)
+        image.delete()
+        self.assertEqual(community_random_image(), None)
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_random_tags_query_only_the_chosen_object(self):
+        '''
+        The random tags should only query the chosen object once their
+        candidates are cached.
+        '''
+        cache.clear()
+        self.member.full_description = 'something'
+        self.member.save()
+        for title in ('a.jpg', 'b.jpg', 'c.jpg'):
+            CommunityImage.objects.create(
+                community=self.member, file='community-galleries/' + title)
+        community_random()
+        community_random_image()
+
+        with self.assertNumQueries(1):
+            self.assertEqual(community_random(), self.member)
+        with self.assertNumQueries(1):
+            image = community_random_image()
+            self.assertEqual(image.community.title, self.member.title)
+
     def test_latest_posts_are_unique(self):
         '''
         The community_all_latest_posts tag returns no duplicate feed posts.
@@ -170,12 +924,130 @@ class CommunityTagTests(TestCase):
         user = User.objects.create()
         blog_post = BlogPost.objects.create(
             title="Thanks for All the Fish", user=user)
-        blog_post.categories.add(self.member.blog_category)
-        blog_post.categories.add(self.in_dialog.blog_category)
         blog_post.categories.add(self.ally.blog_category)
+        blog_post.categories.add(self.in_dialog.blog_category)
+        blog_post.categories.add(self.member.blog_category)
+        posts = community_all_latest_posts()
+        self.assertEqual(len(posts), 1)
+        self.assertEqual(posts[0].title, blog_post.title)
+        self.assertEqual(posts[0].link, blog_post.get_absolute_url())
+        self.assertEqual(posts[0].community, self.member)
+
+
+class TimelinePostTests(TestCase):
+    """Test maintaining the federation-wide timeline."""
+    def setUp(self):
+        """Create a Member & Ally Community with a Feed each."""
+        self.member = Community.objects.create(
+            title='member', membership_status=Community.MEMBER)
+        self.ally = Community.objects.create(
+            title='ally', membership_status=Community.ALLY)
+        self.member_feed = CommunityFeed.objects.create(
+            community=self.member, url='http://www.example.com/feed/')
+        self.ally_feed = CommunityFeed.objects.create(
+            community=self.ally, url='http://www.example.org/feed/')
+        self.user = User.objects.create()
+
+    def create_entry(self, feed, title, day=1):
+        """Create a FeedEntry published on the given day of June."""
+        return FeedEntry.objects.create(
+            feed=feed, guid=title, title=title,
+            link='http://www.example.com/{}/'.format(day),
+            published=datetime(2015, 6, day, tzinfo=timezone.utc))
+
+    def test_feed_entries_are_added(self):
+        """New FeedEntries should show up in the timeline, newest first."""
+        self.create_entry(self.member_feed, 'Older', 1)
+        self.create_entry(self.ally_feed, 'Newer', 2)
+        self.assertSequenceEqual(
+            [post.title for post in community_all_latest_posts()],
+            ['Newer', 'Older'])
+
+    def test_limit(self):
+        """Only the ``limit`` newest posts should be returned."""
+        for day in range(1, 6):
+            self.create_entry(self.member_feed, str(day), day)
+        self.assertSequenceEqual(
+            [post.title for post in community_all_latest_posts(limit=2)],
+            ['5', '4'])
+
+    def test_posts_per_community_are_capped(self):
+        """Each Community should only fill up to 5 of the posts."""
+        for day in range(1, 9):
+            self.create_entry(self.member_feed, str(day), day)
+        self.create_entry(self.ally_feed, 'Ally Post', 1)
+        self.assertSequenceEqual(
+            [post.title for post in community_all_latest_posts()],
+            ['8', '7', '6', '5', '4', 'Ally Post'])
+        self.assertSequenceEqual(
+            [post.title for post in
+             TimelinePost.objects.latest_posts(limit=2, per_community=1)],
+            ['8', 'Ally Post'])
+
+    def test_normalized_titles_are_deduplicated(self):
+        """Titles differing only in case & punctuation are duplicates."""
+        self.create_entry(self.ally_feed, 'Spring Gathering!', 1)
+        self.create_entry(self.member_feed, 'spring   gathering', 2)
+        posts = community_all_latest_posts()
+        self.assertEqual(len(posts), 1)
+        self.assertEqual(posts[0].community, self.member)
+
+    def test_deleting_canonical_post_promotes_duplicate(self):
+        """Deleting the shown post should show it's duplicate instead."""
+        self.create_entry(self.ally_feed, 'Spring Gathering', 1)
+        member_entry = self.create_entry(
+            self.member_feed, 'Spring Gathering', 2)
+        member_entry.delete()
+        posts = community_all_latest_posts()
+        self.assertEqual(len(posts), 1)
+        self.assertEqual(posts[0].community, self.ally)
+
+    def test_status_change_updates_canonical_post(self):
+        """A Community becoming a Member should have it's posts preferred."""
+        self.create_entry(self.member_feed, 'Spring Gathering', 1)
+        self.create_entry(self.ally_feed, 'Spring Gathering', 2)
+        self.member.membership_status = Community.ALLY
+        self.member.save()
+        self.ally.membership_status = Community.MEMBER
+        self.ally.save()
+        posts = community_all_latest_posts()
+        self.assertEqual(len(posts), 1)
+        self.assertEqual(posts[0].community, self.ally)
+
+    def test_unpublished_blog_posts_are_hidden(self):
+        """Draft BlogPosts should only be added once they're published."""
+        blog_post = BlogPost.objects.create(
+            title='Draft', user=self.user, status=CONTENT_STATUS_DRAFT)
+        blog_post.categories.add(self.member.blog_category)
+        self.assertSequenceEqual(community_all_latest_posts(), [])
+        blog_post.status = CONTENT_STATUS_PUBLISHED
+        blog_post.save()
         self.assertSequenceEqual(
-            community_all_latest_posts(),
-            [convert_to_feed_post(blog_post, self.member)])
+            [post.title for post in community_all_latest_posts()], ['Draft'])
+
+    def test_removed_blog_categories_are_removed(self):
+        """BlogPosts removed from a Community's category are removed."""
+        blog_post = BlogPost.objects.create(title='Post', user=self.user)
+        blog_post.categories.add(self.member.blog_category)
+        blog_post.categories.remove(self.member.blog_category)
+        self.assertSequenceEqual(community_all_latest_posts(), [])
+        self.member.blog_category.blogposts.add(blog_post)
+        self.assertEqual(len(community_all_latest_posts()), 1)
+        self.member.blog_category.blogposts.clear()
+        self.assertSequenceEqual(community_all_latest_posts(), [])
+
+    def test_rebuild_timeline_command(self):
+        """The rebuild_timeline command should recreate every post."""
+        self.create_entry(self.ally_feed, 'Spring Gathering', 1)
+        self.create_entry(self.member_feed, 'Spring Gathering', 2)
+        blog_post = BlogPost.objects.create(title='Post', user=self.user)
+        blog_post.categories.add(self.ally.blog_category)
+        TimelinePost.objects.all().delete()
+        call_command('rebuild_timeline', stdout=StringIO())
+        posts = community_all_latest_posts()
+        self.assertSequenceEqual([post.title for post in posts],
+                                 ['Post', 'Spring Gathering'])
+        self.assertEqual(posts[1].community, self.member)
 
 
 class CommunityDetailViewTests(TestCase):
@@ -220,6 +1092,63 @@ class CommunityDetailViewTests(TestCase):
                     kwargs={'slug': self.ally.slug}))
         self.assertRedirects(response, self.ally.get_absolute_url())
 
+    def test_blog_posts_use_constant_queries(self):
+        """
+        The number of queries made by the detail page should not depend on
+        the number of the Community's BlogPosts.
+        """
+        url = self.community.get_absolute_url()
+
+        def add_blog_posts(count):
+            """Add ``count`` more BlogPosts by different authors."""
+            for _ in range(count):
+                user = User.objects.create(username=str(User.objects.count()))
+                blog_post = BlogPost.objects.create(title='Post', user=user)
+                blog_post.categories.add(self.community.blog_category)
+
+        add_blog_posts(1)
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        add_blog_posts(6)
+        with self.assertNumQueries(len(context.captured_queries)):
+            self.client.get(url)
+
+    def test_detail_view_has_a_fixed_query_budget(self):
+        """
+        The detail page should render in a fixed number of queries, no
+        matter how many Documents, Images & Feeds the Community has.
+        """
+        url = self.community.get_absolute_url()
+        categories = [DocumentCategory.objects.create(title=title)
+                      for title in ('Bylaws', 'Agreements')]
+
+        def add_related(count):
+            """Add ``count`` more Documents, Images & Feeds."""
+            for _ in range(count):
+                number = self.community.images.count()
+                Document.objects.create(
+                    title='Document {}'.format(number), contents='Text',
+                    community=self.community,
+                    category=categories[number % 2])
+                CommunityImage.objects.create(
+                    community=self.community,
+                    file='community-galleries/{}.jpg'.format(number))
+                CommunityFeed.objects.create(
+                    community=self.community,
+                    url='http://www.example.com/{}/feed/'.format(number))
+
+        add_related(1)
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        add_related(5)
+        with self.assertNumQueries(len(context.captured_queries)):
+            response = self.client.get(url)
+        self.assertContains(response, 'Document 5')
+        self.assertContains(response, 'Agreements')
+        self.assertContains(response, 'href="#gallery"')
+        # The sidebars & Latest Updates are not cached by the test settings
+        self.assertLessEqual(len(context.captured_queries), 18)
+
     def test_ally_detail_redirects_others(self):
         """
         The AllyCommunityDetail view should redirect to the proper view if the
@@ -236,6 +1165,191 @@ class CommunityDetailViewTests(TestCase):
         self.assertRedirects(
             response, self.community_in_dialog.get_absolute_url())
 
+    def get_community_queries(self, url):
+        """Return the SQL of the queries for a Community made by a GET."""
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        return response, [query['sql'] for query in context.captured_queries
+                          if '"communities_community"."slug" =' in
+                          query['sql']]
+
+    def test_detail_view_queries_community_once(self):
+        """The Community should only be fetched once by the detail view."""
+        response, queries = self.get_community_queries(
+            self.community.get_absolute_url())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(queries), 1)
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_redirects_do_not_query_community(self):
+        """Wrong-status URLs should be redirected using the cached URLs."""
+        cache.clear()
+        get_community_urls()
+        url = reverse('community_detail', kwargs={'slug': self.ally.slug})
+        response, queries = self.get_community_queries(url)
+        self.assertRedirects(response, self.ally.get_absolute_url())
+        self.assertEqual(queries, [])
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_community_urls_are_updated(self):
+        """Changing a Community's status should update the cached URLs."""
+        cache.clear()
+        self.assertEqual(get_community_urls()[self.ally.slug],
+                         (Community.ALLY, self.ally.get_absolute_url()))
+        self.ally.membership_status = Community.MEMBER
+        self.ally.save()
+        self.assertEqual(get_community_urls()[self.ally.slug],
+                         (Community.MEMBER, self.ally.get_absolute_url()))
+        self.ally.delete()
+        self.assertNotIn(self.ally.slug, get_community_urls())
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_sidebar_uses_directory(self):
+        """The sidebar's Communities should be read from the directory."""
+        cache.clear()
+        self.community.number_of_adults = 7
+        self.community.general_location = 'Virginia'
+        self.community.save()
+        url = self.community.get_absolute_url()
+        self.client.get(url)
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(url)
+        self.assertContains(response, 'Dreamland 2')
+        self.assertContains(response, 'in <span class="location">Virginia')
+        self.assertFalse(any(
+            '"communities_community"."membership_status" =' in query['sql']
+            for query in context.captured_queries))
+
+    def test_directory_entries_store_a_short_summary(self):
+        """
+        Directory entries should only store the start of a Community's
+        description as plain text, and render like the Community in blurbs.
+        """
+        self.community.full_description = '<p>{}</p>'.format(
+            ' '.join(['<b>word</b>'] * 60))
+        self.community.save()
+        entry = [entry for entry in get_community_directory()
+                 if entry.id == self.community.id][0]
+        self.assertEqual(entry.summary, ' '.join(['word'] * 50) + ' ...')
+        template = Template(
+            '{% load communities_tags %}'
+            '{% community_blurb community truncate_description_at=25 %}')
+        self.assertEqual(
+            template.render(Context({'community': entry})),
+            template.render(Context({'community': self.community})))
+
+    @override_settings(CACHES={'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_directory_is_updated(self):
+        """Saving or deleting a Community should update the directory."""
+        cache.clear()
+        self.assertEqual(len(get_community_directory()), 3)
+        self.community.title = 'Renamed'
+        self.community.save()
+        self.assertIn('Renamed',
+                      [entry.title for entry in get_community_directory()])
+        self.ally.delete()
+        self.assertEqual(len(get_community_directory()), 2)
+        self.community.status = CONTENT_STATUS_DRAFT
+        self.community.save()
+        self.assertEqual([entry.id for entry in get_community_directory()],
+                         [self.community_in_dialog.id])
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class LatestPostsCacheTests(TestCase):
+    """Test invalidating the cached Latest Updates fragments."""
+    def setUp(self):
+        """Create a Community with a Feed & clear the cache."""
+        cache.clear()
+        self.community = Community.objects.create(
+            membership_status=Community.MEMBER, title="Dreamland")
+        self.feed = CommunityFeed.objects.create(
+            community=self.community, url='http://www.example.com/feed/')
+        self.user = User.objects.create()
+
+    def test_new_blog_post_invalidates_detail_page(self):
+        """A new BlogPost should be shown on the cached Community page."""
+        url = self.community.get_absolute_url()
+        self.assertNotContains(self.client.get(url), 'New Blog Post')
+        blog_post = BlogPost.objects.create(
+            title='New Blog Post', user=self.user)
+        blog_post.categories.add(self.community.blog_category)
+        self.assertContains(self.client.get(url), 'New Blog Post')
+        blog_post.delete()
+        self.assertNotContains(self.client.get(url), 'New Blog Post')
+
+    def test_new_feed_entry_invalidates_latest_updates_widget(self):
+        """A newly ingested FeedEntry should be shown in the timeline."""
+        url = reverse('community_list')
+        self.assertNotContains(self.client.get(url), 'New Feed Post')
+        FeedEntry.objects.create(
+            feed=self.feed, guid='1', title='New Feed Post',
+            description='<p>Hi</p>', published=timezone.now())
+        self.assertContains(self.client.get(url), 'New Feed Post')
+
+    def test_feed_changes_invalidate_community_posts(self):
+        """Editing or removing a Feed should change the cache version."""
+        version = get_version('feed_posts', self.community.pk)
+        self.feed.url = 'http://www.example.com/other-feed/'
+        self.feed.save()
+        new_version = get_version('feed_posts', self.community.pk)
+        self.assertNotEqual(version, new_version)
+        self.feed.delete()
+        self.assertNotEqual(new_version,
+                            get_version('feed_posts', self.community.pk))
+
+    def test_unchanged_feed_entries_keep_the_cache(self):
+        """Refetching unchanged posts should not invalidate the cache."""
+        post = FeedPost(
+            title='Feed Post', published=datetime(2015, 6, 1), author='',
+            description='<p>Hi</p>', link='http://www.example.com/post/',
+            comments='', slash_comments='', via='', community_id=None)
+        parsed_feed = ParsedFeed(200, '', '', (('1', post),))
+        self.feed.store_entries(parsed_feed)
+        version = get_version('all_latest_posts')
+
+        self.assertEqual(self.feed.store_entries(parsed_feed), 0)
+        self.assertEqual(version, get_version('all_latest_posts'))
+
+        edited_post = post._replace(title='Edited Post')
+        self.feed.store_entries(
+            ParsedFeed(200, '', '', (('1', edited_post),)))
+        self.assertNotEqual(version, get_version('all_latest_posts'))
+        self.assertEqual(self.feed.entries.get().title, 'Edited Post')
+
+    def test_edited_feed_entry_descriptions_invalidate_the_cache(self):
+        """
+        Changing only an entry's description should invalidate the cached
+        posts, even though it's TimelinePost does not change.
+        """
+        post = FeedPost(
+            title='Feed Post', published=datetime(2015, 6, 1), author='',
+            description='<p>Hi</p>', link='http://www.example.com/post/',
+            comments='', slash_comments='2', via='', community_id=None)
+        self.feed.store_entries(ParsedFeed(200, '', '', (('1', post),)))
+        community_version = get_version('feed_posts', self.community.id)
+        version = get_version('all_latest_posts')
+
+        edited_post = post._replace(description='<p>Bye</p>')
+        self.feed.store_entries(
+            ParsedFeed(200, '', '', (('1', edited_post),)))
+        self.assertNotEqual(
+            community_version, get_version('feed_posts', self.community.id))
+        self.assertNotEqual(version, get_version('all_latest_posts'))
+        self.assertEqual(
+            self.feed.entries.get().description, '<p>Bye</p>')
+
+    def test_polling_a_feed_does_not_invalidate_posts(self):
+        """Saving a Feed's polling information should keep the cache."""
+        version = get_version('all_latest_posts')
+        self.feed.record_success(None, 0.5)
+        self.assertEqual(version, get_version('all_latest_posts'))
+
 
 class CommunityListViewTests(TestCase):
     """Test the ListViews Associated with the Community Model."""
@@ -274,3 +1388,149 @@ class CommunityListViewTests(TestCase):
             [self.jalad], response.context['community_list'])
         self.assertSequenceEqual([], response.context['in_dialog_list'])
         self.assertSequenceEqual([], response.context['ally_list'])
+
+    def test_communities_are_fetched_in_one_query(self):
+        """
+        The CommunityList view should fetch every list in a single query
+        that only selects the fields it needs.
+        """
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(reverse('community_list'))
+        list_queries = [
+            query['sql'] for query in context.captured_queries
+            if 'ORDER BY "communities_community"."title"' in query['sql'] and
+            '"communities_community"."publish_date" <=' in query['sql']]
+        self.assertEqual(len(list_queries), 1)
+        self.assertNotIn('"full_description"', list_queries[0])
+
+        for status in (Community.MEMBER, Community.COMMUNITY_IN_DIALOG,
+                       Community.ALLY):
+            Community.objects.create(
+                title="Another {}".format(status), membership_status=status)
+        with self.assertNumQueries(len(context.captured_queries)):
+            self.client.get(reverse('community_list'))
+
+
+class ThumbnailTests(TestCase):
+    """Test precomputing the thumbnails of Community images."""
+    def setUp(self):
+        """Create an image in a temporary MEDIA_ROOT."""
+        self.media_root = tempfile.mkdtemp()
+        self.media_settings = self.settings(MEDIA_ROOT=self.media_root)
+        self.media_settings.enable()
+        os.mkdir(os.path.join(self.media_root, 'community-galleries'))
+        self.image_name = 'community-galleries/sunrise.png'
+        Image.new('RGB', (800, 600), '#f80').save(
+            os.path.join(self.media_root, self.image_name))
+        self.community = Community.objects.create(title='Dreamland')
+
+    def tearDown(self):
+        """Remove the temporary MEDIA_ROOT."""
+        wait_for_thumbnails()
+        self.media_settings.disable()
+        shutil.rmtree(self.media_root)
+
+    def assertThumbnailsExist(self, sizes):
+        """Assert that the image has every variant of each size."""
+        for size in sizes:
+            for width, height in get_variant_sizes(*size):
+                for extension in (None, '.webp'):
+                    thumb_url, thumb_path = get_thumbnail_paths(
+                        self.image_name, width, height, extension)
+                    self.assertTrue(os.path.exists(thumb_path))
+
+    def test_thumbnail_paths_match_mezzanine(self):
+        """The thumbnail paths should be the ones Mezzanine generates."""
+        thumb_url, thumb_path = get_thumbnail_paths(self.image_name, 131, 75)
+        self.assertEqual(thumbnail(self.image_name, 131, 75), thumb_url)
+        self.assertTrue(os.path.exists(thumb_path))
+
+    def test_missing_thumbnail_uses_original_image(self):
+        """
+        A missing thumbnail should be queued, with the original image used
+        until it is generated.
+        """
+        self.assertEqual(get_picture(self.image_name, 50, 50).src,
+                         settings.MEDIA_URL + self.image_name)
+        wait_for_thumbnails()
+        self.assertEqual(
+            get_picture(self.image_name, 50, 50).src,
+            settings.MEDIA_URL + get_thumbnail_paths(
+                self.image_name, 50, 50)[0])
+
+    def test_saving_images_generates_thumbnails(self):
+        """Saving an image should generate every size the templates use."""
+        CommunityImage.objects.create(
+            community=self.community, file=self.image_name)
+        wait_for_thumbnails()
+        self.assertThumbnailsExist(GALLERY_IMAGE_SIZES)
+
+        self.community.profile_image = self.image_name
+        self.community.save()
+        wait_for_thumbnails()
+        self.assertThumbnailsExist(PROFILE_IMAGE_SIZES)
+
+    def test_picture_lists_generated_variants(self):
+        """
+        The picture of a thumbnail should list the generated variants in
+        the original format & as WebP.
+        """
+        picture = get_picture(self.image_name, 360, 215)
+        self.assertEqual(picture.src, settings.MEDIA_URL + self.image_name)
+        self.assertEqual(picture.srcset, '')
+        self.assertEqual(picture.webp_srcset, '')
+        wait_for_thumbnails()
+
+        picture = get_picture(self.image_name, 360, 215)
+        self.assertEqual(
+            picture.src, settings.MEDIA_URL + get_thumbnail_paths(
+                self.image_name, 360, 215)[0])
+        self.assertEqual(picture.srcset.count('.png '), 2)
+        self.assertIn('-180x107.png 180w', picture.srcset)
+        self.assertIn('-360x215.webp 360w', picture.webp_srcset)
+        self.assertEqual(picture.sizes, '(max-width: 360px) 100vw, 360px')
+        webp_path = get_thumbnail_paths(
+            self.image_name, 180, 107, '.webp')[1]
+        self.assertEqual(Image.open(webp_path).size, (180, 107))
+        self.assertEqual(Image.open(webp_path).format, 'WEBP')
+
+    def test_webp_variants_skipped_without_support(self):
+        """
+        If Pillow can't save WebP images, only the original format should be
+        generated, and existing thumbnails should not be queued again.
+        """
+        original_supported = thumbnails._webp_supported
+        thumbnails._webp_supported = False
+        try:
+            get_picture(self.image_name, 360, 215)
+            wait_for_thumbnails()
+            picture = get_picture(self.image_name, 360, 215)
+            self.assertEqual(thumbnails._queue.unfinished_tasks, 0)
+        finally:
+            thumbnails._webp_supported = original_supported
+        self.assertIn('-360x215.png 360w', picture.srcset)
+        self.assertEqual(picture.webp_srcset, '')
+        self.assertFalse(os.path.exists(get_thumbnail_paths(
+            self.image_name, 360, 215, '.webp')[1]))
+
+    def test_failed_webp_saves_are_removed(self):
+        """A WebP thumbnail that can't be saved should leave no files."""
+        path = get_thumbnail_paths(self.image_name, 50, 50, '.webp')[1]
+        with self.settings(WEBP_QUALITY='bad'):
+            self.assertRaises(
+                ValueError, thumbnails._save_webp,
+                Image.open(os.path.join(self.media_root, self.image_name)),
+                50, 50, path)
+        self.assertEqual(os.listdir(os.path.dirname(path)), [])
+
+    def test_command_generates_missing_thumbnails(self):
+        """The generate_thumbnails command should backfill thumbnails."""
+        Community.objects.filter(pk=self.community.pk).update(
+            profile_image=self.image_name)
+        output = StringIO()
+        call_command('generate_thumbnails', processes=2, stdout=output)
+        self.assertThumbnailsExist(PROFILE_IMAGE_SIZES)
+        self.assertEqual(
+            output.getvalue().strip(), '{} thumbnails generated for 1 '
+            'images'.format(2 * sum(len(get_variant_sizes(*size))
+                                    for size in PROFILE_IMAGE_SIZES)))
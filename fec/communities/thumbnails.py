@@ -0,0 +1,306 @@
+"""This module precomputes the thumbnails of Community images.
+
+Every size that the templates show is generated when an image is saved, by a
+background thread, or by the ``generate_thumbnails`` command. Each size has
+smaller variants, in the original format & as WebP, so browsers can pick the
+smallest file that fits the screen. WebP variants are skipped if Pillow
+can't save WebP images. Templates use :func:`get_picture`, which only checks
+whether the thumbnails exist, so a request never has to resize an image.
+Until a thumbnail is generated, the original image is used instead.
+
+.. attribute:: PROFILE_IMAGE_SIZES
+
+    The ``(width, height)`` of each :attr:`~.models.Community.profile_image`
+    thumbnail used by the templates.
+
+.. attribute:: GALLERY_IMAGE_SIZES
+
+    The ``(width, height)`` of each :class:`~.models.CommunityImage`
+    thumbnail used by the templates.
+
+.. attribute:: VARIANT_SCALES
+
+    The scales of the variants generated for each thumbnail size.
+
+"""
+from collections import namedtuple
+from io import BytesIO
+import logging
+import os
+import Queue
+import threading
+import urllib
+
+from django.core.files.storage import default_storage
+from mezzanine.conf import settings
+from mezzanine.core.templatetags.mezzanine_tags import thumbnail
+from PIL import Image, ImageOps
+
+
+PROFILE_IMAGE_SIZES = ((600, 0), (400, 250), (85, 85))
+GALLERY_IMAGE_SIZES = ((131, 75), (360, 215))
+VARIANT_SCALES = (0.5, 1)
+
+logger = logging.getLogger(__name__)
+
+_queue = Queue.Queue()
+_pending = set()
+_lock = threading.Lock()
+_worker = None
+_webp_supported = None
+
+
+class Picture(namedtuple('Picture', [
+        'src', 'srcset', 'webp_srcset', 'sizes'])):
+    """The URLs of a thumbnail & it's variants, for a ``<picture>`` tag.
+
+    ``srcset`` lists the variants in the original format & ``webp_srcset``
+    the WebP variants. Both only include variants that have been generated.
+
+    """
+    __slots__ = ()
+
+
+def supports_webp():
+    """Return whether Pillow can save WebP images.
+
+    A tiny image is saved the first time this is called, since older Pillow
+    releases can't be asked which formats they support.
+
+    :rtype: bool
+
+    """
+    global _webp_supported
+    if _webp_supported is None:
+        try:
+            Image.new('RGB', (1, 1)).save(BytesIO(), 'WEBP')
+        except (IOError, KeyError):
+            _webp_supported = False
+        else:
+            _webp_supported = True
+    return _webp_supported
+
+
+def get_image_name(image_url):
+    """Return the path of an image, relative to the ``MEDIA_ROOT``."""
+    image_name = urllib.unquote(str(image_url)).split('?')[0]
+    if image_name.startswith(settings.MEDIA_URL):
+        image_name = image_name.replace(settings.MEDIA_URL, '', 1)
+    return image_name
+
+
+def get_variant_sizes(width, height):
+    """Return the ``(width, height)`` of each variant of a thumbnail size.
+
+    Sizes without a width only have a single variant.
+
+    """
+    if not width:
+        return [(width, height)]
+    return sorted(set(
+        (int(width * scale), int(height * scale)) for scale in VARIANT_SCALES))
+
+
+def get_thumbnail_paths(image_url, width, height, extension=None):
+    """Return the URL & file path of an image's thumbnail.
+
+    These match the paths used by Mezzanine's ``thumbnail`` tag, so the
+    thumbnails it generates are found.
+
+    :param image_url: The URL or path of the original image.
+    :type image_url: string
+    :param width: The width of the thumbnail.
+    :type width: int
+    :param height: The height of the thumbnail.
+    :type height: int
+    :param extension: The extension of the thumbnail's format, defaulting to
+                      the original image's.
+    :type extension: string
+    :returns: The thumbnail's URL, relative to the ``MEDIA_URL``, & it's
+              absolute path.
+    :rtype: tuple
+
+    """
+    image_name = get_image_name(image_url)
+    image_dir, base_name = os.path.split(image_name)
+    prefix, image_extension = os.path.splitext(base_name)
+    thumb_name = '{}-{}x{}{}'.format(
+        prefix, width, height, extension or image_extension)
+    thumb_path = os.path.join(settings.MEDIA_ROOT, image_dir,
+                              settings.THUMBNAILS_DIR_NAME, base_name,
+                              thumb_name)
+    thumb_url = '{}/{}/{}'.format(settings.THUMBNAILS_DIR_NAME,
+                                  urllib.quote(base_name),
+                                  urllib.quote(thumb_name))
+    if image_dir:
+        thumb_url = '{}/{}'.format(image_dir, thumb_url)
+    return thumb_url, thumb_path
+
+
+def get_picture(image_url, width, height):
+    """Return the URLs of a thumbnail's generated variants.
+
+    The thumbnail directory is listed once, instead of checking for each
+    variant. If the full size thumbnail in the original format is missing,
+    the size is queued for generation.
+
+    :param image_url: The URL or path of the original image.
+    :type image_url: string
+    :param width: The width of the thumbnail.
+    :type width: int
+    :param height: The height of the thumbnail.
+    :type height: int
+    :returns: The absolute URLs of the variants, or :obj:`None` if there is
+              no image.
+    :rtype: :class:`Picture`
+
+    """
+    if not image_url:
+        return None
+    thumb_url, thumb_path = get_thumbnail_paths(image_url, width, height)
+    try:
+        existing = set(os.listdir(os.path.dirname(thumb_path)))
+    except OSError:
+        existing = set()
+    srcsets = {None: [], '.webp': []}
+    extensions = [None, '.webp'] if supports_webp() else [None]
+    for variant_width, variant_height in get_variant_sizes(width, height):
+        for extension in extensions:
+            url, path = get_thumbnail_paths(
+                image_url, variant_width, variant_height, extension)
+            if os.path.basename(path) in existing:
+                srcsets[extension].append('{}{} {}w'.format(
+                    settings.MEDIA_URL, url, variant_width))
+    if os.path.basename(thumb_path) in existing:
+        src = thumb_url
+    else:
+        enqueue_thumbnails(image_url, [(width, height)])
+        src = get_image_name(image_url)
+    if not width:
+        return Picture('{}{}'.format(settings.MEDIA_URL, src), '', '', '')
+    return Picture(
+        src='{}{}'.format(settings.MEDIA_URL, src),
+        srcset=', '.join(srcsets[None]),
+        webp_srcset=', '.join(srcsets['.webp']),
+        sizes='(max-width: {0}px) 100vw, {0}px'.format(width),
+    )
+
+
+def generate_thumbnails(image_url, sizes):
+    """Generate the missing thumbnails of an image & their variants.
+
+    Variants that are larger than the original image are skipped, as are
+    the WebP variants if Pillow can't save them.
+
+    :param image_url: The URL or path of the original image.
+    :type image_url: string
+    :param sizes: The ``(width, height)`` of each thumbnail.
+    :type sizes: list of tuples
+    :returns: The number of thumbnails that were generated.
+    :rtype: int
+
+    """
+    image_name = get_image_name(image_url)
+    if not image_name or not default_storage.exists(image_name):
+        return 0
+    try:
+        with default_storage.open(image_name) as image_file:
+            image = Image.open(image_file)
+            image.load()
+    except (IOError, SyntaxError, ValueError):
+        return 0
+    generated = 0
+    for width, height in sizes:
+        for variant_width, variant_height in get_variant_sizes(width, height):
+            if (variant_width, variant_height) != (width, height) and (
+                    variant_width > image.size[0] or
+                    variant_height > image.size[1]):
+                continue
+            thumb_url, thumb_path = get_thumbnail_paths(
+                image_name, variant_width, variant_height)
+            if not os.path.exists(thumb_path) and thumbnail(
+                    image_name, variant_width, variant_height) == thumb_url:
+                generated += 1
+            webp_path = get_thumbnail_paths(
+                image_name, variant_width, variant_height, '.webp')[1]
+            if supports_webp() and not os.path.exists(webp_path):
+                _save_webp(image, variant_width, variant_height, webp_path)
+                generated += 1
+    return generated
+
+
+def enqueue_thumbnails(image_url, sizes):
+    """Generate the thumbnails of an image in a background thread.
+
+    :param image_url: The URL or path of the original image.
+    :type image_url: string
+    :param sizes: The ``(width, height)`` of each thumbnail.
+    :type sizes: list of tuples
+    :returns: :obj:`None`
+
+    """
+    global _worker
+    image_name = get_image_name(image_url)
+    if not image_name:
+        return
+    task = (image_name, tuple(sizes))
+    with _lock:
+        if task in _pending:
+            return
+        _pending.add(task)
+        if _worker is None or not _worker.is_alive():
+            _worker = threading.Thread(target=_generate_queued_thumbnails)
+            _worker.daemon = True
+            _worker.start()
+    _queue.put(task)
+
+
+def wait_for_thumbnails():
+    """Block until every queued thumbnail has been generated."""
+    _queue.join()
+
+
+def _save_webp(image, width, height, path):
+    """Resize & crop an image like Mezzanine's ``thumbnail``, saving it as
+    WebP.
+
+    The image is written to a temporary file first, so a partially written
+    thumbnail is never served. The temporary file is removed if the image
+    can't be saved.
+
+    """
+    if not width:
+        width = image.size[0] * height // image.size[1]
+    elif not height:
+        height = image.size[1] * width // image.size[0]
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA')
+    resized = ImageOps.fit(image, (width, height), Image.ANTIALIAS)
+    directory = os.path.dirname(path)
+    if not os.path.exists(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            pass
+    temporary_path = '{}.tmp'.format(path)
+    try:
+        resized.save(temporary_path, 'WEBP', quality=settings.WEBP_QUALITY)
+        os.rename(temporary_path, path)
+    finally:
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+
+def _generate_queued_thumbnails():
+    """Generate the queued thumbnails, forever."""
+    while True:
+        task = _queue.get()
+        try:
+            generate_thumbnails(*task)
+        except Exception:
+            logger.exception('Could not generate the thumbnails of %s',
+                             task[0])
+        finally:
+            with _lock:
+                _pending.discard(task)
+            _queue.task_done()
@@ -1,8 +1,12 @@
 """This module contains views used to display Communities."""
-from django.shortcuts import get_object_or_404, redirect
+from collections import defaultdict
+
+from django.db.models import Prefetch
+from django.shortcuts import redirect
 from django.views.generic import DetailView, ListView
 
-from .models import Community
+from documents.models import Document
+from .models import Community, get_community_urls
 
 
 class PublishedCommunityMixin(object):
@@ -21,11 +25,53 @@ class AbstractCommunityDetail(PublishedCommunityMixin, DetailView):
     :func:`mezzanine.core.templatetags.mezzanine_tags.editable_loader`
     templatetag properly sets the ``ADMIN`` link.
 
+    Communities whose :attr:`~.models.Community.membership_status` does not
+    match the view's :attr:`membership_status` are redirected to their own
+    detail view. The cached :func:`~.models.get_community_urls` map is
+    checked first, so these redirects do not query the database, and
+    otherwise the Community is only queried once.
+
+    The Community's Documents, with their Categories, it's Images & it's
+    Feeds are prefetched into the ``document_list``, ``image_list`` &
+    ``feed_list`` attributes, so the page is rendered in a fixed number of
+    queries. The Documents are ordered by title & their ``contents`` are not
+    loaded.
+
     The default template is ``community/details.html``.
 
+    .. attribute:: membership_status
+
+        The :attr:`~.models.Community.membership_status` of the Communities
+        shown by the view.
+
     """
     context_object_name = "community"
     template_name = "communities/details.html"
+    membership_status = None
+
+    def get(self, request, *args, **kwargs):
+        """Show the Community, or redirect it if it has a different status."""
+        slug = kwargs.get(self.slug_url_kwarg)
+        status_and_url = get_community_urls().get(slug)
+        if (status_and_url is not None and
+                status_and_url[0] != self.membership_status):
+            return redirect(status_and_url[1])
+        self.object = self.get_object()
+        if self.object.membership_status != self.membership_status:
+            return redirect(self.object.get_absolute_url())
+        context = self.get_context_data(object=self.object)
+        return self.render_to_response(context)
+
+    def get_queryset(self):
+        """Prefetch the Community's Documents, Images & Feeds."""
+        documents = Document.objects.select_related('category').only(
+            'title', 'slug', 'community', 'category__title').order_by('title')
+        return super(AbstractCommunityDetail, self).get_queryset(
+        ).prefetch_related(
+            Prefetch('documents', queryset=documents, to_attr='document_list'),
+            Prefetch('images', to_attr='image_list'),
+            Prefetch('feeds', to_attr='feed_list'),
+        )
 
     def get_context_data(self, **kwargs):
         """Add the Community to the context as an ``editable_obj``."""
@@ -37,12 +83,7 @@ class AbstractCommunityDetail(PublishedCommunityMixin, DetailView):
 
 class CommunityDetail(AbstractCommunityDetail):
     """Shows the details of a published :class:`~.models.Community`."""
-    def get(self, request, slug, *args, **kwargs):
-        """Redirect non-Members to the correct detail view.."""
-        community = get_object_or_404(Community, slug=slug)
-        if community.membership_status != Community.MEMBER:
-            return redirect(community.get_absolute_url())
-        return super(CommunityDetail, self).get(request, slug, *args, **kwargs)
+    membership_status = Community.MEMBER
 
 
 class CommunityInDialogDetail(AbstractCommunityDetail):
@@ -52,13 +93,7 @@ class CommunityInDialogDetail(AbstractCommunityDetail):
     :attr:`~.models.Community.membership_status` attribute.
 
     """
-    def get(self, request, slug, *args, **kwargs):
-        """Redirect non-Communities-in-Dialog to the correct detail view.."""
-        community = get_object_or_404(Community, slug=slug)
-        if community.membership_status != Community.COMMUNITY_IN_DIALOG:
-            return redirect(community.get_absolute_url())
-        return super(CommunityInDialogDetail, self).get(
-            request, slug, *args, **kwargs)
+    membership_status = Community.COMMUNITY_IN_DIALOG
 
 
 class AllyCommunityDetail(AbstractCommunityDetail):
@@ -68,13 +103,7 @@ class AllyCommunityDetail(AbstractCommunityDetail):
     :attr:`~.models.Community.membership_status` attribute.
 
     """
-    def get(self, request, slug, *args, **kwargs):
-        """Redirect non-Allies to the correct detail view."""
-        community = get_object_or_404(Community, slug=slug)
-        if community.membership_status != Community.ALLY:
-            return redirect(community.get_absolute_url())
-        return super(AllyCommunityDetail, self).get(
-            request, slug, *args, **kwargs)
+    membership_status = Community.ALLY
 
 
 class CommunityList(PublishedCommunityMixin, ListView):
@@ -85,24 +114,43 @@ class CommunityList(PublishedCommunityMixin, ListView):
 
     * ``community_list`` - Member Communities
     * ``in_dialog_list`` - Communities in Dialog
+    * ``ally_list`` - Ally Communities
+
+    The published Communities are fetched with a single query, which only
+    selects the :attr:`thumbnail_fields`, and are then split into the lists
+    by their :attr:`~.models.Community.membership_status`.
 
     The default template is ``community/list.html``.
 
+    .. attribute:: thumbnail_fields
+
+        The fields used by the ``community_info_thumbnail_block``
+        templatetag & the Communities' URLs.
+
     """
     model = Community
     context_object_name = "community_list"
     template_name = "communities/list.html"
+    thumbnail_fields = (
+        'title', 'slug', 'membership_status', 'profile_image', 'year_founded',
+        'number_of_adults', 'number_of_children', 'general_location',
+        'short_description',
+    )
+
+    def get_queryset(self):
+        """Only select the fields needed by the Community thumbnails."""
+        return super(CommunityList, self).get_queryset().only(
+            *self.thumbnail_fields)
 
     def get_context_data(self, **kwargs):
-        """Modify the context to filter the Community lists."""
+        """Split the Communities into lists by their membership status."""
         context = super(CommunityList, self).get_context_data(**kwargs)
-        context['community_list'] = Community.objects.published(
-            for_user=self.request.user).filter(
-                membership_status=Community.MEMBER)
-        context['in_dialog_list'] = Community.objects.published(
-            for_user=self.request.user).filter(
-                membership_status=Community.COMMUNITY_IN_DIALOG)
-        context['ally_list'] = Community.objects.published(
-            for_user=self.request.user).filter(
-                membership_status=Community.ALLY)
+        communities_by_status = defaultdict(list)
+        for community in self.object_list:
+            communities_by_status[community.membership_status].append(
+                community)
+        context['community_list'] = communities_by_status[Community.MEMBER]
+        context['in_dialog_list'] = communities_by_status[
+            Community.COMMUNITY_IN_DIALOG]
+        context['ally_list'] = communities_by_status[Community.ALLY]
         return context
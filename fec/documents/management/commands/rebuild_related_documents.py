@@ -0,0 +1,21 @@
+"""Recompute the related Documents of every Document.
+
+The related Documents are updated as Documents are saved, so this only needs
+to be run after the scores are first installed, or to back-fill the lists
+that Documents were removed from.
+
+"""
+from django.core.management.base import BaseCommand
+
+from documents.models import RelatedDocument
+
+
+class Command(BaseCommand):
+    '''Rebuild the related Documents.'''
+    help = 'Recompute the related Documents of every Document'
+
+    def handle(self, *args, **options):
+        RelatedDocument.objects.rebuild()
+        if int(options.get('verbosity', 1)) > 0:
+            self.stdout.write('{} related Documents'.format(
+                RelatedDocument.objects.count()))
@@ -0,0 +1,20 @@
+"""Recompute the published Document count of every DocumentCategory.
+
+The counts are updated as Documents are saved & deleted, so this only needs
+to be run after bulk changes that skip ``save``, or periodically to follow
+Documents' publish & expiry dates.
+
+"""
+from django.core.management.base import BaseCommand
+
+from documents.models import DocumentCategory
+
+
+class Command(BaseCommand):
+    '''Repair the published Document counts.'''
+    help = 'Recompute the published Document count of every Category'
+
+    def handle(self, *args, **options):
+        repaired = DocumentCategory.objects.repair_document_counts()
+        if int(options.get('verbosity', 1)) > 0:
+            self.stdout.write('{} Category counts repaired'.format(repaired))
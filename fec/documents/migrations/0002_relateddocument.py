@@ -0,0 +1,96 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+CATEGORY_WEIGHT = 0.5
+LIMIT = 20
+
+
+def score_documents(apps, schema_editor):
+    """Relate the existing published Documents to every Document."""
+    Document = apps.get_model('documents', 'Document')
+    RelatedDocument = apps.get_model('documents', 'RelatedDocument')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    AssignedKeyword = apps.get_model('generic', 'AssignedKeyword')
+    categories = {}
+    published_ids = set()
+    for document_id, category_id, status in Document.objects.values_list(
+            'id', 'category_id', 'status'):
+        categories[document_id] = category_id
+        if status == 2:
+            published_ids.add(document_id)
+    keyword_ids = defaultdict(set)
+    content_type = ContentType.objects.filter(
+        app_label='documents', model='document').first()
+    if content_type is not None:
+        for document_id, keyword_id in AssignedKeyword.objects.filter(
+                content_type=content_type).values_list(
+                    'object_pk', 'keyword_id'):
+            keyword_ids[document_id].add(keyword_id)
+    by_category = defaultdict(set)
+    by_keyword = defaultdict(set)
+    for document_id in published_ids:
+        by_category[categories[document_id]].add(document_id)
+        for keyword_id in keyword_ids[document_id]:
+            by_keyword[keyword_id].add(document_id)
+    relations = []
+    for document_id, category_id in categories.items():
+        own_keyword_ids = keyword_ids[document_id]
+        candidate_ids = set(by_category[category_id])
+        for keyword_id in own_keyword_ids:
+            candidate_ids.update(by_keyword[keyword_id])
+        candidate_ids.discard(document_id)
+        scores = []
+        for candidate_id in candidate_ids:
+            other_keyword_ids = keyword_ids[candidate_id]
+            score = 0
+            if categories[candidate_id] == category_id:
+                score = CATEGORY_WEIGHT
+            all_keyword_ids = own_keyword_ids | other_keyword_ids
+            if all_keyword_ids:
+                score += (float(len(own_keyword_ids & other_keyword_ids)) /
+                          len(all_keyword_ids))
+            if score > 0:
+                scores.append((-score, candidate_id))
+        relations.extend(
+            RelatedDocument(document_id=document_id,
+                            related_document_id=candidate_id, score=-score)
+            for score, candidate_id in sorted(scores)[:LIMIT])
+    RelatedDocument.objects.bulk_create(relations, batch_size=500)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+        ('generic', '0002_auto_20141227_0224'),
+        ('documents', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RelatedDocument',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('score', models.FloatField()),
+                ('document', models.ForeignKey(related_query_name='relation', related_name='relations', to='documents.Document')),
+                ('related_document', models.ForeignKey(related_query_name='relation_to', related_name='relations_to', to='documents.Document')),
+            ],
+            options={
+                'ordering': ('-score', 'related_document__id'),
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='relateddocument',
+            unique_together=set([('document', 'related_document')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='relateddocument',
+            index_together=set([('document', 'score')]),
+        ),
+        migrations.RunPython(score_documents, migrations.RunPython.noop),
+    ]
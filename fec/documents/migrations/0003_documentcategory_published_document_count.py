@@ -0,0 +1,32 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def count_published_documents(apps, schema_editor):
+    DocumentCategory = apps.get_model('documents', 'DocumentCategory')
+    Document = apps.get_model('documents', 'Document')
+    counts = Document.objects.filter(status=2).order_by().values_list(
+        'category').annotate(Count('id'))
+    for category_id, count in counts:
+        DocumentCategory.objects.filter(id=category_id).update(
+            published_document_count=count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('documents', '0002_relateddocument'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='documentcategory',
+            name='published_document_count',
+            field=models.PositiveIntegerField(default=0, editable=False, db_index=True),
+        ),
+        migrations.RunPython(count_published_documents,
+                             migrations.RunPython.noop),
+    ]
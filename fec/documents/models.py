@@ -1,14 +1,22 @@
 """This module contains data models related to Documents."""
+from collections import defaultdict
 import random
 
+from django.contrib.contenttypes.models import ContentType
 from django.core.urlresolvers import reverse
-from django.db import models
-from django.db.models import Q
+from django.db import models, transaction
+from django.db.models import Count, F, Min
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
 from mezzanine.core.fields import RichTextField
-from mezzanine.core.models import Displayable, Slugged, Orderable
+from mezzanine.core.models import (
+    CONTENT_STATUS_PUBLISHED, Displayable, Slugged, Orderable)
+from mezzanine.generic.models import AssignedKeyword
 from mezzanine.utils.urls import admin_url
 
 from communities.models import Community
+from fec.cache import bump_version
 
 
 class Document(Displayable):
@@ -46,6 +54,8 @@ class Document(Displayable):
         help_text="The Category to put the Document under."
     )
 
+    search_fields = ('contents',)
+
     class Meta(object):
         """Order by Category, then Community, then Title."""
         ordering = ('category', 'community', 'title')
@@ -59,17 +69,79 @@ class Document(Displayable):
         """Return the detail page of the Document."""
         return reverse('document_detail', kwargs={'slug': self.slug})
 
-    def related_documents(self):
-        """Return 5 random Documents with the same category or tag."""
-        assigned_keywords = self.keywords.all()
-        keywords = [assigned.keyword for assigned in assigned_keywords]
-        documents = set(
-            Document.objects.filter((Q(keywords__keyword__in=keywords) |
-                                     Q(category=self.category)) &
-                                    (~Q(id=self.id)))
-        )
-        sample_size = 5 if len(documents) > 5 else len(documents)
-        return random.sample(documents, sample_size)
+    def save(self, *args, **kwargs):
+        """Save the Document & update the published Document counts.
+
+        The Category & status the Document had before are read in the same
+        transaction, so the counts of both it's old & new Categories stay
+        correct.
+
+        """
+        with transaction.atomic():
+            old_category_id = None
+            if self.pk is not None:
+                previous = Document.objects.select_for_update().filter(
+                    pk=self.pk, status=CONTENT_STATUS_PUBLISHED,
+                ).values_list('category_id', flat=True)
+                old_category_id = next(iter(previous), None)
+            super(Document, self).save(*args, **kwargs)
+            new_category_id = None
+            if self.status == CONTENT_STATUS_PUBLISHED:
+                new_category_id = self.category_id
+            if old_category_id != new_category_id:
+                _add_to_document_count(old_category_id, -1)
+                _add_to_document_count(new_category_id, 1)
+
+    def related_documents(self, limit=5, day=None):
+        """Return a daily selection of the most related published Documents.
+
+        The Documents are picked from the precomputed
+        :class:`RelatedDocument` scores. The selection only changes once a
+        day, so it can be cached.
+
+        :param limit: The maximum number of Documents to return.
+        :type limit: int
+        :param day: The day of the selection, defaulting to today.
+        :type day: :class:`datetime.date`
+        :returns: The related Documents, with their ``category`` loaded.
+        :rtype: list
+
+        """
+        if day is None:
+            day = timezone.localtime(timezone.now()).date()
+        documents = list(Document.objects.published().filter(
+            relation_to__document=self,
+        ).select_related('category').only(
+            'title', 'slug', 'category__title', 'category__slug',
+        ).order_by('-relation_to__score', 'id')[:RelatedDocument.LIMIT])
+        rotation = random.Random((self.id, day.toordinal()))
+        return rotation.sample(documents, min(limit, len(documents)))
+
+
+class DocumentCategoryManager(models.Manager):
+    """Maintains the published Document counts of Categories."""
+    def repair_document_counts(self):
+        """Recompute the published Document count of every Category.
+
+        The counts are fetched with a single query & only the Categories
+        whose count is wrong are updated.
+
+        :returns: The number of Categories that were updated.
+        :rtype: int
+
+        """
+        with transaction.atomic():
+            counts = dict(Document.objects.filter(
+                status=CONTENT_STATUS_PUBLISHED,
+            ).order_by().values_list('category').annotate(Count('id')))
+            repaired = 0
+            for category_id, count in self.select_for_update().values_list(
+                    'id', 'published_document_count'):
+                if counts.get(category_id, 0) != count:
+                    self.filter(id=category_id).update(
+                        published_document_count=counts.get(category_id, 0))
+                    repaired += 1
+        return repaired
 
 
 class DocumentCategory(Orderable, Slugged):
@@ -79,6 +151,12 @@ class DocumentCategory(Orderable, Slugged):
 
         The optional parent :class:`DocumentCategory`.
 
+    .. attribute:: published_document_count
+
+        The number of Documents in the Category with a published status. It
+        is updated when Documents are saved or deleted, but does not follow
+        their publish & expiry dates.
+
     """
     parent = models.ForeignKey(
         'self',
@@ -89,6 +167,10 @@ class DocumentCategory(Orderable, Slugged):
         help_text='The parent category, if any. Only one level of nesting is '
         'allowed.'
     )
+    published_document_count = models.PositiveIntegerField(
+        default=0, db_index=True, editable=False)
+
+    objects = DocumentCategoryManager()
 
     class Meta(object):
         """Set the colloquial name to ``Category``."""
@@ -105,3 +187,257 @@ class DocumentCategory(Orderable, Slugged):
     def get_admin_url(self):
         """Return the Category's Edit page."""
         return admin_url(self, "change", self.id)
+
+
+class RelatedDocumentManager(models.Manager):
+    """Maintains the precomputed :class:`RelatedDocument` scores."""
+    def update_for(self, document):
+        """Recompute the scores of a Document that changed.
+
+        The Document's own related Documents are recomputed, and it is
+        added to, moved in or removed from the related Documents of the
+        Documents it shares a Category or keyword with. Only published
+        Documents are related to others, so drafts never take the place of
+        published Documents. Documents it drops out of are not back-filled,
+        :meth:`rebuild` recomputes everything.
+
+        :param document: The saved Document.
+        :type document: :class:`Document`
+
+        """
+        keyword_ids = _get_keyword_ids([document.id]).get(document.id, set())
+        published = Document.objects.filter(status=CONTENT_STATUS_PUBLISHED)
+        candidate_ids = set(published.filter(
+            category_id=document.category_id).values_list('id', flat=True))
+        candidate_ids.update(AssignedKeyword.objects.filter(
+            content_type=ContentType.objects.get_for_model(Document),
+            keyword_id__in=keyword_ids).values_list('object_pk', flat=True))
+        candidate_ids.discard(document.id)
+        categories = dict(published.filter(
+            id__in=candidate_ids).values_list('id', 'category_id'))
+        scores = _score_candidates(
+            document.category_id, keyword_ids, categories,
+            _get_keyword_ids(categories))
+        with transaction.atomic():
+            self.filter(models.Q(document=document) |
+                        models.Q(related_document=document)).delete()
+            relations = [
+                self.model(document=document, related_document_id=related_id,
+                           score=score)
+                for related_id, score in _get_top_scores(scores)]
+            sizes = dict(
+                (row['document_id'], (row['count'], row['min_score']))
+                for row in self.filter(document_id__in=scores).order_by(
+                ).values('document_id').annotate(
+                    count=Count('id'), min_score=Min('score')))
+            full_ids = []
+            if document.status != CONTENT_STATUS_PUBLISHED:
+                scores = {}
+            for other_id, score in scores.items():
+                count, min_score = sizes.get(other_id, (0, 0))
+                if count < self.model.LIMIT or score > min_score:
+                    relations.append(self.model(
+                        document_id=other_id, related_document=document,
+                        score=score))
+                    if count >= self.model.LIMIT:
+                        full_ids.append(other_id)
+            self.bulk_create(relations)
+            self._trim(full_ids)
+        bump_version('related_documents')
+
+    def rebuild(self):
+        """Recompute the scores of every Document."""
+        categories = {}
+        published_ids = set()
+        for document_id, category_id, status in Document.objects.values_list(
+                'id', 'category_id', 'status'):
+            categories[document_id] = category_id
+            if status == CONTENT_STATUS_PUBLISHED:
+                published_ids.add(document_id)
+        keyword_ids = _get_keyword_ids()
+        by_category = defaultdict(set)
+        by_keyword = defaultdict(set)
+        for document_id in published_ids:
+            category_id = categories[document_id]
+            by_category[category_id].add(document_id)
+            for keyword_id in keyword_ids.get(document_id, ()):
+                by_keyword[keyword_id].add(document_id)
+        relations = []
+        for document_id, category_id in categories.items():
+            own_keyword_ids = keyword_ids.get(document_id, set())
+            candidate_ids = set(by_category[category_id])
+            for keyword_id in own_keyword_ids:
+                candidate_ids.update(by_keyword[keyword_id])
+            candidate_ids.discard(document_id)
+            scores = _score_candidates(
+                category_id, own_keyword_ids,
+                dict((candidate_id, categories[candidate_id])
+                     for candidate_id in candidate_ids), keyword_ids)
+            relations.extend(
+                self.model(document_id=document_id,
+                           related_document_id=related_id, score=score)
+                for related_id, score in _get_top_scores(scores))
+        with transaction.atomic():
+            self.all().delete()
+            self.bulk_create(relations, batch_size=500)
+        bump_version('related_documents')
+
+    def _trim(self, document_ids):
+        """Remove the lowest scores of Documents with too many scores."""
+        if not document_ids:
+            return
+        scores = defaultdict(list)
+        for relation_id, document_id, score, related_id in self.filter(
+                document_id__in=document_ids).values_list(
+                    'id', 'document_id', 'score', 'related_document_id'):
+            scores[document_id].append((-score, related_id, relation_id))
+        extra_ids = []
+        for document_scores in scores.values():
+            document_scores.sort()
+            extra_ids.extend(relation_id for _, _, relation_id in
+                             document_scores[self.model.LIMIT:])
+        self.filter(id__in=extra_ids).delete()
+
+
+class RelatedDocument(models.Model):
+    """A precomputed score of how related two Documents are.
+
+    The score is the Jaccard index of the Documents' keywords, plus the
+    :attr:`CATEGORY_WEIGHT` if they share a Category. Only the
+    :attr:`LIMIT` highest scores of each Document are kept, and they are
+    updated when a Document is saved, which includes changes to it's
+    keywords.
+
+    .. attribute:: CATEGORY_WEIGHT
+
+        The score added to Documents that share a Category.
+
+    .. attribute:: LIMIT
+
+        The number of related Documents kept for each Document.
+
+    .. attribute:: document
+
+        The :class:`Document` that the :attr:`related_document` is related
+        to.
+
+    .. attribute:: related_document
+
+        The :class:`Document` that is related.
+
+    .. attribute:: score
+
+        How related the Documents are.
+
+    """
+    CATEGORY_WEIGHT = 0.5
+    LIMIT = 20
+
+    document = models.ForeignKey(
+        Document, related_name='relations', related_query_name='relation')
+    related_document = models.ForeignKey(
+        Document, related_name='relations_to',
+        related_query_name='relation_to')
+    score = models.FloatField()
+
+    objects = RelatedDocumentManager()
+
+    class Meta(object):
+        """Order by the highest score."""
+        ordering = ('-score', 'related_document__id')
+        unique_together = ('document', 'related_document')
+        index_together = [('document', 'score')]
+
+    def __unicode__(self):
+        return u'{} -> {}'.format(self.document_id, self.related_document_id)
+
+    @classmethod
+    def get_score(cls, keyword_ids, other_keyword_ids, same_category):
+        """Score how related two Documents are.
+
+        :param keyword_ids: The ids of the first Document's Keywords.
+        :type keyword_ids: set
+        :param other_keyword_ids: The ids of the other Document's Keywords.
+        :type other_keyword_ids: set
+        :param same_category: Whether the Documents share a Category.
+        :type same_category: bool
+        :returns: The score, where 0 means the Documents are not related.
+        :rtype: float
+
+        """
+        score = cls.CATEGORY_WEIGHT if same_category else 0
+        all_keyword_ids = keyword_ids | other_keyword_ids
+        if all_keyword_ids:
+            score += (float(len(keyword_ids & other_keyword_ids)) /
+                      len(all_keyword_ids))
+        return score
+
+
+def _add_to_document_count(category_id, amount):
+    """Add to the published Document count of a Category, if there is one."""
+    if category_id is not None:
+        DocumentCategory.objects.filter(id=category_id).update(
+            published_document_count=F('published_document_count') + amount)
+
+
+def _get_keyword_ids(document_ids=None):
+    """Return the ids of the Keywords of Documents, by Document id."""
+    assigned = AssignedKeyword.objects.filter(
+        content_type=ContentType.objects.get_for_model(Document))
+    if document_ids is not None:
+        assigned = assigned.filter(object_pk__in=document_ids)
+    keyword_ids = defaultdict(set)
+    for document_id, keyword_id in assigned.values_list(
+            'object_pk', 'keyword_id'):
+        keyword_ids[document_id].add(keyword_id)
+    return keyword_ids
+
+
+def _score_candidates(category_id, keyword_ids, categories,
+                      keyword_ids_by_document):
+    """Score a Document against it's candidates, by candidate id."""
+    scores = {}
+    for candidate_id, candidate_category_id in categories.items():
+        score = RelatedDocument.get_score(
+            keyword_ids, keyword_ids_by_document.get(candidate_id, set()),
+            category_id == candidate_category_id)
+        if score > 0:
+            scores[candidate_id] = score
+    return scores
+
+
+def _get_top_scores(scores):
+    """Return the highest ``(document_id, score)`` pairs."""
+    return sorted(scores.items(), key=lambda item: (-item[1], item[0]))[
+        :RelatedDocument.LIMIT]
+
+
+@receiver(post_save, sender=Document)
+def update_related_documents(sender, instance, **kwargs):
+    """Update the related Documents when a Document or it's keywords change.
+
+    Mezzanine saves the Document when it's keywords change, to update it's
+    ``keywords_string``.
+
+    """
+    if not kwargs.get('raw'):
+        RelatedDocument.objects.update_for(instance)
+
+
+@receiver(post_delete, sender=Document)
+def remove_from_document_count(sender, instance, **kwargs):
+    """Decrement the published Document count when a Document is deleted.
+
+    Deletions send this signal inside their transaction.
+
+    """
+    if instance.status == CONTENT_STATUS_PUBLISHED:
+        _add_to_document_count(instance.category_id, -1)
+
+
+@receiver(post_save, sender=DocumentCategory)
+@receiver(post_delete, sender=DocumentCategory)
+@receiver(post_delete, sender=Document)
+def invalidate_related_documents(sender, instance, **kwargs):
+    """Invalidate the cached related Documents."""
+    bump_version('related_documents')
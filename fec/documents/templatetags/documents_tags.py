@@ -1,7 +1,5 @@
 """This module contains template includes associated with Documents."""
 from django import template
-from django.db.models import Count
-
 from ..models import Document, DocumentCategory
 
 
@@ -12,8 +10,12 @@ register = template.Library()
 def document_list_group(documents, show_tags=True):
     """Render the Category's Documents as a Bootstrap list group.
 
-    :param documents: The Documents to be shown.
+    :param documents: The Documents to be shown. Their ``community`` should
+                      be loaded & their keywords prefetched to a
+                      ``keyword_list`` if ``show_tags`` is set.
     :type documents: A list of :class:`..models.Document`
+    :param show_tags: Whether to show the Documents' keywords.
+    :type show_tags: bool
 
     """
     return {'documents': documents, 'show_tags': show_tags}
@@ -40,6 +42,10 @@ def documents_newest(limit=3):
 
 @register.assignment_tag
 def categories_top():
-    """Return the 5 DocumentCategories with the highest number of documents."""
-    return DocumentCategory.objects.annotate(
-        document_count=Count('document')).order_by('-document_count')[:5]
+    """Return the 5 DocumentCategories with the most published Documents.
+
+    This uses the maintained, indexed
+    :attr:`~..models.DocumentCategory.published_document_count`.
+
+    """
+    return DocumentCategory.objects.order_by('-published_document_count')[:5]
@@ -9,8 +9,17 @@ register = template.Library()
 def categorys_docs_and_cats(category):
     """Render a Category's Documents and it's Child Categories.
 
-    :param category: The Document Category to use.
+    Only Child Categories with published Documents are shown.
+
+    :param category: The Document Category to use, with the
+                     ``document_list`` & ``child_list`` attributes set by
+                     :class:`~..views.CategoryTreeMixin`.
     :type category: :class:`..models.DocumentCategory`
 
     """
-    return {'category': category}
+    return {
+        'category': category,
+        'documents': category.document_list,
+        'children': [child for child in category.child_list
+                     if child.document_list],
+    }
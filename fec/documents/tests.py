@@ -1,8 +1,20 @@
+from datetime import date
+
+from django.core.management import call_command
+from django.contrib.auth.models import User
+from django.contrib.contenttypes.models import ContentType
 from django.core.urlresolvers import reverse
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from mezzanine.core.models import (CONTENT_STATUS_DRAFT,
+                                   CONTENT_STATUS_PUBLISHED)
 from mezzanine.generic.models import Keyword, AssignedKeyword
 
-from .models import Document, DocumentCategory
+from communities.models import Community
+
+from .models import Document, DocumentCategory, RelatedDocument
+from .templatetags.documents_tags import categories_top
 
 
 class DocumentTagViewTests(TestCase):
@@ -38,3 +50,314 @@ class DocumentTagViewTests(TestCase):
         self.assertIn('documents', response.context)
         self.assertSequenceEqual(
             response.context['documents'], [self.doc_three])
+
+
+class RelatedDocumentTests(TestCase):
+    '''Test the precomputed related Documents.'''
+    def setUp(self):
+        '''Create Documents in two Categories with some shared tags.'''
+        self.category = DocumentCategory.objects.create(title='Bylaws')
+        self.other_category = DocumentCategory.objects.create(title='Forms')
+        self.key_one, _ = Keyword.objects.get_or_create(title='key 1')
+        self.key_two, _ = Keyword.objects.get_or_create(title='key 2')
+        self.document = self.create_document('main', self.category,
+                                             [self.key_one, self.key_two])
+        self.same_category = self.create_document('same', self.category)
+        self.same_keywords = self.create_document(
+            'keywords', self.other_category, [self.key_one, self.key_two])
+        self.one_keyword = self.create_document(
+            'one keyword', self.other_category, [self.key_one])
+        self.unrelated = self.create_document('unrelated',
+                                              self.other_category)
+
+    def create_document(self, title, category, keywords=()):
+        '''Create a Document with the given keywords.'''
+        document = Document.objects.create(
+            title=title, contents='', category=category)
+        for keyword in keywords:
+            document.keywords.add(AssignedKeyword(keyword=keyword))
+        return document
+
+    def get_scores(self, document):
+        '''Return the related Document titles & scores of a Document.'''
+        return [(relation.related_document.title, relation.score)
+                for relation in document.relations.all()]
+
+    def test_documents_are_scored_by_keywords_and_category(self):
+        '''
+        Documents should be scored by the Jaccard index of their keywords,
+        plus a weight for sharing a Category.
+        '''
+        self.assertEqual(self.get_scores(self.document), [
+            ('keywords', 1.0), ('same', 0.5), ('one keyword', 0.5)])
+        self.assertEqual(self.get_scores(self.unrelated), [
+            ('keywords', 0.5), ('one keyword', 0.5)])
+
+    def test_scores_are_updated_when_keywords_change(self):
+        '''Changing a Document's keywords should update both Documents.'''
+        self.same_category.keywords.add(AssignedKeyword(keyword=self.key_two))
+        self.assertEqual(self.get_scores(self.document)[:2], [
+            ('same', 1.0), ('keywords', 1.0)])
+        self.assertIn(('main', 1.0), self.get_scores(self.same_category))
+
+        self.document.keywords.all().delete()
+        self.assertEqual(self.get_scores(self.document), [('same', 0.5)])
+        self.assertEqual(self.get_scores(self.one_keyword),
+                         [('keywords', 1.0), ('unrelated', 0.5)])
+
+    def test_only_the_highest_scores_are_kept(self):
+        '''Each Document should only keep it's highest scores.'''
+        limit = RelatedDocument.LIMIT
+        RelatedDocument.LIMIT = 2
+        try:
+            self.create_document('best', self.other_category,
+                                 [self.key_one, self.key_two])
+            self.assertEqual(self.get_scores(self.document),
+                             [('keywords', 1.0), ('best', 1.0)])
+        finally:
+            RelatedDocument.LIMIT = limit
+
+    def test_drafts_are_not_related(self):
+        '''Draft Documents should not be in any related Documents.'''
+        self.same_keywords.status = CONTENT_STATUS_DRAFT
+        self.same_keywords.save()
+
+        self.assertEqual(self.get_scores(self.document),
+                         [('same', 0.5), ('one keyword', 0.5)])
+        self.assertFalse(RelatedDocument.objects.filter(
+            related_document=self.same_keywords).exists())
+        self.assertEqual(self.get_scores(self.same_keywords)[0],
+                         ('main', 1.0))
+
+        self.same_keywords.status = CONTENT_STATUS_PUBLISHED
+        self.same_keywords.save()
+        self.assertEqual(self.get_scores(self.document)[0],
+                         ('keywords', 1.0))
+
+    def test_rebuild_matches_incremental_updates(self):
+        '''Rebuilding the scores should match the incremental updates.'''
+        self.one_keyword.status = CONTENT_STATUS_DRAFT
+        self.one_keyword.save()
+        documents = Document.objects.all()
+        scores = [self.get_scores(document) for document in documents]
+        RelatedDocument.objects.all().delete()
+        call_command('rebuild_related_documents', verbosity=0)
+        self.assertEqual(
+            [self.get_scores(document) for document in documents], scores)
+
+    def test_related_documents_rotate_daily(self):
+        '''
+        The related Documents should be published, & only change from day
+        to day.
+        '''
+        self.same_category.status = CONTENT_STATUS_DRAFT
+        self.same_category.save()
+        day = date(2015, 6, 1)
+        related = self.document.related_documents(limit=2, day=day)
+        self.assertEqual(len(related), 2)
+        self.assertEqual(related,
+                         self.document.related_documents(limit=2, day=day))
+        self.assertEqual(
+            set(self.document.related_documents(limit=5, day=day)),
+            set([self.same_keywords, self.one_keyword]))
+        self.assertIn('contents', related[0].get_deferred_fields())
+
+    def test_detail_page_shows_related_documents(self):
+        '''The Document's page should show it's related Documents.'''
+        response = self.client.get(self.document.get_absolute_url())
+        self.assertContains(response, 'Related Documents')
+        self.assertContains(response, self.same_keywords.get_absolute_url())
+        self.assertNotContains(response, self.unrelated.get_absolute_url())
+
+
+class PublishedDocumentCountTests(TestCase):
+    '''Test the maintained published Document counts of Categories.'''
+    def setUp(self):
+        '''Create two Categories with some published & draft Documents.'''
+        self.category = DocumentCategory.objects.create(title='Bylaws')
+        self.other_category = DocumentCategory.objects.create(title='Forms')
+        self.document = Document.objects.create(
+            title='doc 1', contents='', category=self.category)
+        Document.objects.create(
+            title='doc 2', contents='', category=self.category)
+        self.draft = Document.objects.create(
+            title='draft', contents='', category=self.other_category,
+            status=CONTENT_STATUS_DRAFT)
+
+    def assertCounts(self, count, other_count):
+        '''Assert the counts of both Categories in the database.'''
+        self.assertEqual(
+            [DocumentCategory.objects.get(id=category.id)
+             .published_document_count
+             for category in (self.category, self.other_category)],
+            [count, other_count])
+
+    def test_drafts_not_counted(self):
+        '''Only published Documents should be counted.'''
+        self.assertCounts(2, 0)
+
+    def test_publishing_increments_count(self):
+        '''Publishing a draft should add it to it's Category's count.'''
+        self.draft.status = CONTENT_STATUS_PUBLISHED
+        self.draft.save()
+
+        self.assertCounts(2, 1)
+
+    def test_unpublishing_decrements_count(self):
+        '''Unpublishing a Document should remove it from the count.'''
+        self.document.status = CONTENT_STATUS_DRAFT
+        self.document.save()
+
+        self.assertCounts(1, 0)
+
+    def test_moving_document_updates_both_counts(self):
+        '''Changing a Document's Category should move it's count.'''
+        self.document.category = self.other_category
+        self.document.save()
+
+        self.assertCounts(1, 1)
+
+    def test_saving_stale_instance_counts_once(self):
+        '''Saving an outdated instance should use the stored status.'''
+        Document.objects.get(id=self.document.id).save()
+        stale = Document.objects.get(id=self.document.id)
+        self.document.status = CONTENT_STATUS_DRAFT
+        self.document.save()
+        stale.status = CONTENT_STATUS_DRAFT
+        stale.save()
+
+        self.assertCounts(1, 0)
+
+    def test_deleting_decrements_count(self):
+        '''Deleting Documents should remove them from the count.'''
+        self.document.delete()
+        self.draft.delete()
+
+        self.assertCounts(1, 0)
+
+    def test_top_categories_ordered_by_count(self):
+        '''The top Categories should be ordered by their count.'''
+        self.other_category.documents.update(status=CONTENT_STATUS_PUBLISHED)
+        Document.objects.create(
+            title='doc 3', contents='', category=self.other_category)
+        Document.objects.create(
+            title='doc 4', contents='', category=self.other_category)
+        DocumentCategory.objects.repair_document_counts()
+
+        with self.assertNumQueries(1):
+            top = list(categories_top())
+
+        self.assertEqual(top, [self.other_category, self.category])
+
+    def test_repair_command(self):
+        '''The command should fix counts changed by bulk updates.'''
+        Document.objects.filter(category=self.category).update(
+            status=CONTENT_STATUS_DRAFT)
+        DocumentCategory.objects.filter(id=self.other_category.id).update(
+            published_document_count=5)
+
+        call_command('repair_document_counts', verbosity=0)
+
+        self.assertCounts(0, 0)
+        self.assertEqual(DocumentCategory.objects.repair_document_counts(), 0)
+
+
+class DocumentCategoryDetailTests(TestCase):
+    '''Test the prefetched Document tree of the Category Detail View.'''
+    def setUp(self):
+        '''Create a Category with a child, Documents & a Community.'''
+        self.category = DocumentCategory.objects.create(title='Bylaws')
+        self.child = DocumentCategory.objects.create(
+            title='Old Bylaws', parent=self.category)
+        self.empty_child = DocumentCategory.objects.create(
+            title='Drafts', parent=self.category)
+        self.community = Community.objects.create(title='Twin Oaks')
+        self.keyword, _ = Keyword.objects.get_or_create(title='membership')
+        self.document = Document.objects.create(
+            title='Membership', contents='', category=self.category,
+            community=self.community)
+        self.document.keywords.add(AssignedKeyword(keyword=self.keyword))
+        self.child_document = Document.objects.create(
+            title='Original Membership', contents='', category=self.child)
+        self.draft = Document.objects.create(
+            title='Unfinished', contents='', category=self.empty_child,
+            status=CONTENT_STATUS_DRAFT)
+
+    def add_documents(self, count):
+        '''Add ``count`` tagged Documents to the Category & it's child.'''
+        start = Document.objects.count()
+        documents = Document.objects.bulk_create(
+            Document(title='Document {}'.format(number),
+                     slug='document-{}'.format(number), contents='',
+                     category=(self.category, self.child)[number % 2],
+                     community=self.community, site_id=self.document.site_id)
+            for number in range(start, start + count))
+        document_ids = Document.objects.filter(
+            slug__in=[document.slug for document in documents],
+        ).values_list('id', flat=True)
+        AssignedKeyword.objects.bulk_create(
+            AssignedKeyword(
+                keyword=self.keyword, object_pk=document_id,
+                content_type=ContentType.objects.get_for_model(Document))
+            for document_id in document_ids)
+
+    def test_tree_shown(self):
+        '''The Documents, Communities, keywords & children should be shown.'''
+        response = self.client.get(self.category.get_absolute_url())
+
+        self.assertEqual(response.context['documents'], [self.document])
+        self.assertEqual(response.context['children'], [self.child])
+        self.assertContains(response, 'Twin Oaks')
+        self.assertContains(response, reverse(
+            'document_tag_list', kwargs={'tag': self.keyword.slug}))
+        self.assertContains(response, 'Original Membership')
+
+    def test_drafts_and_empty_children_hidden(self):
+        '''Draft Documents & children without any should not be shown.'''
+        response = self.client.get(self.category.get_absolute_url())
+
+        self.assertEqual(response.context['children'], [self.child])
+        self.assertNotContains(response, 'collapse-drafts')
+
+        response = self.client.get(self.empty_child.get_absolute_url())
+        self.assertEqual(response.context['documents'], [])
+
+    def test_drafts_hidden_from_staff(self):
+        '''Staff should see the same published tree as everyone else.'''
+        User.objects.create_superuser('staff', 'staff@example.com', 'staff')
+        self.client.login(username='staff', password='staff')
+        response = self.client.get(self.category.get_absolute_url())
+
+        self.assertEqual(response.context['children'], [self.child])
+        self.assertNotContains(response, 'collapse-drafts')
+
+        response = self.client.get(reverse('document_category_list'))
+        category = response.context['root_categories'][0]
+        self.assertEqual(category.document_list, [self.document])
+        self.assertEqual(
+            [document for child in category.child_list
+             for document in child.document_list], [self.child_document])
+        self.assertNotContains(response, 'collapse-drafts')
+
+    def test_root_list_shows_tree(self):
+        '''The root Category list should show each Category's tree.'''
+        response = self.client.get(reverse('document_category_list'))
+
+        self.assertEqual(list(response.context['root_categories']),
+                         [self.category])
+        self.assertContains(response, 'Original Membership')
+
+    def test_detail_view_has_a_fixed_query_budget(self):
+        '''
+        The page should render in a fixed number of queries, even with
+        hundreds of Documents in the Category & it's child.
+        '''
+        url = self.category.get_absolute_url()
+        with CaptureQueriesContext(connection) as context:
+            self.client.get(url)
+        self.add_documents(500)
+
+        with self.assertNumQueries(len(context.captured_queries)):
+            response = self.client.get(url)
+        self.assertEqual(len(response.context['documents']), 251)
+        self.assertContains(response, 'Document 502')
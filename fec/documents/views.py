@@ -1,8 +1,9 @@
 """This module contains views to display Documents and their Categories."""
+from django.db.models import Prefetch
 from django.views.generic import DetailView, ListView
 from django.shortcuts import get_object_or_404
 
-from mezzanine.generic.models import Keyword
+from mezzanine.generic.models import AssignedKeyword, Keyword
 
 from .models import Document, DocumentCategory
 
@@ -30,17 +31,47 @@ class DocumentDetail(DetailView):
         return context
 
 
-class DocumentCategoryDetail(DetailView):
+class CategoryTreeMixin(object):
+    """Loads the Document tree of each :class:`~.models.DocumentCategory`.
+
+    The Categories' published Documents, with their Communities & keywords,
+    and their children with their published Documents are fetched with a
+    fixed number of queries, no matter how many Documents there are. They
+    are set to the ``document_list`` & ``child_list`` attributes of each
+    Category.
+
+    """
+    def get_queryset(self):
+        """Prefetch the Documents & children of the Categories."""
+        keywords = AssignedKeyword.objects.select_related('keyword')
+        documents = Document.objects.published().select_related('community')
+        return DocumentCategory.objects.select_related(
+            'parent',
+        ).prefetch_related(
+            Prefetch('documents', queryset=documents, to_attr='document_list'),
+            Prefetch('document_list__keywords', queryset=keywords,
+                     to_attr='keyword_list'),
+            Prefetch('children', to_attr='child_list'),
+            Prefetch('child_list__documents', queryset=documents,
+                     to_attr='document_list'),
+            Prefetch('child_list__document_list__keywords',
+                     queryset=keywords, to_attr='keyword_list'),
+        )
+
+
+class DocumentCategoryDetail(CategoryTreeMixin, DetailView):
     """Shows the details of a :class:`~.models.DocumentCategory`.
 
     The :class:`~.models.DocumentCategory` is passed in to the template as the
     ``document_category`` context variable. It is also set to the
     ``editable_obj`` variable for the ``editable`` admin link.
 
+    The Category's Documents & children are prefetched by the
+    :class:`CategoryTreeMixin`.
+
     The default template is ``documents/category_details.html``.
 
     """
-    model = DocumentCategory
     context_object_name = 'document_category'
     template_name = 'documents/category_details.html'
 
@@ -52,7 +83,7 @@ class DocumentCategoryDetail(DetailView):
         return context
 
 
-class RootDocumentCategoryList(ListView):
+class RootDocumentCategoryList(CategoryTreeMixin, ListView):
     """Shows a listing of all root :class:`~.models.DocumentCategory`.
 
     They are passed in with the ``root_categories`` context variable.
@@ -65,8 +96,8 @@ class RootDocumentCategoryList(ListView):
 
     def get_queryset(self):
         """Return only Categories with no parent."""
-        return DocumentCategory.objects.filter(parent=None).prefetch_related(
-            'children', 'documents', 'children__documents')
+        return super(RootDocumentCategoryList, self).get_queryset().filter(
+            parent=None)
 
 
 class DocumentTagList(ListView):
@@ -83,7 +114,8 @@ class DocumentTagList(ListView):
     def get_queryset(self):
         """Return only Documents with the specified ``tag``."""
         tag = get_object_or_404(Keyword, slug=self.kwargs['tag'])
-        return Document.objects.filter(keywords__keyword=tag)
+        return Document.objects.filter(
+            keywords__keyword=tag).select_related('community')
 
     def get_context_data(self, **kwargs):
         """Add the tag name to the context."""
@@ -0,0 +1,128 @@
+"""This module contains helpers for versioned cache keys.
+
+Cached content that depends on the database can include a version in it's
+key, fetched with :func:`get_version`. Signal handlers call
+:func:`bump_version` when the content changes, so the old entries are never
+read again & the content can be cached for a long time without going stale.
+
+Expensive content can be cached with :func:`get_or_set_stale`, which keeps
+serving an expired value while a single process recomputes it.
+
+"""
+import hashlib
+import random
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.encoding import force_bytes
+
+
+_random = random.SystemRandom()
+
+
+def get_version(name, *args):
+    """Return the current version of some cached content.
+
+    :param name: The name of the cached content, e.g. ``feed_posts``.
+    :type name: string
+    :param args: Values identifying the content, e.g. a Community's ``pk``.
+    :returns: The version number.
+    :rtype: int
+
+    """
+    key = _make_version_key(name, args)
+    version = cache.get(key)
+    if version is None:
+        version = _new_version()
+        if not cache.add(key, version, None):
+            version = cache.get(key, version)
+    return version
+
+
+def bump_version(name, *args):
+    """Change the version of some cached content, invalidating it.
+
+    :param name: The name of the cached content, e.g. ``feed_posts``.
+    :type name: string
+    :param args: Values identifying the content, e.g. a Community's ``pk``.
+    :returns: :obj:`None`
+
+    """
+    key = _make_version_key(name, args)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, _new_version(), None)
+
+
+def get_or_set_stale(key, compute, timeout, backend=None):
+    """Return a cached value, computing it in only one process at a time.
+
+    Once the value is older than ``timeout``, the first process to ask for
+    it takes a lock in the cache & recomputes it, while the others keep
+    getting the stale value. Values are kept for the ``STALE_CACHE_GRACE``
+    setting's number of seconds after they expire.
+
+    If there is no value at all, the processes that did not get the lock
+    wait for the one computing it, for up to the ``STALE_CACHE_LOCK_TIMEOUT``
+    setting's number of seconds. After that, they compute it themselves.
+
+    :param key: The cache key of the value.
+    :type key: string
+    :param compute: A function that returns the value.
+    :type compute: function
+    :param timeout: The number of seconds the value stays fresh.
+    :type timeout: int
+    :param backend: The cache to use, defaulting to the ``default`` cache.
+    :type backend: :class:`django.core.cache.backends.base.BaseCache`
+    :returns: The cached or computed value.
+
+    """
+    backend = backend or cache
+    lock_key = '{}.lock'.format(key)
+    lock_timeout = settings.STALE_CACHE_LOCK_TIMEOUT
+    entry = backend.get(key)
+    if entry is not None and time.time() < entry[1]:
+        return entry[0]
+    if backend.add(lock_key, True, lock_timeout):
+        try:
+            return _store(backend, key, compute(), timeout)
+        finally:
+            backend.delete(lock_key)
+    if entry is not None:
+        return entry[0]
+    entry = _wait_for_entry(backend, key, lock_key, lock_timeout)
+    if entry is not None:
+        return entry[0]
+    return _store(backend, key, compute(), timeout)
+
+
+def _wait_for_entry(backend, key, lock_key, lock_timeout):
+    """Wait for another process to compute a value & release it's lock."""
+    deadline = time.time() + lock_timeout
+    while time.time() < deadline:
+        time.sleep(0.05)
+        entry = backend.get(key)
+        if entry is not None or backend.get(lock_key) is None:
+            return entry
+    return None
+
+
+def _store(backend, key, value, timeout):
+    """Cache a value along with the time it expires."""
+    backend.set(key, (value, time.time() + timeout),
+                timeout + settings.STALE_CACHE_GRACE)
+    return value
+
+
+def _make_version_key(name, args):
+    """Return a cache key that is safe for any backend."""
+    identifier = hashlib.md5(force_bytes(u':'.join(
+        [name] + [unicode(arg) for arg in args]))).hexdigest()
+    return 'fec.cache_version.{}'.format(identifier)
+
+
+def _new_version():
+    """Return a random version, so an evicted version is never reused."""
+    return _random.getrandbits(48)
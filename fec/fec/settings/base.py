@@ -37,12 +37,39 @@ BLOG_USE_FEATURED_IMAGE = True
 # Remove Ratings from Comments
 COMMENTS_USE_RATINGS = False
 
+# Fetch Community Feeds in 8 threads, giving up on a Feed after 15 seconds
+FEED_FETCH_WORKERS = 8
+FEED_FETCH_TIMEOUT = 15
+# Poll busy Feeds every 15 minutes & quiet ones once a day. Failing Feeds
+# back off exponentially, for up to a week.
+FEED_POLL_MIN_INTERVAL = 15 * 60
+FEED_POLL_MAX_INTERVAL = 24 * 60 * 60
+FEED_FAILURE_MAX_BACKOFF = 7 * 24 * 60 * 60
+# Stop reading a Feed after 50 entries if it has no post limit, & give up on
+# Feeds larger than 2MB
+FEED_MAX_ENTRIES = 50
+FEED_MAX_BYTES = 2 * 1024 * 1024
+# Parse Feeds in 2 separate processes, giving each Feed at most 10 seconds,
+# 5 seconds of CPU time & 256MB of memory
+FEED_PARSE_PROCESSES = 2
+FEED_PARSE_TIMEOUT = 10
+FEED_PARSE_CPU_TIME = 5
+FEED_PARSE_MEMORY = 256 * 1024 * 1024
+# Serve expired {% stalecache %} fragments for up to a day while a single
+# request re-renders them. Requests wait up to 10 seconds for a fragment that
+# is being rendered for the first time.
+STALE_CACHE_GRACE = 24 * 60 * 60
+STALE_CACHE_LOCK_TIMEOUT = 10
+# The quality of the WebP variants of Community image thumbnails
+WEBP_QUALITY = 80
+
 # Add custom apps
 INSTALLED_APPS = (
     "fec",
     "communities",
     "documents",
     "homepage",
+    "search",
 
     "axes",
     "email_obfuscator",
@@ -1,6 +1,8 @@
 """This module defines general template filters."""
 from django import template
 
+from fec.cache import get_version
+
 
 register = template.Library()
 
@@ -17,3 +19,23 @@ def get_first_by(value, stop_char):
 
     """
     return unicode(value).split(stop_char)[0]
+
+
+@register.filter(name="cache_version")
+def cache_version(name, arg=None):
+    """Return the current version of some cached content.
+
+    This is used to vary ``{% cache %}`` fragments on the version, so that
+    they are invalidated by :func:`~fec.cache.bump_version`, e.g.
+    ``{% cache 604800 feed_posts "feed_posts"|cache_version:community.pk %}``.
+
+    :param name: The name of the cached content.
+    :type name: string
+    :param arg: A value identifying the content, if any.
+    :returns: The version number.
+    :rtype: int
+
+    """
+    if arg is None:
+        return get_version(name)
+    return get_version(name, arg)
@@ -0,0 +1,77 @@
+"""This module defines general template tags."""
+from django import template
+from django.core.cache import InvalidCacheBackendError, caches
+from django.core.cache.utils import make_template_fragment_key
+from django.templatetags.cache import CacheNode
+
+from fec.cache import get_or_set_stale
+
+
+register = template.Library()
+
+
+class StaleCacheNode(CacheNode):
+    """A ``{% cache %}`` node that serves stale fragments while one request
+    re-renders them."""
+    def render(self, context):
+        """Return the cached fragment, rendering it if it has expired.
+
+        :raises: :class:`~django.template.TemplateSyntaxError` if the
+                 timeout or cache name is invalid.
+
+        """
+        try:
+            expire_time = int(self.expire_time_var.resolve(context))
+        except (template.VariableDoesNotExist, ValueError, TypeError):
+            raise template.TemplateSyntaxError(
+                '"stalecache" tag got an invalid timeout: {!r}'.format(
+                    self.expire_time_var.var))
+        vary_on = [var.resolve(context) for var in self.vary_on]
+        return get_or_set_stale(
+            make_template_fragment_key(self.fragment_name, vary_on),
+            lambda: self.nodelist.render(context), expire_time,
+            self.get_cache(context))
+
+    def get_cache(self, context):
+        """Return the cache named by ``using``, like the ``cache`` tag."""
+        if self.cache_name:
+            cache_name = self.cache_name.resolve(context)
+        else:
+            cache_name = 'template_fragments'
+        try:
+            return caches[cache_name]
+        except InvalidCacheBackendError:
+            if self.cache_name:
+                raise template.TemplateSyntaxError(
+                    'Invalid cache name specified for stalecache tag: '
+                    '{!r}'.format(cache_name))
+            return caches['default']
+
+
+@register.tag('stalecache')
+def do_stale_cache(parser, token):
+    """Cache the contents of a template fragment, like ``{% cache %}``.
+
+    When the fragment expires, only the first request re-renders it, while
+    other requests are served the expired fragment. The arguments are the
+    same as the ``cache`` tag's::
+
+        {% stalecache 3600 fragment_name var1 var2 using="cachename" %}
+            .. some expensive processing ..
+        {% endstalecache %}
+
+    """
+    nodelist = parser.parse(('endstalecache',))
+    parser.delete_first_token()
+    tokens = token.split_contents()
+    if len(tokens) < 3:
+        raise template.TemplateSyntaxError(
+            "'{}' tag requires at least 2 arguments.".format(tokens[0]))
+    if len(tokens) > 3 and tokens[-1].startswith('using='):
+        cache_name = parser.compile_filter(tokens[-1][len('using='):])
+        tokens = tokens[:-1]
+    else:
+        cache_name = None
+    return StaleCacheNode(
+        nodelist, parser.compile_filter(tokens[1]), tokens[2],
+        [parser.compile_filter(bit) for bit in tokens[3:]], cache_name)
@@ -1,9 +1,16 @@
 """This module contains unit tests for the general application, like PEP8."""
 
+import threading
+import time
 from unittest.case import TestCase
 
+from django.core.cache import cache
+from django.template import Context, Template
+from django.test import SimpleTestCase, override_settings
+
+from .cache import bump_version, get_or_set_stale, get_version
 from .utils import check_pep8
-from .templatetags.core_filters import get_first_by
+from .templatetags.core_filters import cache_version, get_first_by
 
 
 class Pep8Tests(TestCase):
@@ -24,15 +31,30 @@ class Pep8Tests(TestCase):
     def test_fec_pep8(self):
         """The fec package should be PEP8 compliant."""
         result = check_pep8([
+            'fec/cache.py',
             'fec/urls.py',
             'fec/utils.py',
             'fec/templatetags/core_filters.py',
+            'fec/templatetags/core_tags.py',
             'fec/tests.py',
         ])
 
         self.assertEqual(result.total_errors, 0,
                          "PEP8 issues were found in the fec package.")
 
+    def test_search_pep8(self):
+        """The search package should be PEP8 compliant."""
+        result = check_pep8([
+            'search/apps.py',
+            'search/management/commands/rebuild_search_index.py',
+            'search/models.py',
+            'search/tests.py',
+            'search/views.py',
+        ])
+
+        self.assertEqual(result.total_errors, 0,
+                         "PEP8 issues were found in the search package.")
+
     def test_homepage_pep8(self):
         """The homepage package should be PEP8 compliant."""
         result = check_pep8([
@@ -48,12 +70,17 @@ class Pep8Tests(TestCase):
         """The communities package should be PEP8 compliant."""
         result = check_pep8([
             'communities/admin.py',
+            'communities/feeds.py',
+            'communities/management/commands/fetch_feeds.py',
+            'communities/management/commands/generate_thumbnails.py',
+            'communities/management/commands/rebuild_timeline.py',
             'communities/models.py',
             'communities/urls.py',
             'communities/views.py',
             'communities/templatetags/communities_tags.py',
             'communities/templatetags/communities_tags_extras.py',
             'communities/tests.py',
+            'communities/thumbnails.py',
         ])
 
         self.assertEqual(result.total_errors, 0,
@@ -63,6 +90,8 @@ class Pep8Tests(TestCase):
         """The documents package should be PEP8 compliant."""
         result = check_pep8([
             'documents/admin.py',
+            'documents/management/commands/rebuild_related_documents.py',
+            'documents/management/commands/repair_document_counts.py',
             'documents/models.py',
             'documents/templatetags/documents_tags.py',
             'documents/templatetags/documents_tags_extras.py',
@@ -86,3 +115,101 @@ class CoreFiltersTests(TestCase):
         '''The function should be able to handle empty strings.'''
         self.assertEqual(get_first_by('', ','), '')
         self.assertEqual(get_first_by('', ';'), '')
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class VersionedCacheTests(SimpleTestCase):
+    '''Test the versioned cache key helpers.'''
+    def setUp(self):
+        '''Start with an empty cache.'''
+        cache.clear()
+
+    def test_version_is_stable_until_bumped(self):
+        '''The version should only change when it is bumped.'''
+        version = get_version('posts', 1)
+        self.assertEqual(get_version('posts', 1), version)
+        bump_version('posts', 1)
+        self.assertNotEqual(get_version('posts', 1), version)
+
+    def test_versions_are_independent(self):
+        '''Bumping a version should not change any other versions.'''
+        versions = [get_version('posts', 1), get_version('posts', 2),
+                    get_version('posts')]
+        bump_version('posts', 1)
+        self.assertEqual([get_version('posts', 2), get_version('posts')],
+                         versions[1:])
+
+    def test_evicted_versions_are_not_reused(self):
+        '''A version lost from the cache should be replaced by a new one.'''
+        version = get_version('posts')
+        bump_version('posts')
+        cache.clear()
+        self.assertNotIn(get_version('posts'), (version, version + 1))
+
+    def test_cache_version_filter(self):
+        '''The filter should return the version of the named content.'''
+        self.assertEqual(cache_version('posts', 1), get_version('posts', 1))
+        self.assertEqual(cache_version('posts'), get_version('posts'))
+
+
+@override_settings(CACHES={'default': {
+    'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class StaleCacheTests(SimpleTestCase):
+    '''Test serving stale values while a single process recomputes them.'''
+    def setUp(self):
+        '''Start with an empty cache & count the computations.'''
+        cache.clear()
+        self.computed = []
+        self.start = threading.Event()
+
+    def slow_compute(self, value):
+        '''Return a function that slowly computes the value.'''
+        def compute():
+            self.computed.append(value)
+            time.sleep(0.3)
+            return value
+        return compute
+
+    def get_concurrently(self, compute, timeout, count=8):
+        '''Get a value from many threads at once, returning the results.'''
+        results = []
+
+        def get():
+            self.start.wait()
+            results.append(get_or_set_stale('key', compute, timeout))
+        threads = [threading.Thread(target=get) for _ in range(count)]
+        for thread in threads:
+            thread.start()
+        self.start.set()
+        for thread in threads:
+            thread.join()
+        return results
+
+    def test_concurrent_misses_compute_once(self):
+        '''Requests missing at the same time should share one computation.'''
+        results = self.get_concurrently(self.slow_compute('new'), 60)
+        self.assertEqual(self.computed, ['new'])
+        self.assertEqual(results, ['new'] * 8)
+
+    def test_stale_value_is_served_while_recomputing(self):
+        '''Only one request should wait for an expired value.'''
+        get_or_set_stale('key', lambda: 'old', 0)
+        start = time.time()
+        results = self.get_concurrently(self.slow_compute('new'), 60)
+        self.assertEqual(self.computed, ['new'])
+        self.assertEqual(sorted(results), ['new'] + ['old'] * 7)
+        self.assertEqual(get_or_set_stale('key', lambda: 'newer', 60), 'new')
+        self.assertLess(time.time() - start, 1)
+
+    def test_stalecache_tag(self):
+        '''The tag should cache fragments like the cache tag.'''
+        fragment = Template(
+            '{% load core_tags %}'
+            '{% stalecache 60 fragment name %}{{ value }}{% endstalecache %}')
+        self.assertEqual(fragment.render(Context({'name': 'a', 'value': 1})),
+                         '1')
+        self.assertEqual(fragment.render(Context({'name': 'a', 'value': 2})),
+                         '1')
+        self.assertEqual(fragment.render(Context({'name': 'b', 'value': 2})),
+                         '2')
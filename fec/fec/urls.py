@@ -19,6 +19,7 @@ urlpatterns += patterns(
 
     ("^communities/", include("communities.urls")),
     ("^systems-and-structures/", include("documents.urls")),
+    url("^search/$", "search.views.search", name="search"),
 
 
     ("^", include("mezzanine.urls")),
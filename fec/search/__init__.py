@@ -0,0 +1,2 @@
+"""This package contains the full-text search index of the site."""
+default_app_config = 'search.apps.SearchConfig'
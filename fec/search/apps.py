@@ -0,0 +1,21 @@
+"""This module contains the configuration of the ``search`` app."""
+from django.apps import AppConfig
+from django.db.models.signals import post_delete, post_save
+
+
+class SearchConfig(AppConfig):
+    """Keeps the search index up to date once the models are loaded."""
+    name = 'search'
+
+    def ready(self):
+        """Connect the index's signal handlers to the searchable models.
+
+        Only the searchable models are connected, so saving any other
+        model does not run the handlers.
+
+        """
+        from .models import (get_searchable_models, index_searchable_object,
+                             remove_searchable_object)
+        for model in get_searchable_models():
+            post_save.connect(index_searchable_object, sender=model)
+            post_delete.connect(remove_searchable_object, sender=model)
@@ -0,0 +1,20 @@
+"""Rebuild the full-text search index.
+
+The index is updated as Documents, Communities, BlogPosts & Pages are saved,
+so this only needs to be run after the index is first installed.
+
+"""
+from django.core.management.base import BaseCommand
+
+from search.models import SearchEntry
+
+
+class Command(BaseCommand):
+    '''Rebuild the search index.'''
+    help = 'Rebuild the full-text search index of every searchable object'
+
+    def handle(self, *args, **options):
+        SearchEntry.objects.rebuild()
+        if int(options.get('verbosity', 1)) > 0:
+            self.stdout.write('{} objects in the search index'.format(
+                SearchEntry.objects.count()))
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def add_search_vector(apps, schema_editor):
+    """Add the GIN indexed ``tsvector`` column on PostgreSQL."""
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'ALTER TABLE search_searchentry ADD COLUMN search_vector tsvector')
+        schema_editor.execute(
+            'CREATE INDEX search_searchentry_search_vector ON '
+            'search_searchentry USING GIN (search_vector)')
+
+
+def remove_search_vector(apps, schema_editor):
+    """Remove the ``tsvector`` column on PostgreSQL."""
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(
+            'ALTER TABLE search_searchentry DROP COLUMN search_vector')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('contenttypes', '0002_remove_content_type_name'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='SearchEntry',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('object_id', models.PositiveIntegerField()),
+                ('title', models.CharField(max_length=500)),
+                ('description', models.TextField(blank=True)),
+                ('url', models.CharField(max_length=2000)),
+                ('text', models.TextField(blank=True)),
+                ('status', models.IntegerField(default=2)),
+                ('publish_date', models.DateTimeField(null=True, blank=True)),
+                ('expiry_date', models.DateTimeField(null=True, blank=True)),
+                ('content_type', models.ForeignKey(to='contenttypes.ContentType')),
+            ],
+            options={
+                'verbose_name_plural': 'search entries',
+            },
+        ),
+        migrations.CreateModel(
+            name='SearchTerm',
+            fields=[
+                ('id', models.AutoField(verbose_name='ID', serialize=False, auto_created=True, primary_key=True)),
+                ('term', models.CharField(max_length=100)),
+                ('weight', models.FloatField()),
+                ('entry', models.ForeignKey(related_name='terms', to='search.SearchEntry')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='searchterm',
+            unique_together=set([('term', 'entry')]),
+        ),
+        migrations.AlterUniqueTogether(
+            name='searchentry',
+            unique_together=set([('content_type', 'object_id')]),
+        ),
+        migrations.RunPython(add_search_vector, remove_search_vector),
+    ]
@@ -0,0 +1,326 @@
+"""This module contains the full-text search index.
+
+Every object of the models that Mezzanine's search used, like Documents,
+Communities, BlogPosts & Pages, has a :class:`SearchEntry`, which is updated
+when it is saved or deleted. The text of each model's ``search_fields`` is
+indexed. On PostgreSQL, the entries are matched & ranked using a
+``tsvector`` column with a GIN index. Other databases, like SQLite in
+development, use the :class:`SearchTerm` inverted index instead.
+
+.. attribute:: SEARCH_CONFIG
+
+    The PostgreSQL text search configuration used to parse the text.
+
+"""
+from collections import Counter
+import re
+
+from django.apps import apps
+from django.contrib.contenttypes.models import ContentType
+from django.db import connection, models, transaction
+from django.db.models import Sum
+from django.utils.encoding import force_text
+from django.utils.html import strip_tags
+from mezzanine.core.managers import PublishedManager
+from mezzanine.core.models import CONTENT_STATUS_PUBLISHED, Displayable
+
+
+SEARCH_CONFIG = 'english'
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+_searchable_models = None
+
+
+def uses_postgres():
+    """Return whether the ``tsvector`` index is used."""
+    return connection.vendor == 'postgresql'
+
+
+def get_searchable_models():
+    """Return the models that are indexed.
+
+    Like Mezzanine's search without ``SEARCH_MODEL_CHOICES``, these are the
+    concrete :class:`~mezzanine.core.models.Displayable` models that no
+    other model inherits from, so Pages are indexed as their content type.
+    The models are only looked up once, since the installed apps can't
+    change.
+
+    :rtype: list
+
+    """
+    global _searchable_models
+    if _searchable_models is None:
+        models = [model for model in apps.get_models()
+                  if issubclass(model, Displayable)]
+        parents = set(parent for model in models
+                      for parent in model._meta.get_parent_list())
+        _searchable_models = [model for model in models
+                              if model not in parents]
+    return _searchable_models
+
+
+def is_searchable(model):
+    """Return whether a model's objects are indexed."""
+    return model in get_searchable_models()
+
+
+def get_search_text(instance):
+    """Return the plain text of an object's description & search fields.
+
+    The fields are read from the model's manager, which combines the
+    ``search_fields`` of the model & it's bases. Keywords are indexed using
+    the ``keywords_string``.
+
+    :param instance: The object to index.
+    :type instance: :class:`~mezzanine.core.models.Displayable`
+    :rtype: unicode
+
+    """
+    field_names = ['description']
+    for name in type(instance).objects.get_search_fields():
+        if name == 'keywords':
+            name = 'keywords_string'
+        if name not in field_names and name != 'title':
+            field_names.append(name)
+    return u'\n'.join(
+        strip_tags(force_text(getattr(instance, name, None) or ''))
+        for name in field_names)
+
+
+def get_terms(text):
+    """Split text into lowercase search terms.
+
+    :param text: The text to split.
+    :type text: string
+    :returns: The terms, in the order they appear.
+    :rtype: list of strings
+
+    """
+    return [term for term in WORD_RE.findall(force_text(text).lower())
+            if 1 < len(term) <= SearchTerm.MAX_LENGTH]
+
+
+class SearchEntryManager(PublishedManager):
+    """Maintains & queries the :class:`SearchEntry` index."""
+    def search(self, query, for_user=None, model=None):
+        """Return the published entries that match a query, best first.
+
+        An entry matches if it contains any of the query's terms, and is
+        ranked higher for each term & for terms in it's title.
+
+        :param query: The words to search for.
+        :type query: string
+        :param for_user: The user searching. Staff also see unpublished
+                         entries.
+        :type for_user: :class:`django.contrib.auth.models.User`
+        :param model: Only return entries for this model.
+        :returns: A QuerySet of :class:`SearchEntry` objects.
+
+        """
+        entries = self.published(for_user=for_user)
+        if model is not None:
+            entries = entries.filter(
+                content_type=ContentType.objects.get_for_model(model))
+        terms = sorted(set(get_terms(query)))
+        if not terms:
+            return entries.none()
+        if uses_postgres():
+            ts_query = ' | '.join(terms)
+            return entries.extra(
+                select={'rank': "ts_rank(search_vector, to_tsquery(%s, %s))"},
+                select_params=[SEARCH_CONFIG, ts_query],
+                where=['search_vector @@ to_tsquery(%s, %s)'],
+                params=[SEARCH_CONFIG, ts_query],
+                order_by=['-rank', '-publish_date'])
+        return entries.filter(terms__term__in=terms).annotate(
+            rank=Sum('terms__weight')).order_by('-rank', '-publish_date')
+
+    def index(self, instance):
+        """Add or update the entry of a searchable object.
+
+        Pages that require a login are removed from the index instead.
+
+        :param instance: The object to index.
+        :type instance: A model from :func:`get_searchable_models`
+
+        """
+        if getattr(instance, 'login_required', False):
+            self.remove(instance)
+            return
+        text = get_search_text(instance)
+        with transaction.atomic():
+            entry, _ = self.update_or_create(
+                content_type=ContentType.objects.get_for_model(instance),
+                object_id=instance.pk,
+                defaults={
+                    'title': instance.title,
+                    'description': instance.description,
+                    'url': instance.get_absolute_url(),
+                    'text': text,
+                    'status': instance.status,
+                    'publish_date': instance.publish_date,
+                    'expiry_date': instance.expiry_date,
+                })
+            if uses_postgres():
+                self._update_vector(entry)
+            else:
+                SearchTerm.objects.filter(entry=entry).delete()
+                SearchTerm.objects.bulk_create(
+                    SearchTerm(entry=entry, term=term, weight=weight)
+                    for term, weight in entry.get_term_weights().items())
+
+    def remove(self, instance):
+        """Remove the entry of a deleted object.
+
+        :param instance: The deleted object.
+        :type instance: A model from :func:`get_searchable_models`
+
+        """
+        self.filter(content_type=ContentType.objects.get_for_model(instance),
+                    object_id=instance.pk).delete()
+
+    def rebuild(self):
+        """Rebuild the entries of every searchable object."""
+        with transaction.atomic():
+            self.all().delete()
+            for model in get_searchable_models():
+                for instance in model.objects.all():
+                    self.index(instance)
+
+    def _update_vector(self, entry):
+        """Update the ``tsvector`` of an entry, weighting it's title."""
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'UPDATE {} SET search_vector = '
+                "setweight(to_tsvector(%s, title), 'A') || "
+                "setweight(to_tsvector(%s, text), 'B') "
+                'WHERE id = %s'.format(self.model._meta.db_table),
+                [SEARCH_CONFIG, SEARCH_CONFIG, entry.id])
+
+
+class SearchEntry(models.Model):
+    """The indexed text of a searchable object.
+
+    The entry keeps the object's title, description, URL & publishing
+    status, so the search results can be rendered & filtered without
+    loading the objects themselves.
+
+    .. attribute:: content_type
+
+        The type of the indexed object.
+
+    .. attribute:: object_id
+
+        The ``pk`` of the indexed object.
+
+    .. attribute:: text
+
+        The plain text of the object's description & search fields.
+
+    """
+    content_type = models.ForeignKey(ContentType)
+    object_id = models.PositiveIntegerField()
+    title = models.CharField(max_length=500)
+    description = models.TextField(blank=True)
+    url = models.CharField(max_length=2000)
+    text = models.TextField(blank=True)
+    status = models.IntegerField(default=CONTENT_STATUS_PUBLISHED)
+    publish_date = models.DateTimeField(blank=True, null=True)
+    expiry_date = models.DateTimeField(blank=True, null=True)
+
+    objects = SearchEntryManager()
+
+    class Meta(object):
+        """Index each object once."""
+        unique_together = ('content_type', 'object_id')
+        verbose_name_plural = 'search entries'
+
+    def __unicode__(self):
+        return self.title
+
+    def get_absolute_url(self):
+        """Return the URL of the indexed object."""
+        return self.url
+
+    @property
+    def type_name(self):
+        """Return the name of the indexed object's type."""
+        model = ContentType.objects.get_for_id(
+            self.content_type_id).model_class()
+        return model._meta.verbose_name.title()
+
+    def get_term_weights(self):
+        """Return the weight of each term in the entry.
+
+        Terms in the title weigh :attr:`SearchTerm.TITLE_WEIGHT` & each
+        use in the text adds :attr:`SearchTerm.TEXT_WEIGHT`, up to
+        :attr:`SearchTerm.MAX_TEXT_WEIGHT`.
+
+        :rtype: dict
+
+        """
+        weights = dict((term, SearchTerm.TITLE_WEIGHT)
+                       for term in get_terms(self.title))
+        for term, count in Counter(get_terms(self.text)).items():
+            weights[term] = weights.get(term, 0) + min(
+                count * SearchTerm.TEXT_WEIGHT, SearchTerm.MAX_TEXT_WEIGHT)
+        return weights
+
+
+class SearchTerm(models.Model):
+    """A term in the inverted index used when PostgreSQL is not available.
+
+    .. attribute:: TITLE_WEIGHT
+
+        The weight of a term that is in an entry's title.
+
+    .. attribute:: TEXT_WEIGHT
+
+        The weight added each time a term is used in an entry's text.
+
+    .. attribute:: MAX_TEXT_WEIGHT
+
+        The highest weight a term can get from an entry's text.
+
+    .. attribute:: MAX_LENGTH
+
+        The length of the longest term that is indexed.
+
+    """
+    TITLE_WEIGHT = 1.0
+    TEXT_WEIGHT = 0.2
+    MAX_TEXT_WEIGHT = 1.0
+    MAX_LENGTH = 100
+
+    entry = models.ForeignKey(SearchEntry, related_name='terms')
+    term = models.CharField(max_length=MAX_LENGTH)
+    weight = models.FloatField()
+
+    class Meta(object):
+        """Each term is indexed once per entry."""
+        unique_together = ('term', 'entry')
+
+    def __unicode__(self):
+        return self.term
+
+
+def index_searchable_object(sender, instance, **kwargs):
+    """Update the search index when a searchable object is saved.
+
+    This is connected to each searchable model by
+    :class:`~search.apps.SearchConfig`.
+
+    """
+    if not kwargs.get('raw'):
+        SearchEntry.objects.index(instance)
+
+
+def remove_searchable_object(sender, instance, **kwargs):
+    """Remove a deleted object from the search index.
+
+    This is connected to each searchable model by
+    :class:`~search.apps.SearchConfig`.
+
+    """
+    SearchEntry.objects.remove(instance)
@@ -0,0 +1,175 @@
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db.models.signals import post_save
+from django.test import TestCase
+from mezzanine.core.models import CONTENT_STATUS_DRAFT
+from mezzanine.forms.models import Form
+from mezzanine.galleries.models import Gallery
+from mezzanine.pages.models import Link, Page, RichTextPage
+
+from communities.models import Community
+from documents.models import Document, DocumentCategory
+
+from .models import (SearchEntry, SearchTerm, get_searchable_models,
+                     get_terms, index_searchable_object)
+
+
+class SearchIndexTests(TestCase):
+    '''Test the full-text search index.'''
+    def setUp(self):
+        '''Create some Documents and a Community to search for.'''
+        self.category = DocumentCategory.objects.create(title='Bylaws')
+        self.titled = Document.objects.create(
+            title='Consensus Process', contents='How meetings are run.',
+            category=self.category)
+        self.mentioned = Document.objects.create(
+            title='Meeting Notes', contents='We reached consensus.',
+            category=self.category)
+        self.unrelated = Document.objects.create(
+            title='Work Schedule', contents='Who works when.',
+            category=self.category)
+        self.community = Community.objects.create(
+            title='Twin Oaks', full_description='An income sharing community.')
+
+    def search(self, query, **kwargs):
+        '''Return the indexed objects that match a query, best first.'''
+        return [entry.object_id for entry in
+                SearchEntry.objects.search(query, **kwargs)]
+
+    def test_terms_are_lowercase_words(self):
+        '''Terms should be lowercase words, without single characters.'''
+        self.assertEqual(get_terms(u'A Consensus-based, FEC group'),
+                         [u'consensus', u'based', u'fec', u'group'])
+
+    def test_searchable_models_are_leaf_displayables(self):
+        '''Every Displayable model without subclasses should be indexed.'''
+        models = get_searchable_models()
+
+        for model in (Document, Community, RichTextPage, Form, Gallery,
+                      Link):
+            self.assertIn(model, models)
+        self.assertNotIn(Page, models)
+
+    def test_only_searchable_models_are_connected(self):
+        '''Saving a model that isn't indexed should not run the handler.'''
+        self.assertIn(index_searchable_object,
+                      post_save._live_receivers(Document))
+        self.assertNotIn(index_searchable_object,
+                         post_save._live_receivers(User))
+        self.assertNotIn(index_searchable_object,
+                         post_save._live_receivers(Page))
+
+    def test_other_displayables_indexed(self):
+        '''Models without custom search fields should also be searchable.'''
+        form = Form.objects.create(
+            title='Contact Us', content='<p>Send the committee a note.</p>')
+
+        self.assertEqual(self.search('committee', model=Form), [form.id])
+        self.assertEqual(self.search('contact'), [form.id])
+
+    def test_saving_indexes_objects(self):
+        '''Saving a searchable object should create it's entry.'''
+        entry = SearchEntry.objects.get(object_id=self.community.id,
+                                        title='Twin Oaks')
+        self.assertEqual(entry.url, self.community.get_absolute_url())
+        self.assertEqual(entry.type_name, 'Community')
+        self.assertIn('income sharing', entry.text)
+
+    def test_title_matches_ranked_first(self):
+        '''Objects with the terms in their title should be ranked higher.'''
+        self.assertEqual(self.search('consensus'),
+                         [self.titled.id, self.mentioned.id])
+
+    def test_any_term_matches(self):
+        '''Objects that contain any of the terms should match.'''
+        self.assertEqual(sorted(self.search('consensus schedule')),
+                         sorted([self.titled.id, self.mentioned.id,
+                                 self.unrelated.id]))
+
+    def test_empty_query_has_no_results(self):
+        '''A query without any terms should not match anything.'''
+        self.assertEqual(self.search(' - '), [])
+
+    def test_model_filter(self):
+        '''Only entries of the given model should be returned.'''
+        self.assertEqual(self.search('sharing oaks', model=Document), [])
+        self.assertEqual(self.search('sharing oaks', model=Community),
+                         [self.community.id])
+
+    def test_updating_reindexes_object(self):
+        '''Changing an object should update it's entry & terms.'''
+        self.unrelated.title = 'Consensus Schedule'
+        self.unrelated.save()
+
+        self.assertIn(self.unrelated.id, self.search('consensus'))
+        self.assertFalse(SearchTerm.objects.filter(
+            entry__object_id=self.unrelated.id, term='work').exists())
+
+    def test_unpublished_objects_hidden(self):
+        '''Draft objects should only be found by staff.'''
+        self.titled.status = CONTENT_STATUS_DRAFT
+        self.titled.save()
+        staff = User.objects.create_user('staff', password='staff')
+        staff.is_staff = True
+
+        self.assertEqual(self.search('consensus'), [self.mentioned.id])
+        self.assertIn(self.titled.id,
+                      self.search('consensus', for_user=staff))
+
+    def test_deleting_removes_entry(self):
+        '''Deleting an object should remove it's entry.'''
+        self.titled.delete()
+
+        self.assertEqual(self.search('consensus'), [self.mentioned.id])
+        self.assertFalse(SearchTerm.objects.filter(
+            entry__object_id=self.titled.id, term='process').exists())
+
+    def test_rebuild_command(self):
+        '''The command should recreate missing entries.'''
+        SearchEntry.objects.all().delete()
+
+        call_command('rebuild_search_index', verbosity=0)
+
+        self.assertEqual(self.search('consensus'),
+                         [self.titled.id, self.mentioned.id])
+        self.assertEqual(self.search('oaks'), [self.community.id])
+
+
+class SearchViewTests(TestCase):
+    '''Test the search results View.'''
+    def setUp(self):
+        '''Create a Document and a Community with the same term.'''
+        self.category = DocumentCategory.objects.create(title='Bylaws')
+        self.document = Document.objects.create(
+            title='Egalitarian Bylaws', contents='', category=self.category)
+        self.community = Community.objects.create(title='Egalitarian Acres')
+
+    def test_results_shown(self):
+        '''Every matching entry should be shown.'''
+        response = self.client.get(reverse('search'), {'q': 'egalitarian'})
+
+        self.assertEqual(response.context['search_type'], 'Everything')
+        self.assertEqual(
+            sorted(entry.title for entry in response.context['results']),
+            ['Egalitarian Acres', 'Egalitarian Bylaws'])
+        self.assertContains(response, 'Egalitarian Acres')
+
+    def test_type_filter(self):
+        '''The type parameter should limit the results to a model.'''
+        response = self.client.get(
+            reverse('search'),
+            {'q': 'egalitarian', 'type': 'documents.Document'})
+
+        self.assertEqual(response.context['search_type'], 'Documents')
+        self.assertEqual(
+            [entry.title for entry in response.context['results']],
+            ['Egalitarian Bylaws'])
+
+    def test_invalid_type_ignored(self):
+        '''An unknown or unsearchable type should search everything.'''
+        for search_type in ('nothing', 'auth.User', 'a.b.c'):
+            response = self.client.get(
+                reverse('search'), {'q': 'egalitarian', 'type': search_type})
+
+            self.assertEqual(len(response.context['results'].object_list), 2)
@@ -0,0 +1,37 @@
+"""This module contains the view that shows search results."""
+from django.apps import apps
+from django.shortcuts import render
+from mezzanine.conf import settings
+from mezzanine.utils.views import paginate
+
+from .models import SearchEntry, is_searchable
+
+
+def search(request, template='search_results.html'):
+    """Show the search results for a query, using the full-text index.
+
+    This replaces Mezzanine's ``search`` view. The results are
+    :class:`~.models.SearchEntry` objects. The ``type`` GET parameter, in the
+    form ``app_label.ModelName``, limits the results to a single model.
+
+    """
+    query = request.GET.get('q', '')
+    try:
+        model = apps.get_model(*request.GET.get('type', '').split('.', 1))
+    except (ValueError, TypeError, LookupError):
+        model = None
+    if model is not None and is_searchable(model):
+        search_type = model._meta.verbose_name_plural.capitalize()
+    else:
+        model = None
+        search_type = 'Everything'
+    results = SearchEntry.objects.search(
+        query, for_user=request.user, model=model)
+    context = {
+        'query': query,
+        'results': paginate(results, request.GET.get('page', 1),
+                            settings.SEARCH_PER_PAGE,
+                            settings.MAX_PAGING_LINKS),
+        'search_type': search_type,
+    }
+    return render(request, template, context)